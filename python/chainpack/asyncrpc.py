@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+from rpcdriver import *
+
+
+class AsyncRpcConnection(RpcDriver, asyncio.BufferedProtocol):
+	"""
+	RpcDriver on asyncio transport, requires python3.7, one event loop serves any number of connections,
+	requests are matched with responses by RpcDriver pending call table, so many calls can be awaited at once
+	conn = await connect("127.0.0.1", 3755)
+	result = await conn.call("echo", RpcValue("hello"))
+	request_handler(conn, method, params) returns result or awaitable result of incoming request,
+	RpcError raised by it is sent back as error response,
+	notify callbacks are called as fn(conn, method, params)
+	"""
+	def __init__(s, request_handler = None):
+		RpcDriver.__init__(s)
+		s.request_handler = request_handler
+		s.m_transport = None
+		s.m_notifyCallbacks = []
+		s.m_closed = None
+		s.m_writeScheduled = False
+		s.m_transportPaused = False
+		s.m_writable = None
+
+	def connection_made(s, transport):
+		s.m_transport = transport
+		#// transport buffers at most about MAX_WRITE_BYTES, the rest waits in driver lanes,
+		#// so frames of more urgent lane are not queued behind bulk data already passed to transport
+		transport.set_write_buffer_limits(s.MAX_WRITE_BYTES, s.MAX_WRITE_BYTES // 4)
+		s.m_closed = asyncio.get_running_loop().create_future()
+
+	def connection_lost(s, exc):
+		s.m_transport = None
+		s.abortPendingCalls(ConnectionError("Connection lost"))
+		s.m_transportPaused = False
+		s.onWriteResumed()
+		if not s.m_closed.done():
+			s.m_closed.set_result(exc)
+
+	def get_buffer(s, sizehint: int) -> memoryview:
+		#// transport reads directly into frame parser buffer
+		return s.getReadBuffer()
+
+	def buffer_updated(s, nbytes: int):
+		try:
+			s.readBufferUpdated(nbytes)
+		except Exception as e:
+			logger.error("invalid data received, closing connection: %s", e)
+			s.close()
+
+	def writeQueue(s):
+		#// frames sent in the same event loop iteration are coalesced into one transport write
+		if s.m_transport is None:
+			raise ConnectionError("Connection is closed")
+		if not s.m_writeScheduled:
+			s.m_writeScheduled = True
+			asyncio.get_running_loop().call_soon(s._writeQueueNow)
+
+	def _writeQueueNow(s):
+		s.m_writeScheduled = False
+		if s.m_transport is not None:
+			RpcDriver.writeQueue(s)
+
+	def writeChunks(s, chunks: list) -> int:
+		if s.m_transport is None:
+			raise ConnectionError("Connection is closed")
+		#// frames are kept in driver lanes while transport buffer is full, so urgent ones can still overtake
+		if s.m_transportPaused:
+			return 0
+		#// queued frames are not reused, so transport can keep them without copying
+		s.m_transport.writelines(chunks)
+		return sum(len(c) for c in chunks)
+
+	def pause_writing(s):
+		s.m_transportPaused = True
+
+	def resume_writing(s):
+		s.m_transportPaused = False
+		if s.m_transport is not None and s.queuedBytes():
+			s.writeQueue()
+
+	def onWritePaused(s):
+		s.m_writable = asyncio.get_running_loop().create_future()
+
+	def onWriteResumed(s):
+		if s.m_writable is not None:
+			s.m_writable.set_result(None)
+			s.m_writable = None
+
+	async def drain(s):
+		"""waits while driver send queue is over WRITE_HIGH_WATERMARK, producers of bulk data should await it"""
+		while True:
+			if s.m_transport is None:
+				raise ConnectionError("Connection is closed")
+			if s.m_writable is None:
+				return
+			await s.m_writable
+
+	def isOpen(s) -> bool:
+		return s.m_transport is not None
+
+	def close(s):
+		if s.m_transport is not None:
+			s.m_transport.close()
+
+	async def closed(s):
+		"""waits until connection is closed"""
+		await asyncio.shield(s.m_closed)
+
+	def addNotifyCallback(s, fn):
+		s.m_notifyCallbacks.append(fn)
+
+	def removeNotifyCallback(s, fn):
+		s.m_notifyCallbacks.remove(fn)
+
+	async def call(s, method: str, params = None, timeout: int = None, lane: RpcDriver.Lane = None) -> RpcValue:
+		"""
+		returns result of remote method, raises RpcError or asyncio.TimeoutError, timeout is in msec,
+		calls in Lane.Control do not wait for drain()
+		"""
+		fut = asyncio.get_running_loop().create_future()
+		def finished(call):
+			if fut.done():
+				return
+			if call.error is not None:
+				fut.set_exception(call.error)
+			else:
+				fut.set_result(call.result())
+		if lane != RpcDriver.Lane.Control:
+			await s.drain()
+		call = s.callMethod(method, params, finished, timeout, lane)
+		try:
+			return await asyncio.wait_for(fut, call.deadline - time.monotonic())
+		finally:
+			s.cancelCall(call.requestId)
+
+	def notify(s, method: str, params = None, lane: RpcDriver.Lane = None):
+		ntf = RpcRequest()
+		ntf.setMethod(method)
+		if params is not None:
+			ntf.setParams(params)
+		s.sendMessage(ntf._value, lane)
+
+	def onMessageReceived(s, msg: RpcMessage):
+		if msg.isResponse():
+			log("response to unknown or timed out request:", msg.id())
+		elif msg.isRequest():
+			rq = RpcRequest(msg._value)
+			params = rq.params() if rq.hasKey(meta.RpcMessage.Key.Params) else RpcValue(None)
+			asyncio.ensure_future(s._handleRequest(rq.id(), rq.method(), params))
+		elif msg.isNotify():
+			rq = RpcRequest(msg._value)
+			params = rq.params() if rq.hasKey(meta.RpcMessage.Key.Params) else RpcValue(None)
+			for fn in list(s.m_notifyCallbacks):
+				fn(s, rq.method(), params)
+
+	async def _handleRequest(s, rq_id: int, method: str, params: RpcValue):
+		try:
+			if s.request_handler is None:
+				raise RpcError(RpcResponse.ErrorType.MethodNotFound, "Method not found: " + method)
+			result = s.request_handler(s, method, params)
+			if asyncio.iscoroutine(result) or isinstance(result, asyncio.Future):
+				result = await result
+		except RpcError as e:
+			if s.isOpen():
+				s.sendError(rq_id, e.code, e.message)
+			return
+		except Exception as e:
+			logger.exception("method %s failed", method)
+			if s.isOpen():
+				s.sendError(rq_id, RpcResponse.ErrorType.MethodInvocationException, str(e))
+			return
+		if s.isOpen():
+			s.sendResponse(rq_id, result)
+
+
+async def connect(host: str, port: int, request_handler = None, **kwargs) -> AsyncRpcConnection:
+	"""kwargs are passed to loop.create_connection()"""
+	transport, conn = await asyncio.get_running_loop().create_connection(lambda: AsyncRpcConnection(request_handler), host, port, **kwargs)
+	return conn
+
+
+async def serve(request_handler, host: str = "127.0.0.1", port: int = 0, on_connect = None, **kwargs):
+	"""
+	returns asyncio.Server, every accepted connection is AsyncRpcConnection with request_handler,
+	on_connect(conn) is called for new connections, kwargs are passed to loop.create_server()
+	"""
+	def factory():
+		conn = AsyncRpcConnection(request_handler)
+		if on_connect is not None:
+			on_connect(conn)
+		return conn
+	return await asyncio.get_running_loop().create_server(factory, host, port, **kwargs)
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+codec and RPC framing benchmarks over reproducible corpus,
+results can be saved as baseline and later runs compared with it
+python3 benchmark.py --save baseline.json
+python3 benchmark.py --compare baseline.json
+"""
+
+import json
+import time
+import random
+import tracemalloc
+import array
+
+from rpcdriver import *
+
+
+def corpus(seed: int = 1, scale: float = 1.0) -> dict:
+	"""returns name -> RpcValue, the same seed and scale give the same values"""
+	rnd = random.Random(seed)
+	def n(count):
+		return max(1, int(count * scale))
+	ret = {}
+	ret['tiny_ints'] = RpcValue([rnd.randrange(64) for i in range(n(20000))])
+	ret['big_varints'] = RpcValue([rnd.getrandbits(rnd.randrange(8, 120)) * rnd.choice((1, -1)) for i in range(n(20000))])
+	deep = RpcValue(rnd.random())
+	for i in range(min(n(200), 200)):
+		deep = RpcValue([deep, i]) if i % 2 else RpcValue({"level": deep, "n": i})
+	ret['deep_nesting'] = deep
+	ret['large_blob'] = RpcValue(rnd.getrandbits(8 * n(4 << 20)).to_bytes(n(4 << 20), 'little'))
+	ret['double_array'] = RpcValueArray(Type.Double, array.array('d', (rnd.uniform(-1e6, 1e6) for i in range(n(100000)))))
+	rq = RpcRequest()
+	rq.setId(123)
+	rq.setMethod("set")
+	rq.setMetaValue(meta.RpcMessage.Tag.ShvPath, "shv/eu/pl/lublin/odpojovace/15/status")
+	rq.setParams({"value": rnd.random(), "ts": DateTimeMsec(1546300800000 + rnd.randrange(1 << 30)), "status": "ok"})
+	ret['rpc_request'] = rq._value
+	resp = RpcResponse()
+	resp.setId(123)
+	resp.setResult([{"path": "node/%d/value" % i, "value": rnd.random(), "ts": DateTimeMsec(1546300800000 + i * 1000), "ok": True}
+		for i in range(n(2000))])
+	ret['rpc_response'] = resp._value
+	return ret
+
+
+def _time(fn, min_time: float, repeat: int) -> float:
+	"""best time of one fn() call, calls are looped, so every measurement takes at least min_time"""
+	number = 1
+	while True:
+		t = time.perf_counter()
+		for i in range(number):
+			fn()
+		dt = time.perf_counter() - t
+		if dt >= min_time / repeat:
+			break
+		number *= 10 if dt < min_time / repeat / 10 else 2
+	best = dt / number
+	for r in range(repeat - 1):
+		t = time.perf_counter()
+		for i in range(number):
+			fn()
+		best = min(best, (time.perf_counter() - t) / number)
+	return best
+
+
+def _memory(fn) -> (int, int):
+	"""returns (peak traced bytes, count of memory blocks allocated and kept alive by the result of fn())"""
+	tracemalloc.start()
+	try:
+		before = tracemalloc.take_snapshot()
+		#// python < 3.9 counts the snapshot into the peak
+		if hasattr(tracemalloc, 'reset_peak'):
+			tracemalloc.reset_peak()
+		result = fn()
+		peak = tracemalloc.get_traced_memory()[1]
+		after = tracemalloc.take_snapshot()
+	finally:
+		tracemalloc.stop()
+	blocks = sum(max(0, st.count_diff) for st in after.compare_to(before, 'filename'))
+	del result
+	return peak, blocks
+
+
+def _frames(value: RpcValue, count: int) -> bytes:
+	d = RpcDriver()
+	return bytes(d.packFrame(value)) * count
+
+
+def cases(data: dict) -> list:
+	"""returns list of (name, fn, bytes processed by one fn() call)"""
+	ret = []
+	for name, v in data.items():
+		packed = bytes(ChainPackProtocol(v))
+		w = ChainPackWriter()
+		def encode(v=v, w=w):
+			w.reset()
+			w.write(v)
+			return w
+		ret.append(("encode/" + name, encode, len(packed)))
+		ret.append(("decode/" + name, lambda packed=packed: read(packed)[0], len(packed)))
+		ret.append(("toPython/" + name, v.toPython, len(packed)))
+	driver = RpcDriver()
+	for name in ('rpc_request', 'rpc_response'):
+		v = data[name]
+		ret.append(("frame/" + name, lambda v=v: driver.packFrame(v), packed_size(v)))
+		frames = _frames(v, 10)
+		def parse(frames=frames):
+			p = RpcFrameParser(RpcDriver.PROTOCOL_VERSION)
+			return p.feed(frames)
+		ret.append(("unframe/" + name, parse, len(frames)))
+	return ret
+
+
+def run(seed: int = 1, scale: float = 1.0, min_time: float = 0.2, repeat: int = 5, filter: str = None, out = print) -> dict:
+	"""runs benchmarks, returns name -> {sec, mb_s, peak_kib, blocks}"""
+	logging.disable(logging.INFO)
+	try:
+		results = {}
+		for name, fn, size in cases(corpus(seed, scale)):
+			if filter is not None and filter not in name:
+				continue
+			sec = _time(fn, min_time, repeat)
+			peak, blocks = _memory(fn)
+			results[name] = {'sec': sec, 'mb_s': size / sec / 1e6, 'peak_kib': peak / 1024, 'blocks': blocks}
+			out("%-28s %12.1f us %10.1f MB/s %12.1f KiB peak %9d blocks" % (name, sec * 1e6, results[name]['mb_s'], results[name]['peak_kib'], blocks))
+		return results
+	finally:
+		logging.disable(logging.NOTSET)
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.1, out = print) -> list:
+	"""returns names of benchmarks slower or taking more memory than baseline by more than tolerance"""
+	regressions = []
+	for name, r in results.items():
+		b = baseline.get(name)
+		if b is None:
+			out("%-28s new" % name)
+			continue
+		time_ratio = r['sec'] / b['sec']
+		mem_ratio = (r['peak_kib'] + 1) / (b['peak_kib'] + 1)
+		flag = ""
+		if time_ratio > 1 + tolerance or mem_ratio > 1 + tolerance:
+			regressions.append(name)
+			flag = "REGRESSION"
+		out("%-28s time %6.2fx  peak memory %6.2fx  %s" % (name, time_ratio, mem_ratio, flag))
+	return regressions
+
+
+def save(results: dict, path: str):
+	with open(path, 'w') as f:
+		json.dump(results, f, indent=1, sort_keys=True)
+
+def load(path: str) -> dict:
+	with open(path) as f:
+		return json.load(f)
+
+
+if __name__ == "__main__":
+	import sys
+	import click
+
+	@click.command()
+	@click.option('--save', 'save_path', type=click.Path(dir_okay=False), default=None, help='save results as baseline')
+	@click.option('--compare', 'baseline_path', type=click.Path(exists=True, dir_okay=False), default=None, help='compare results with baseline')
+	@click.option('--tolerance', type=float, default=0.1, help='allowed slowdown ratio, 0.1 is 10%')
+	@click.option('--filter', type=str, default=None, help='run only benchmarks containing this string')
+	@click.option('--scale', type=float, default=1.0, help='corpus size multiplier')
+	@click.option('--seed', type=int, default=1)
+	def main(save_path, baseline_path, tolerance, filter, scale, seed):
+		results = run(seed, scale, filter=filter)
+		if save_path:
+			save(results, save_path)
+		if baseline_path:
+			regressions = compare(results, load(baseline_path), tolerance)
+			if regressions:
+				print("regressions:", ", ".join(regressions))
+				sys.exit(1)
+
+	main()
@@ -0,0 +1,148 @@
+import os
+import mmap
+import struct
+import array
+import sys
+
+from rpcvalue import *
+
+
+class ChainPackFile():
+	"""
+	memory mapped file of concatenated ChainPack values (records),
+	offsets of records are kept in sidecar index file, so record N is read by O(1) seek
+	without loading the file into memory,
+	index file is rebuilt when it does not exist or does not match the data file size and mtime,
+	incomplete record at the end of file being appended to is not included
+	with ChainPackFile("history.chpk") as f:
+		for rec in f:
+			...
+		last = f[-1]
+	"""
+	INDEX_SUFFIX = '.idx'
+	INDEX_MAGIC = b'CPIX'
+	INDEX_VERSION = 1
+	#// magic, version, data file size, data file mtime_ns, records count
+	INDEX_HEADER = struct.Struct('<4sIQQQ')
+
+	def __init__(s, path: str, index_path: str = None, typed_arrays: bool = False):
+		s.path = path
+		s.index_path = index_path if index_path is not None else path + s.INDEX_SUFFIX
+		s.typed_arrays = typed_arrays
+		s._file = open(path, 'rb')
+		st = os.fstat(s._file.fileno())
+		s._stamp = (st.st_size, st.st_mtime_ns)
+		#// empty file cannot be mapped
+		s._data = mmap.mmap(s._file.fileno(), 0, access=mmap.ACCESS_READ) if st.st_size else b''
+		s._offsets = s._loadIndex()
+		if s._offsets is None:
+			s._offsets = s.buildIndex()
+			try:
+				s.saveIndex()
+			except OSError:
+				#// read only directory, index is kept in memory only
+				pass
+		s._end = s._recordsEnd()
+
+	def __enter__(s):
+		return s
+
+	def __exit__(s, *args):
+		s.close()
+
+	def close(s):
+		"""values returned by get(n, lazy=True) must be released before close"""
+		if isinstance(s._data, mmap.mmap):
+			s._data.close()
+		s._data = b''
+		s._file.close()
+
+	def __len__(s):
+		return len(s._offsets)
+
+	def offset(s, n: int) -> int:
+		return s._offsets[n]
+
+	def span(s, n: int):
+		"""returns (start, end) of record n in data file"""
+		if n < 0:
+			n += len(s._offsets)
+		end = s._offsets[n + 1] if n + 1 < len(s._offsets) else s._end
+		return s._offsets[n], end
+
+	def raw(s, n: int) -> bytes:
+		"""returns packed record n"""
+		start, end = s.span(n)
+		return s._data[start:end]
+
+	def get(s, n: int, lazy: bool = False) -> RpcValue:
+		return read(s._data, s._offsets[n], lazy, s.typed_arrays)[0]
+
+	def __getitem__(s, n: int) -> RpcValue:
+		return s.get(n)
+
+	def __iter__(s):
+		for pos in s._offsets:
+			yield read(s._data, pos, False, s.typed_arrays)[0]
+
+	def buildIndex(s) -> array.array:
+		"""scans whole data file, values are skipped without decoding, incomplete last record is left out"""
+		offsets = array.array('Q')
+		size = len(s._data)
+		if not size:
+			return offsets
+		r = ChainPackReader(s._data)
+		try:
+			while r._pos < size:
+				start = r._pos
+				try:
+					r.skip()
+				except ChainpackDeserializationException:
+					break
+				offsets.append(start)
+		finally:
+			r.release()
+		return offsets
+
+	def _recordsEnd(s) -> int:
+		"""end of the last complete record"""
+		if not s._offsets:
+			return 0
+		r = ChainPackReader(s._data, s._offsets[-1])
+		try:
+			r.skip()
+			return r._pos
+		finally:
+			r.release()
+
+	def saveIndex(s):
+		offsets = s._offsets
+		if sys.byteorder != 'little':
+			offsets = array.array('Q', offsets)
+			offsets.byteswap()
+		tmp_path = s.index_path + '.tmp'
+		with open(tmp_path, 'wb') as f:
+			f.write(s.INDEX_HEADER.pack(s.INDEX_MAGIC, s.INDEX_VERSION, s._stamp[0], s._stamp[1], len(offsets)))
+			offsets.tofile(f)
+		os.replace(tmp_path, s.index_path)
+
+	def _loadIndex(s):
+		"""returns offsets from index file or None if it is missing or stale"""
+		try:
+			with open(s.index_path, 'rb') as f:
+				header = f.read(s.INDEX_HEADER.size)
+				if len(header) != s.INDEX_HEADER.size:
+					return None
+				magic, version, size, mtime_ns, count = s.INDEX_HEADER.unpack(header)
+				if magic != s.INDEX_MAGIC or version != s.INDEX_VERSION or (size, mtime_ns) != s._stamp:
+					return None
+				offsets = array.array('Q')
+				try:
+					offsets.fromfile(f, count)
+				except EOFError:
+					return None
+		except OSError:
+			return None
+		if sys.byteorder != 'little':
+			offsets.byteswap()
+		return offsets
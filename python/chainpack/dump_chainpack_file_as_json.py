@@ -6,16 +6,20 @@ try:
 except:
 	pass
 
-from value import *
+from chainpackfile import *
 
 import click
 
 @click.command()
-@click.argument('chainpack_file', type=click.File('rb'))
-def dump(chainpack_file):
+@click.argument('chainpack_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--record', type=int, default=None, help='dump only record with this index')
+def dump(chainpack_file, record):
 	import json
-	py = ChainPackProtocol(chainpack_file.read()).read().toPython()
-	print(json.JSONEncoder(indent=4, sort_keys=True).encode(py))
+	enc = json.JSONEncoder(indent=4, sort_keys=True)
+	with ChainPackFile(chainpack_file) as f:
+		records = f if record is None else [f[record]]
+		for rec in records:
+			print(enc.encode(rec.toPython()))
 
 if __name__ == '__main__':
 	dump()
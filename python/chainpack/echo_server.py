@@ -24,7 +24,12 @@ class MyTCPHandler(socketserver.BaseRequestHandler):
 		s.driver.writeBytes = s.writeBytes
 		s.driver.onMessageReceived = s.onMessageReceived
 		while True:
-			s.driver.bytesRead(s.request.recv(240000))
+			buf = s.driver.getReadBuffer()
+			n = s.request.recv_into(buf)
+			buf.release()
+			if n == 0:
+				break
+			s.driver.readBufferUpdated(n)
 
 	def writeBytes(s, b):
 		s.request.sendall(b)
@@ -0,0 +1,258 @@
+import os
+import mmap
+import struct
+import bisect
+
+from rpcvalue import *
+
+
+def epochMsec(t) -> int:
+	"""converts datetime, UtcAndTz, DateTimeMsec or int msecs since 1970-01-01 UTC to msecs since 1970-01-01 UTC"""
+	if isinstance(t, int):
+		return t
+	if isinstance(t, (datetime, UtcAndTz, DateTimeMsec)):
+		#// the same exact conversion as DateTime encoding
+		return dateTimeEpochMsec(t)[0]
+	raise ChainpackTypeException("Cannot convert to epoch msec: " + repr(t))
+
+
+class HistoryLogSegment():
+	"""
+	one append-only segment file of HistoryLog and its sparse time index,
+	index file is a sequence of (msec, offset) pairs, one per index_interval bytes of data,
+	so range query seeks to the nearest indexed record and scans at most index_interval bytes before the range
+	"""
+	DATA_SUFFIX = '.chpk'
+	INDEX_SUFFIX = '.tidx'
+	INDEX_ENTRY = struct.Struct('<qQ')
+
+	def __init__(s, path: str, index_interval: int):
+		s.path = path
+		s.index_path = path[:-len(s.DATA_SUFFIX)] + s.INDEX_SUFFIX
+		s.index_interval = index_interval
+		s._times = []
+		s._offsets = []
+		s._file = None
+		s.size = os.path.getsize(path) if os.path.exists(path) else 0
+		s.last_msec = None
+		s._loadIndex()
+		s._recover()
+
+	def firstMsec(s):
+		return s._times[0] if s._times else None
+
+	def _loadIndex(s):
+		try:
+			with open(s.index_path, 'rb') as f:
+				data = f.read()
+		except OSError:
+			data = b''
+		data = data[:len(data) - len(data) % s.INDEX_ENTRY.size]
+		for msec, offset in s.INDEX_ENTRY.iter_unpack(data):
+			if offset >= s.size:
+				break
+			s._times.append(msec)
+			s._offsets.append(offset)
+
+	def _recover(s):
+		"""
+		scans records behind the last index entry to find last timestamp,
+		missing index entries are added, incomplete record at the end of the file is cut off
+		"""
+		pos = s._offsets[-1] if s._offsets else 0
+		end = pos
+		new_entries = []
+		last_indexed = pos if s._offsets else None
+		if s.size > pos:
+			with open(s.path, 'rb') as f:
+				f.seek(pos)
+				data = f.read()
+			r = ChainPackReader(data)
+			try:
+				while r._pos < len(data):
+					start = r._pos
+					try:
+						msec = s._recordMsec(r)
+						r._pos = start
+						r.skip()
+					except ChainpackDeserializationException:
+						break
+					if last_indexed is None or pos + start - last_indexed >= s.index_interval:
+						last_indexed = pos + start
+						new_entries.append((msec, last_indexed))
+					s.last_msec = msec
+					end = pos + r._pos
+			finally:
+				r.release()
+		if end != s.size:
+			with open(s.path, 'r+b') as f:
+				f.truncate(end)
+			s.size = end
+			while s._offsets and s._offsets[-1] >= end:
+				s._times.pop()
+				s._offsets.pop()
+		with open(s.index_path, 'wb') as f:
+			for msec, offset in zip(s._times, s._offsets):
+				f.write(s.INDEX_ENTRY.pack(msec, offset))
+			for msec, offset in new_entries:
+				s._addIndexEntry(msec, offset, f)
+
+	@staticmethod
+	def _recordMsec(r: ChainPackReader) -> int:
+		"""reads timestamp of record without decoding the rest of it"""
+		t = r.get()
+		while t == TypeInfo.MetaIMap:
+			r.skipData(TypeInfo.IMap, False)
+			t = r.get()
+		if t != TypeInfo.List or r.get() != TypeInfo.DateTime:
+			raise ChainpackTypeException("History log record must be List starting with DateTime.")
+		return r.read_DateTimeEpochMsec()[0]
+
+	def _addIndexEntry(s, msec: int, offset: int, index_file):
+		s._times.append(msec)
+		s._offsets.append(offset)
+		index_file.write(s.INDEX_ENTRY.pack(msec, offset))
+
+	def append(s, msec: int, data):
+		if s._file is None:
+			s._file = open(s.path, 'ab')
+		if not s._offsets or s.size - s._offsets[-1] >= s.index_interval:
+			with open(s.index_path, 'ab') as f:
+				s._addIndexEntry(msec, s.size, f)
+		s._file.write(data)
+		s.size += len(data)
+		s.last_msec = msec
+
+	def flush(s):
+		if s._file is not None:
+			s._file.flush()
+
+	def close(s):
+		if s._file is not None:
+			s._file.close()
+			s._file = None
+
+	def query(s, since: int, until: int):
+		"""yields records with since <= timestamp < until"""
+		if not s.size:
+			return
+		s.flush()
+		#// last indexed record older than since, equal timestamps might be in previous index block
+		i = bisect.bisect_left(s._times, since) - 1
+		pos = s._offsets[i] if i >= 0 else 0
+		with open(s.path, 'rb') as f:
+			mm = mmap.mmap(f.fileno(), s.size, access=mmap.ACCESS_READ)
+		try:
+			r = ChainPackReader(mm, pos)
+			try:
+				while r._pos < s.size:
+					start = r._pos
+					msec = s._recordMsec(r)
+					if msec >= until:
+						return
+					r._pos = start
+					if msec >= since:
+						yield r.read()
+					else:
+						r.skip()
+			finally:
+				r.release()
+		finally:
+			mm.close()
+
+
+class HistoryLog():
+	"""
+	append-only store of time stamped records in directory of segment files,
+	record is ChainPack List [DateTime, *values], timestamps must not decrease,
+	new segment is started when the current one grows over segment_size
+	log = HistoryLog("/var/lib/history")
+	log.append(datetime.now(timezone.utc), "temperature", 21.5)
+	for rec in log.query(since, until):
+		ts, path, val = rec.value
+	"""
+	def __init__(s, directory: str, segment_size: int = 16 << 20, index_interval: int = 4096):
+		s.directory = directory
+		s.segment_size = segment_size
+		s.index_interval = index_interval
+		s._writer = ChainPackWriter()
+		os.makedirs(directory, exist_ok=True)
+		s._segments = []
+		for name in sorted(os.listdir(directory)):
+			if name.endswith(HistoryLogSegment.DATA_SUFFIX):
+				s._segments.append(HistoryLogSegment(os.path.join(directory, name), index_interval))
+		if not s._segments:
+			s._rollover()
+
+	def __enter__(s):
+		return s
+
+	def __exit__(s, *args):
+		s.close()
+
+	@staticmethod
+	def _segmentName(n: int) -> str:
+		return "%08d%s" % (n, HistoryLogSegment.DATA_SUFFIX)
+
+	def _rollover(s):
+		if s._segments:
+			s._segments[-1].close()
+			n = int(os.path.basename(s._segments[-1].path)[:-len(HistoryLogSegment.DATA_SUFFIX)]) + 1
+		else:
+			n = 0
+		path = os.path.join(s.directory, s._segmentName(n))
+		open(path, 'ab').close()
+		s._segments.append(HistoryLogSegment(path, s.index_interval))
+
+	def segmentCount(s) -> int:
+		return len(s._segments)
+
+	def lastMsec(s):
+		for seg in reversed(s._segments):
+			if seg.last_msec is not None:
+				return seg.last_msec
+		return None
+
+	def append(s, timestamp, *values):
+		"""timestamp is datetime, UtcAndTz, DateTimeMsec or msecs since 1970-01-01 UTC, values are RpcValues or native python values"""
+		if isinstance(timestamp, (datetime, UtcAndTz, DateTimeMsec)):
+			msec, tz = dateTimeEpochMsec(timestamp)
+		else:
+			msec, tz = epochMsec(timestamp), 0
+		last = s.lastMsec()
+		if last is not None and msec < last:
+			raise ChainpackException("History log timestamp %d is older than the last one %d." % (msec, last))
+		seg = s._segments[-1]
+		if seg.size >= s.segment_size:
+			s._rollover()
+			seg = s._segments[-1]
+		w = s._writer
+		w.reset()
+		w.writeContainerBegin(Type.List)
+		w.writeListElement(DateTimeMsec(msec, tz))
+		for v in values:
+			w.writeListElement(v)
+		w.writeContainerEnd()
+		seg.append(msec, w.data())
+
+	def flush(s):
+		s._segments[-1].flush()
+
+	def close(s):
+		for seg in s._segments:
+			seg.close()
+
+	def query(s, since = None, until = None):
+		"""yields records (RpcValue List) with since <= timestamp < until, None means unbounded"""
+		since = -(1 << 63) if since is None else epochMsec(since)
+		until = (1 << 63) if until is None else epochMsec(until)
+		for i, seg in enumerate(s._segments):
+			first = seg.firstMsec()
+			if first is None or first >= until:
+				break
+			if i + 1 < len(s._segments):
+				next_first = s._segments[i + 1].firstMsec()
+				#// whole segment is older than since
+				if next_first is not None and next_first < since:
+					continue
+			yield from seg.query(since, until)
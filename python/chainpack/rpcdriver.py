@@ -3,6 +3,11 @@
 
 from rpcvalue import *
 import logging
+import time
+import heapq
+import collections
+import contextlib
+import enum
 from rpcmessage import *
 
 
@@ -17,75 +22,501 @@ def info(*vargs):
 
 defaultRpcTimeout = 5000;
 
+
+_frameVersionHeaders = {}
+
+def frameVersionHeader(protocol_version: int) -> bytes:
+	"""packed protocol version following frame length, computed once per protocol version"""
+	ret = _frameVersionHeaders.get(protocol_version)
+	if ret is None:
+		w = ChainPackWriter()
+		w.writeData_UInt(protocol_version)
+		ret = _frameVersionHeaders[protocol_version] = bytes(w.data())
+	return ret
+
+
+class RpcFrameParser():
+	"""
+	parser of RpcDriver frames (UInt length, UInt protocol version, message) received into compacting buffer,
+	transport reads data directly into getBuffer(), like socket.recv_into() or asyncio.BufferedProtocol,
+	and calls bufferUpdated(), complete messages are decoded in place in one pass,
+	bytes of incomplete frame are moved to the buffer start only when the space is needed,
+	decoded values do not reference the buffer, so it is reused for next data
+	"""
+	MAX_HEADER_LEN = 2 * 20
+	BUFFER_SIZE = 1 << 16
+
+	def __init__(s, protocol_version: int, max_message_size: int = None):
+		s.m_protocolVersion = protocol_version
+		s.m_maxMessageSize = max_message_size
+		s.m_buffer = bytearray(s.BUFFER_SIZE)
+		#// not parsed data are m_buffer[m_begin:m_end]
+		s.m_begin = 0
+		s.m_end = 0
+		#// message start and frame end of frame with already parsed header, m_frameEnd is 0 while header is not complete
+		s.m_messageBegin = 0
+		s.m_frameEnd = 0
+
+	def getBuffer(s, min_size: int = 1) -> memoryview:
+		"""
+		returns free space at the buffer end, buffer of large frame grows as its data arrive,
+		free space is as large as already received part of the frame, but not larger than rest of the frame,
+		so frame length announced by peer alone cannot make huge allocation
+		"""
+		if s.m_frameEnd > s.m_end:
+			min_size = max(min_size, min(s.m_frameEnd - s.m_end, s.m_end - s.m_begin))
+		if len(s.m_buffer) - s.m_end < min_size:
+			s.makeSpace(min_size)
+		return memoryview(s.m_buffer)[s.m_end:]
+
+	def makeSpace(s, min_size: int):
+		used = s.m_end - s.m_begin
+		size = len(s.m_buffer)
+		while size - used < min_size:
+			size *= 2
+		if size == len(s.m_buffer):
+			#// slice of the same length does not resize buffer, so it can be still exported by transport
+			s.m_buffer[:used] = s.m_buffer[s.m_begin:s.m_end]
+		else:
+			buf = bytearray(size)
+			buf[:used] = s.m_buffer[s.m_begin:s.m_end]
+			s.m_buffer = buf
+		if s.m_frameEnd:
+			s.m_messageBegin -= s.m_begin
+			s.m_frameEnd -= s.m_begin
+		s.m_begin = 0
+		s.m_end = used
+
+	def bufferUpdated(s, n: int) -> list:
+		"""n bytes were written to getBuffer(), returns list of messages completed by them"""
+		s.m_end += n
+		ret = []
+		while s.m_frameEnd or s.readHeader():
+			if s.m_frameEnd > s.m_end:
+				break
+			r = ChainPackReader(memoryview(s.m_buffer)[:s.m_frameEnd], s.m_messageBegin)
+			try:
+				ret.append(r.read())
+				pos = r.pos()
+			finally:
+				r.release()
+			if pos != s.m_frameEnd:
+				raise ChainpackDeserializationException("Frame length does not match the message length")
+			s.m_begin = s.m_frameEnd
+			s.m_frameEnd = 0
+		if s.m_begin == s.m_end:
+			s.m_begin = s.m_end = 0
+			if len(s.m_buffer) > s.BUFFER_SIZE:
+				s.m_buffer = bytearray(s.BUFFER_SIZE)
+		return ret
+
+	def feed(s, data) -> list:
+		"""copies data to the buffer, returns list of messages completed by data"""
+		n = len(data)
+		if n == 0:
+			return []
+		buf = s.getBuffer(n)
+		buf[:n] = data
+		buf.release()
+		return s.bufferUpdated(n)
+
+	def readHeader(s) -> bool:
+		"""returns False if header is not complete yet"""
+		r = ChainPackReader(memoryview(s.m_buffer)[:s.m_end], s.m_begin)
+		try:
+			chunk_len = r.readData_UInt()
+			version_pos = r.pos()
+			protocol_version = r.readData_UInt()
+		except ChainpackDeserializationException:
+			if s.m_end - s.m_begin >= s.MAX_HEADER_LEN:
+				raise
+			return False
+		finally:
+			r.release()
+		if protocol_version != s.m_protocolVersion:
+			raise Exception("Unsupported protocol version");
+		message_begin = r.pos()
+		frame_end = version_pos + chunk_len
+		if frame_end <= message_begin:
+			raise ChainpackDeserializationException("Invalid frame length: %d" % chunk_len)
+		if s.m_maxMessageSize is not None and frame_end - message_begin > s.m_maxMessageSize:
+			raise ChainpackDeserializationException("Message size %d exceeds limit %d." % (frame_end - message_begin, s.m_maxMessageSize))
+		s.m_messageBegin = message_begin
+		s.m_frameEnd = frame_end
+		return True
+
+
+class RpcPendingCall():
+	"""request sent by RpcDriver.callMethod() waiting for its response"""
+	def __init__(s, request_id: int, method: str, deadline: float, callback = None):
+		s.requestId = request_id
+		s.method = method
+		s.deadline = deadline
+		s.callback = callback
+		s.response = None
+		s.error = None
+		s.done = False
+
+	def __repr__(s):
+		return "RpcPendingCall(%d, %s)" % (s.requestId, repr(s.method))
+
+	def result(s) -> RpcValue:
+		"""returns result of finished call or raises its error"""
+		if not s.done:
+			raise RpcError(RpcResponse.ErrorType.SyncMethodCallCancelled, "Call %d %s is not finished" % (s.requestId, s.method))
+		if s.error is not None:
+			raise s.error
+		return s.response.result() if s.response.hasKey(meta.RpcMessage.Key.Result) else RpcValue(None)
+
+	def finish(s, response: RpcResponse = None, error: Exception = None):
+		s.response = response
+		s.error = error if response is None else response.rpcError()
+		s.done = True
+		if s.callback is not None:
+			s.callback(s)
+
+
 class RpcDriver():
+	class Lane(enum.IntEnum):
+		"""send priority lanes, queued frames of lower lane are written first, frames are never interleaved"""
+		Control = 0
+		Normal = 1
+		Bulk = 2
+
 	PROTOCOL_VERSION = 1;
+	#// None means unlimited
+	MAX_MESSAGE_SIZE = None
+	#// producers are paused when more than WRITE_HIGH_WATERMARK bytes are queued
+	#// and resumed when the queue drains under WRITE_LOW_WATERMARK
+	WRITE_HIGH_WATERMARK = 1 << 20
+	WRITE_LOW_WATERMARK = 1 << 18
+	#// max buffers passed to one writeChunks() call, IOV_MAX is 1024 on linux
+	MAX_WRITE_CHUNKS = 1024
+	#// frames are gathered for one writeChunks() call until this size is reached, so bulk frames
+	#// do not fill transport buffer while there can be more urgent frames coming
+	MAX_WRITE_BYTES = 1 << 16
+	#// messages with larger frame are sent in Lane.Bulk by default
+	BULK_FRAME_SIZE = 1 << 16
+	#// requests and notifications of these methods are sent in Lane.Control by default
+	CONTROL_METHODS = ("ping", )
 
 	def __init__(s):
-		s.m_readData = bytearray()
-
-	def sendMessage(s, msg: RpcValue):
-		chunk = ChainPackProtocol(msg)
-		log("send message: packed data: ",  str(chunk[:50]) + "<... long data ...>" if len(chunk) > 50 else chunk)
-		protocol_version_data = ChainPackProtocol()
-		protocol_version_data.writeData_UInt(s.PROTOCOL_VERSION)
-		packet_len_data = ChainPackProtocol()
-		packet_len_data.writeData_UInt(len(protocol_version_data) + len(chunk))
-		s.writeBytes(packet_len_data)
-		s.writeBytes(protocol_version_data)
-		s.writeBytes(chunk)
+		s.m_frameParser = RpcFrameParser(s.PROTOCOL_VERSION, s.MAX_MESSAGE_SIZE)
+		s.m_writer = ChainPackWriter()
+		s.m_lastRequestId = 0
+		#// request id -> RpcPendingCall
+		s.m_pendingCalls = {}
+		#// heap of (deadline, request id), entries of finished calls are dropped when they reach the top
+		s.m_deadlines = []
+		#// frames waiting to be written per lane with their enqueue time
+		s.m_writeQueues = [collections.deque() for lane in s.Lane]
+		s.m_enqueueTimes = [collections.deque() for lane in s.Lane]
+		#// not yet written rest of the frame, which has to be finished before any other frame
+		s.m_partialFrame = None
+		#// [count, sum, max] of queueing latency in seconds per lane
+		s.m_queueLatency = [[0, 0.0, 0.0] for lane in s.Lane]
+		s.m_queuedBytes = 0
+		s.m_writeBatchDepth = 0
+		s.m_writePaused = False
+
+	def nextRequestId(s) -> int:
+		s.m_lastRequestId += 1
+		return s.m_lastRequestId
+
+	def callMethod(s, method: str, params = None, callback = None, timeout: int = None, lane: Lane = None) -> RpcPendingCall:
+		"""
+		sends request without waiting for response, any number of calls can be pending,
+		callback(pending_call) is called when response arrives or when call times out,
+		timeout is in msec, defaultRpcTimeout is used when it is None
+		"""
+		rq_id = s.nextRequestId()
+		deadline = time.monotonic() + (defaultRpcTimeout if timeout is None else timeout) / 1000
+		call = RpcPendingCall(rq_id, method, deadline, callback)
+		s.m_pendingCalls[rq_id] = call
+		heapq.heappush(s.m_deadlines, (deadline, rq_id))
+		try:
+			s.sendRequest(method, params, rq_id, lane)
+		except:
+			del s.m_pendingCalls[rq_id]
+			raise
+		return call
+
+	def pendingCallCount(s) -> int:
+		return len(s.m_pendingCalls)
+
+	def cancelCall(s, request_id: int):
+		"""forgets pending call, its response will be passed to onMessageReceived() if it arrives"""
+		s.m_pendingCalls.pop(request_id, None)
+
+	def nextTimeout(s, now: float = None) -> float:
+		"""returns seconds to the nearest pending call deadline or None if there are no pending calls"""
+		deadlines = s.m_deadlines
+		while deadlines and deadlines[0][1] not in s.m_pendingCalls:
+			heapq.heappop(deadlines)
+		if not deadlines:
+			return None
+		return max(0.0, deadlines[0][0] - (time.monotonic() if now is None else now))
+
+	def checkTimeouts(s, now: float = None):
+		"""finishes pending calls with passed deadline with SyncMethodCallTimeout error"""
+		if now is None:
+			now = time.monotonic()
+		deadlines = s.m_deadlines
+		while deadlines and deadlines[0][0] <= now:
+			deadline, rq_id = heapq.heappop(deadlines)
+			call = s.m_pendingCalls.pop(rq_id, None)
+			if call is not None:
+				call.finish(error=RpcError(RpcResponse.ErrorType.SyncMethodCallTimeout, "Call %d %s timed out" % (rq_id, call.method)))
+
+	def abortPendingCalls(s, error: Exception):
+		"""finishes all pending calls with error, used when connection is lost"""
+		calls = list(s.m_pendingCalls.values())
+		s.m_pendingCalls.clear()
+		s.m_deadlines.clear()
+		for call in calls:
+			call.finish(error=error)
+
+	def sendMessage(s, msg: RpcValue, lane: Lane = None):
+		"""lane is chosen by messageLane() when it is None"""
+		frame = s.packFrame(msg, bytearray())
+		if lane is None:
+			lane = s.messageLane(msg, len(frame))
+		s.enqueueFrame(frame, lane)
+
+	def sendMessages(s, messages, lane: Lane = None) -> int:
+		"""
+		frames all the messages into one buffer queued as a whole, so the batch is sent by single write,
+		lane is Lane.Bulk for batch larger than BULK_FRAME_SIZE and Lane.Normal otherwise when it is None,
+		returns count of sent messages
+		"""
+		w = ChainPackWriter()
+		count = 0
+		for msg in messages:
+			s.writeFrame(w, msg)
+			count += 1
+		if count:
+			log("send messages:", count, "messages in", len(w), "bytes")
+			if lane is None:
+				lane = s.Lane.Bulk if len(w) > s.BULK_FRAME_SIZE else s.Lane.Normal
+			s.enqueueFrame(w.data(), lane)
+		return count
+
+	def messageLane(s, msg: RpcValue, frame_size: int) -> Lane:
+		if frame_size > s.BULK_FRAME_SIZE:
+			return s.Lane.Bulk
+		method = msg._metaData.get(meta.RpcMessage.Tag.Method)
+		if method is not None and method.value in s.CONTROL_METHODS:
+			return s.Lane.Control
+		return s.Lane.Normal
+
+	def enqueueFrame(s, frame, lane: Lane = Lane.Normal):
+		"""queues packed frame, the queue is written at once unless writeBatch() is active"""
+		s.m_writeQueues[lane].append(frame)
+		s.m_enqueueTimes[lane].append(time.monotonic())
+		s.m_queuedBytes += len(frame)
+		if not s.m_writePaused and s.m_queuedBytes > s.WRITE_HIGH_WATERMARK:
+			s.m_writePaused = True
+			s.onWritePaused()
+		if s.m_writeBatchDepth == 0:
+			s.writeQueue()
+
+	@contextlib.contextmanager
+	def writeBatch(s):
+		"""messages sent in with block are coalesced and written together when it ends"""
+		s.m_writeBatchDepth += 1
+		try:
+			yield s
+		finally:
+			s.m_writeBatchDepth -= 1
+		if s.m_writeBatchDepth == 0:
+			s.writeQueue()
+
+	def writeQueue(s):
+		"""
+		writes as much of queued data as writeChunks() accepts, frames are taken lane by lane,
+		so frames queued later in more urgent lane overtake the waiting ones,
+		only partially written frame has to be finished first
+		"""
+		while s.m_queuedBytes:
+			chunks = s.gatherChunks()
+			n = s.writeChunks(chunks)
+			chunks = None
+			if not n:
+				break
+			s.m_queuedBytes -= n
+			s.consumeChunks(n)
+		if s.m_writePaused and s.m_queuedBytes <= s.WRITE_LOW_WATERMARK:
+			s.m_writePaused = False
+			s.onWriteResumed()
+
+	def gatherChunks(s) -> list:
+		chunks = []
+		size = 0
+		if s.m_partialFrame is not None:
+			chunks.append(s.m_partialFrame)
+			size = len(s.m_partialFrame)
+		for queue in s.m_writeQueues:
+			for frame in queue:
+				if size >= s.MAX_WRITE_BYTES or len(chunks) == s.MAX_WRITE_CHUNKS:
+					return chunks
+				chunks.append(frame)
+				size += len(frame)
+		return chunks
+
+	def consumeChunks(s, n: int):
+		"""drops n written bytes of chunks returned by gatherChunks()"""
+		if s.m_partialFrame is not None:
+			if n < len(s.m_partialFrame):
+				s.m_partialFrame = s.m_partialFrame[n:]
+				return
+			n -= len(s.m_partialFrame)
+			s.m_partialFrame = None
+		now = time.monotonic()
+		for lane, queue in enumerate(s.m_writeQueues):
+			times = s.m_enqueueTimes[lane]
+			while queue and n:
+				frame = queue.popleft()
+				latency = s.m_queueLatency[lane]
+				dt = now - times.popleft()
+				latency[0] += 1
+				latency[1] += dt
+				if dt > latency[2]:
+					latency[2] = dt
+				if n < len(frame):
+					s.m_partialFrame = memoryview(frame)[n:]
+					return
+				n -= len(frame)
+			if not n:
+				return
+		if s.m_writePaused and s.m_queuedBytes <= s.WRITE_LOW_WATERMARK:
+			s.m_writePaused = False
+			s.onWriteResumed()
+
+	def writeChunks(s, chunks: list) -> int:
+		"""
+		writes list of buffers, returns number of bytes written, 0 when nothing can be written now,
+		socket transport should override it with socket.sendmsg(), default implementation
+		joins the buffers into one writeBytes() call
+		"""
+		data = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+		s.writeBytes(data)
+		return len(data)
+
+	def queuedBytes(s) -> int:
+		return s.m_queuedBytes
+
+	def queuedFrames(s, lane: Lane) -> int:
+		"""count of frames waiting in lane, partially written frame is not included"""
+		return len(s.m_writeQueues[lane])
+
+	def queueLatency(s, lane: Lane) -> (int, float, float):
+		"""returns (frame count, average, max) of seconds the lane frames waited before they started to be written"""
+		count, total, worst = s.m_queueLatency[lane]
+		return count, total / count if count else 0.0, worst
+
+	def resetQueueLatency(s):
+		s.m_queueLatency = [[0, 0.0, 0.0] for lane in s.Lane]
+
+	def isWritePaused(s) -> bool:
+		"""True when producers should stop sending until onWriteResumed()"""
+		return s.m_writePaused
+
+	def onWritePaused(s):
+		pass
+
+	def onWriteResumed(s):
+		pass
+
+	def packFrame(s, msg: RpcValue, out: bytearray = None) -> bytearray:
+		"""
+		returns frame (UInt length, UInt protocol version, message), message size is computed
+		by packed_size() first, so the length header is written in front of the message without copying it,
+		frame is packed into out if it is given, otherwise returned buffer is reused by next packFrame() call
+		"""
+		if out is None:
+			w = s.m_writer
+			w.reset()
+		else:
+			w = ChainPackWriter(out)
+		header_len = s.writeFrame(w, msg)
+		frame = w.data()
+		if logger.isEnabledFor(logging.DEBUG):
+			log("send message: packed data: ",  str(frame[header_len:header_len + 50]) + "<... long data ...>" if len(frame) - header_len > 50 else frame[header_len:])
+		return frame
+
+	def writeFrame(s, w: ChainPackWriter, msg: RpcValue) -> int:
+		"""appends frame of msg to w, returns position of the message in w"""
+		size = packed_size(msg)
+		if s.MAX_MESSAGE_SIZE is not None and size > s.MAX_MESSAGE_SIZE:
+			raise ChainpackException("Message size %d exceeds limit %d." % (size, s.MAX_MESSAGE_SIZE))
+		header = frameVersionHeader(s.PROTOCOL_VERSION)
+		w.writeData_UInt(len(header) + size)
+		w._out += header
+		msg_pos = len(w)
+		w.write(msg)
+		assert len(w) == msg_pos + size
+		return msg_pos
 
 	def bytesRead(s, b: bytes):
 		if len(b) == 0:
 			return
-		log(len(b), "bytes of data read")
-		s.m_readData += b
-		while True:
-			l: int = s.processReadData(s.m_readData);
-			log(l, "bytes of" , len(s.m_readData), "processed")
-			if(l > 0):
-				s.m_readData = s.m_readData[l:]
-			else:
-				break;
-
-	def tryRead_UIntData(s, input):
-		try:
-			return True, input.readData_UInt();
-		except ChainpackDeserializationException:
-			return False, -1
-
-	def processReadData(s, read_data: bytes) -> int:
-		log("processReadData data len:", len(read_data), ":", read_data)
-		initial_len = len(read_data)
-		input = ChainPackProtocol(read_data)
-		ok, chunk_len = s.tryRead_UIntData(input);
-		if not ok:
-			return 0;
-		received_len = len(input)
-		ok, protocol_version = s.tryRead_UIntData(input);
-		if not ok:
-			return 0;
-		if protocol_version != s.PROTOCOL_VERSION:
-			raise Exception("Unsupported protocol version");
-		if(chunk_len > received_len):
-			return 0;
-		msg: RpcValue = input.read()
-		s.onMessageReceived(RpcResponse(msg));
-		return initial_len - len(input);
+		if logger.isEnabledFor(logging.DEBUG):
+			log(len(b), "bytes of data read")
+		s.messagesRead(s.m_frameParser.feed(b))
+
+	def getReadBuffer(s, min_size: int = 1) -> memoryview:
+		"""
+		returns buffer to read data into without copying, like socket.recv_into(),
+		readBufferUpdated() has to be called then, view should be released before next call
+		"""
+		return s.m_frameParser.getBuffer(min_size)
 
-	def sendResponse(s, request_id: int, result: RpcValue):
+	def readBufferUpdated(s, n: int):
+		"""n bytes were read into getReadBuffer()"""
+		if n == 0:
+			return
+		if logger.isEnabledFor(logging.DEBUG):
+			log(n, "bytes of data read")
+		s.messagesRead(s.m_frameParser.bufferUpdated(n))
+
+	def messagesRead(s, messages: list):
+		for msg in messages:
+			msg = RpcResponse(msg)
+			if s.m_pendingCalls and msg.isResponse():
+				call = s.m_pendingCalls.pop(msg.id(), None)
+				if call is not None:
+					call.finish(msg)
+					continue
+			s.onMessageReceived(msg);
+		if s.m_deadlines:
+			s.checkTimeouts()
+
+	def sendResponse(s, request_id: int, result: RpcValue, lane: Lane = None):
 		resp = RpcResponse()
 		resp.setId(request_id);
 		resp.setResult(result);
 		info("sending response:", resp)
-		s.sendMessage(resp._value);
+		s.sendMessage(resp._value, lane);
+
+	def sendError(s, request_id: int, code: int, message: str, lane: Lane = None):
+		resp = RpcResponse()
+		resp.setId(request_id);
+		resp.setError(RpcResponse.Error.createError(code, message));
+		info("sending error response:", resp._value)
+		s.sendMessage(resp._value, lane);
 
-	def sendRequest(s, method: str, params: RpcValue):
+	def sendRequest(s, method: str, params: RpcValue = None, request_id: int = None, lane: Lane = None) -> int:
+		"""returns request id, new one is allocated when request_id is None"""
+		if request_id is None:
+			request_id = s.nextRequestId()
 		msg = RpcRequest()
-		msg.setId(1)
+		msg.setId(request_id)
 		msg.setMethod(method);
-		msg.setParams(params);
+		if params is not None:
+			msg.setParams(params);
 		info("sending request:", msg._value)
-		s.sendMessage(msg._value);
+		s.sendMessage(msg._value, lane);
+		return request_id
 	"""
 	def sendNotify(s, method: str, result: RpcValue):
 		ntf = RpcNotify()
@@ -94,48 +525,3 @@ class RpcDriver():
 		info("sending notify:", method)
 		s.sendMessage(ntf._value);
 	"""
-
-	"""
-	def enqueueDataToSend(chunk_to_enqueue: Chunk):
-		if(len(chunk_to_enqueue))
-			m_chunkQueue.append(chunk_to_enqueue[:]));
-		if(!isOpen()):
-			logger.critical("write data error, socket is not open!")
-			return
-		flushNoBlock();
-		writeQueue();
-
-	def writeQueue(s):
-		if(!len(s.m_chunkQueue)):
-			return;
-		log("writePendingData(), HI prio queue len: %s" % len(s.m_chunkQueue))
-		#//static int hi_cnt = 0;
-		chunk: Chunk = s.m_chunkQueue[0];
-
-		if s.m_headChunkBytesWrittenSoFar == 0:
-			protocol_version_data = ChainPackProtocol(RpcValue(PROTOCOL_VERSION, Type.UInt))
-			packet_len_data = ChainPackProtocol(RpcValue(len(protocol_version_data) + len(chunk), Type.UInt))
-			written_len = s.writeBytes(packet_len_data, len(packet_len_data));
-			if(written_len < 0):
-				raise Exception("Write socket error!");
-			if written_len < len(packet_len_data):
-				raise Exception("Design error! Chunk length shall be always written at once to the socket");
-			
-			l = s.writeBytes(protocol_version_data, len(protocol_version_data));
-			if(l < 0):
-				raise Exception("Write socket error!");
-			if(l != 1)
-				raise Exception("Design error! Protocol version shall be always written at once to the socket");
-
-		l = s.writeBytes(chunk[s.m_headChunkBytesWrittenSoFar:])
-		if(l < 0):
-			raise Exception("Write socket error!");
-		if(l == 0):
-			raise Exception("Design error! At least 1 byte of data shall be always written to the socket");
-
-		log("writeQueue - data len:", len(chunk),  "start index:", s.m_headChunkBytesWrittenSoFar, "bytes written:", l, "remaining:", (len(chunk) - s.m_headChunkBytesWrittenSoFar - l);
-		s.m_headChunkBytesWrittenSoFar += l;
-		if(s.m_headChunkBytesWrittenSoFar == len(chunk)):
-			s.m_headChunkBytesWrittenSoFar = 0;
-			s.m_chunkQueue.pop_front();
-	"""
@@ -3,6 +3,14 @@ import meta
 from rpcvalue import *
 
 
+class RpcError(Exception):
+	"""error returned in RpcResponse"""
+	def __init__(s, code: int, message: str = ""):
+		super().__init__("RPC error %d: %s" % (code, message))
+		s.code = code
+		s.message = message
+
+
 class RpcMessage():
 	def __init__(s, val: RpcValue = None) -> None:
 		if val == None:
@@ -13,7 +21,7 @@ class RpcMessage():
 
 	def hasKey(s, key: meta.RpcMessage.Key) -> bool:
 		if s._value.type == Type.IMap:
-			return key in s._value.toPython()
+			return key in s._value.value
 		else:
 			return False
 
@@ -58,7 +66,7 @@ class RpcMessage():
 
 	def rpcType(s) -> meta.RpcMessage.RpcCallType:
 		rpc_id: int = s.id();
-		has_method: bool = meta.RpcMessage.Key.Method in s._value._metaData;
+		has_method: bool = meta.RpcMessage.Tag.Method in s._value._metaData;
 		if(has_method):
 			if rpc_id > 0:
 				return meta.RpcMessage.RpcCallType.Request
@@ -83,10 +91,10 @@ class RpcMessage():
 		s.setMetaValue(meta.RpcMessage.Tag.RpcCallType, rpc_type);
 
 	def method(s) -> str:
-		return s._value._metaData[meta.RpcMessage.Tag.Method].toString;
+		return s._value._metaData[meta.RpcMessage.Tag.Method].toString();
 
 	def setMethod(s, met: str) -> None:
-		s._value._metaData[meta.RpcMessage.Tag.Method] = RpcValue(met);
+		s.setMetaValue(meta.RpcMessage.Tag.Method, met);
 
 	def params(s) -> RpcValue:
 		return s.value(meta.RpcMessage.Key.Params);
@@ -167,6 +175,13 @@ class RpcResponse(RpcMessage):
 	def error(s) -> Error:
 		return RpcResponse.Error(s.value(meta.RpcMessage.Key.Error).toPython());
 
+	def rpcError(s) -> RpcError:
+		"""returns RpcError of error response or None"""
+		if not s.hasKey(meta.RpcMessage.Key.Error):
+			return None
+		err = s.value(meta.RpcMessage.Key.Error).toPython()
+		return RpcError(err.get(RpcResponse.Error.Key.Code, RpcResponse.ErrorType.Unknown), err.get(RpcResponse.Error.Key.Message, ""))
+
 	def setError(s, err):
 		s.setValue(meta.RpcMessage.Key.Error, RpcValue(err, Type.IMap));
 		#s.checkRpcTypeMetaValue();
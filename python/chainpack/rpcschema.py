@@ -0,0 +1,225 @@
+import struct
+
+from rpcvalue import *
+
+
+class _SchemaMismatch(Exception):
+	pass
+
+
+class Schema():
+	"""
+	fixed shape of Map or IMap compiled into specialized encoder and decoder functions,
+	fields is sequence of (key, type) or (key, type, attribute_name), where type is one of
+	Type.Int, Type.UInt, Type.Double, Type.Bool, Type.String, Type.Blob, Type.DateTime,
+	nested Schema or None for any value,
+	target is a class constructed with fields as keyword arguments, like dataclass or namedtuple,
+	None means dict (imap for IMap),
+	values not matching the schema are encoded and decoded by generic writePython() / readPython()
+	NotifyParams = collections.namedtuple('NotifyParams', 'value ts status')
+	schema = Schema([("value", Type.Double), ("ts", Type.DateTime), ("status", Type.String)], target=NotifyParams)
+	data = schema.dumps(NotifyParams(1.5, datetime.now(timezone.utc), "ok"))
+	"""
+	FIELD_TYPES = (Type.Int, Type.UInt, Type.Double, Type.Bool, Type.String, Type.Blob, Type.DateTime)
+
+	def __init__(s, fields, container_type: Type = Type.Map, target = None):
+		if container_type not in (Type.Map, Type.IMap):
+			raise ChainpackTypeException("Schema container must be Map or IMap, got: " + str(container_type))
+		s.container_type = container_type
+		s.target = target
+		s.fields = []
+		for f in fields:
+			key, t = f[0], f[1]
+			name = f[2] if len(f) > 2 else key
+			if container_type == Type.Map and not isinstance(key, str):
+				raise ChainpackTypeException("Map schema key must be str, got: " + repr(key))
+			if container_type == Type.IMap and (not isinstance(key, int) or key < 0):
+				raise ChainpackTypeException("IMap schema key must be non negative int, got: " + repr(key))
+			if target is not None and not (isinstance(name, str) and name.isidentifier()):
+				raise ChainpackTypeException("Schema field %s needs attribute name" % repr(key))
+			if t is not None and not isinstance(t, Schema) and t not in s.FIELD_TYPES:
+				raise ChainpackTypeException("Unsupported schema field type: " + str(t))
+			s.fields.append((key, t, name))
+		s.source = None
+		s._compile()
+
+	def __repr__(s):
+		return "Schema(%s, %s)" % (s.container_type._name_, [(k, t) for k, t, n in s.fields])
+
+	def _packedKey(s, key) -> bytes:
+		w = ChainPackWriter()
+		if s.container_type == Type.Map:
+			w.writeData_String(key)
+		else:
+			w.writeData_UInt(key)
+		return bytes(w.data())
+
+	def _compile(s):
+		ns = {
+			'Mismatch': _SchemaMismatch, 'target': s.target, 'schema': s, 'uint': uint, 'imap': imap,
+			'pack_double': struct.Struct(ChainPackWriter.DOUBLE_FMT).pack,
+			'DATETIME_TYPES': (datetime, UtcAndTz, DateTimeMsec), 'BLOB_TYPES': (bytes, bytearray),
+		}
+		enc = ["def write(w, obj):"]
+		dec = ["def read(r):", "\tstart = r._pos", "\tdata = r._data", "\ttry:",
+			"\t\tif r.get() != %d: raise Mismatch" % typeToTypeInfo(s.container_type)]
+		if s.target is None:
+			enc.append("\tif type(obj) is not %s or len(obj) != %d: return schema._writeGeneric(w, obj)"
+				% ('dict' if s.container_type == Type.Map else 'imap', len(s.fields)))
+			enc.append("\ttry:")
+			for i, (key, t, name) in enumerate(s.fields):
+				enc.append("\t\tv%d = obj[%r]" % (i, key))
+			enc.append("\texcept KeyError:")
+			enc.append("\t\treturn schema._writeGeneric(w, obj)")
+		else:
+			enc.append("\tif type(obj) is not target: return schema._writeGeneric(w, obj)")
+			for i, (key, t, name) in enumerate(s.fields):
+				enc.append("\tv%d = obj.%s" % (i, name))
+		checks = []
+		body = ["\tout = w._out", "\tstart = len(out)", "\tout.append(%d)" % typeToTypeInfo(s.container_type)]
+		for i, (key, t, name) in enumerate(s.fields):
+			v = "v%d" % i
+			k = "K%d" % i
+			fd = []
+			packed_key = s._packedKey(key)
+			#// type byte of fixed type fields is part of the key constant
+			if t == Type.Double:
+				packed_key += bytes([TypeInfo.Double])
+				checks.append("type(%s) is float" % v)
+				body.append("\tout += %s" % k)
+				body.append("\tout += pack_double(%s)" % v)
+				fd.append("\t\t%s = r.read_fmt(%r)" % (v, ChainPackReader.DOUBLE_FMT))
+			elif t in (Type.String, Type.Blob):
+				packed_key += bytes([typeToTypeInfo(t)])
+				if t == Type.String:
+					checks.append("type(%s) is str" % v)
+					body.append("\tb = %s.encode('utf-8')" % v)
+				else:
+					checks.append("type(%s) in BLOB_TYPES" % v)
+					body.append("\tb = %s" % v)
+				body.append("\tout += %s" % k)
+				body.append("\tw.writeData_UInt(len(b))")
+				body.append("\tout += b")
+				if t == Type.String:
+					fd.append("\t\t%s = r.readData_String()" % v)
+				else:
+					fd.append("\t\t%s = bytes(r.read_raw(r.readData_UInt()))" % v)
+			elif t == Type.DateTime:
+				packed_key += bytes([TypeInfo.DateTime])
+				checks.append("isinstance(%s, DATETIME_TYPES)" % v)
+				body.append("\tout += %s" % k)
+				body.append("\tw.write_DateTime(%s)" % v)
+				fd.append("\t\t%s = r.readData_DateTimeMsec() if r.datetime_msec else r.read_DateTime()" % v)
+			elif t == Type.Int:
+				checks.append("type(%s) is int" % v)
+				body.append("\tout += %s" % k)
+				body.append("\tif 0 <= %s < 64: out.append(64 + %s)" % (v, v))
+				body.append("\telse:")
+				body.append("\t\tout.append(%d)" % TypeInfo.Int)
+				body.append("\t\tw.writeData_Int(%s)" % v)
+				fd.append("\t\tt = r.get()")
+				fd.append("\t\tif 64 <= t < 128: %s = t - 64" % v)
+				fd.append("\t\telif t == %d: %s = r.readData_Int()" % (TypeInfo.Int, v))
+				fd.append("\t\telse: raise Mismatch")
+			elif t == Type.UInt:
+				checks.append("(type(%s) is int or type(%s) is uint) and %s >= 0" % (v, v, v))
+				body.append("\tout += %s" % k)
+				body.append("\tif %s < 64: out.append(%s)" % (v, v))
+				body.append("\telse:")
+				body.append("\t\tout.append(%d)" % TypeInfo.UInt)
+				body.append("\t\tw.writeData_UInt(%s)" % v)
+				fd.append("\t\tt = r.get()")
+				fd.append("\t\tif t < 64: %s = uint(t)" % v)
+				fd.append("\t\telif t == %d: %s = uint(r.readData_UInt())" % (TypeInfo.UInt, v))
+				fd.append("\t\telse: raise Mismatch")
+			elif t == Type.Bool:
+				checks.append("type(%s) is bool" % v)
+				body.append("\tout += %s" % k)
+				body.append("\tout.append(%d if %s else %d)" % (TypeInfo.TRUE, v, TypeInfo.FALSE))
+				fd.append("\t\tt = r.get()")
+				fd.append("\t\tif t == %d: %s = True" % (TypeInfo.TRUE, v))
+				fd.append("\t\telif t == %d: %s = False" % (TypeInfo.FALSE, v))
+				fd.append("\t\telse: raise Mismatch")
+			elif isinstance(t, Schema):
+				ns["S%d" % i] = t
+				body.append("\tout += %s" % k)
+				body.append("\tS%d.write(w, %s)" % (i, v))
+				fd.append("\t\t%s = S%d.read(r)" % (v, i))
+			else:
+				body.append("\tout += %s" % k)
+				body.append("\tw.writePython(%s)" % v)
+				fd.append("\t\t%s = r.readPython()" % v)
+			ns[k] = packed_key
+			dec.append("\t\tif data[r._pos:r._pos + %d] != %s: raise Mismatch" % (len(packed_key), k))
+			dec.append("\t\tr._pos += %d" % len(packed_key))
+			dec += fd
+		if checks:
+			enc.append("\tif not (%s): return schema._writeGeneric(w, obj)" % " and ".join(checks))
+		enc += body
+		enc.append("\tout.append(%d)" % TypeInfo.TERMINATION)
+		enc.append("\treturn len(out) - start")
+		dec.append("\t\tif r.get() != %d: raise Mismatch" % TypeInfo.TERMINATION)
+		dec.append("\texcept (Mismatch, ChainpackDeserializationException):")
+		dec.append("\t\tr._pos = start")
+		dec.append("\t\treturn schema._readGeneric(r)")
+		if s.target is None:
+			items = "{%s}" % ", ".join("%r: v%d" % (key, i) for i, (key, t, name) in enumerate(s.fields))
+			dec.append("\treturn " + (items if s.container_type == Type.Map else "imap(%s)" % items))
+		else:
+			dec.append("\treturn target(%s)" % ", ".join("%s=v%d" % (name, i) for i, (key, t, name) in enumerate(s.fields)))
+		s.source = "\n".join(enc) + "\n\n" + "\n".join(dec) + "\n"
+		ns['ChainpackDeserializationException'] = ChainpackDeserializationException
+		exec(compile(s.source, "<Schema %s>" % ", ".join(repr(k) for k, t, n in s.fields), "exec"), ns)
+		s.write = ns['write']
+		s.read = ns['read']
+
+	def toPython(s, obj):
+		"""converts target instance to dict or imap written by generic writePython()"""
+		if s.target is None or not isinstance(obj, s.target):
+			return obj
+		ret = {} if s.container_type == Type.Map else imap()
+		for key, t, name in s.fields:
+			v = getattr(obj, name)
+			if isinstance(t, Schema):
+				v = t.toPython(v)
+			elif t == Type.UInt and type(v) is int and v >= 0:
+				v = uint(v)
+			ret[key] = v
+		return ret
+
+	def fromPython(s, v):
+		"""converts generic readPython() value to target, raises ChainpackTypeException if it does not match schema"""
+		if not isinstance(v, dict) or len(v) != len(s.fields) or any(key not in v for key, t, name in s.fields):
+			raise ChainpackTypeException("Value does not match %s: %s" % (s, repr(v)))
+		if s.target is None:
+			return v
+		kwargs = {}
+		for key, t, name in s.fields:
+			kwargs[name] = t.fromPython(v[key]) if isinstance(t, Schema) else v[key]
+		return s.target(**kwargs)
+
+	def _writeGeneric(s, w: ChainPackWriter, obj) -> int:
+		return w.writePython(s.toPython(obj))
+
+	def _readGeneric(s, r: ChainPackReader):
+		return s.fromPython(r.readPython())
+
+	def dumps(s, obj) -> bytes:
+		w = ChainPackWriter()
+		s.write(w, obj)
+		return bytes(w.data())
+
+	def loads(s, buf, pos: int = 0, datetime_msec: bool = False):
+		r = ChainPackReader(buf, pos, datetime_msec=datetime_msec)
+		try:
+			return s.read(r)
+		finally:
+			r.release()
+
+
+def registerSchema(schema: Schema) -> Schema:
+	"""instances of schema target are then written by schema encoder also when nested in other values"""
+	if schema.target is None:
+		raise ChainpackTypeException("Only schema with target class can be registered")
+	PYTHON_TYPE_ENCODERS[schema.target] = schema.write
+	return schema
@@ -1,15 +1,28 @@
 import struct
 import enum
+import array
+import copy
+import collections
+import decimal
+import sys
 import logging_config
 import logging
 from math import floor, trunc
 from datetime import datetime, timezone, timedelta
 from dateutil.tz import tzoffset
 import meta
+try:
+	import numpy
+except ImportError:
+	numpy = None
 
 class uint(int):
 	pass
 
+class imap(dict):
+	"""marks dict with UInt keys to be packed as IMap by dumps()"""
+	pass
+
 class UtcAndTz:
 	def __init__(s, dt: datetime, tz = 0):
 		assert dt.utcoffset() == timedelta(0),    dt.utcoffset()
@@ -18,8 +31,129 @@ class UtcAndTz:
 	def __repr__(s):
 		return "UtcAndTz(" + s.dt.__repr__() + "," + s.tz.__repr__() + ")"
 	def __eq__(s, x):
+		if not isinstance(x, UtcAndTz):
+			return NotImplemented
 		return x.dt == s.dt and x.tz == s.tz
 
+UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def datetimeToEpochMsec(dt: datetime) -> int:
+	"""exact integer conversion, naive datetime is local time as in datetime.timestamp()"""
+	if dt.tzinfo is None:
+		dt = dt.astimezone(timezone.utc)
+	d = dt - UNIX_EPOCH
+	return (d.days * 86400 + d.seconds) * 1000 + round(d.microseconds / 1000)
+
+def dateTimeEpochMsec(v) -> tuple:
+	"""returns (msecs since 1970-01-01 UTC, tz) of DateTimeMsec, datetime or UtcAndTz"""
+	if isinstance(v, DateTimeMsec):
+		return v.msec, v.tz
+	if isinstance(v, datetime):
+		return datetimeToEpochMsec(v), 0
+	if isinstance(v, UtcAndTz):
+		return datetimeToEpochMsec(v.dt), v.tz
+	assert False, v
+
+def epochMsecToDateTime(msec: int) -> datetime:
+	return UNIX_EPOCH + timedelta(milliseconds=msec)
+
+def epochMsecsToDateTimes(msecs):
+	"""
+	batch conversion of msecs since 1970-01-01 UTC, numpy array is converted
+	to numpy datetime64[ms] array in one step, other sequences to list of UTC datetimes
+	"""
+	if numpy is not None and isinstance(msecs, numpy.ndarray):
+		return msecs.astype('int64').astype('datetime64[ms]')
+	epoch = UNIX_EPOCH
+	return [epoch + timedelta(milliseconds=m) for m in msecs]
+
+class DateTimeMsec:
+	"""
+	compact DateTime value, msecs since 1970-01-01 UTC and tz offset in quarters of hour,
+	decoded by ChainPackReader(datetime_msec=True), datetime is created on first toDateTime() call
+	"""
+	__slots__ = ('msec', 'tz', '_dt')
+
+	def __init__(s, msec: int, tz: int = 0):
+		s.msec = msec
+		s.tz = tz
+		s._dt = None
+
+	@classmethod
+	def fromDateTime(cls, v):
+		"""converts datetime or UtcAndTz without float rounding"""
+		if isinstance(v, UtcAndTz):
+			return cls(datetimeToEpochMsec(v.dt), v.tz)
+		return cls(datetimeToEpochMsec(v))
+
+	def toDateTime(s) -> datetime:
+		"""UTC datetime"""
+		if s._dt is None:
+			s._dt = epochMsecToDateTime(s.msec)
+		return s._dt
+
+	def toUtcAndTz(s) -> UtcAndTz:
+		return UtcAndTz(s.toDateTime(), s.tz)
+
+	def __repr__(s):
+		return "DateTimeMsec(%d,%d)" % (s.msec, s.tz)
+
+	def __eq__(s, x):
+		if isinstance(x, DateTimeMsec):
+			return s.msec == x.msec and s.tz == x.tz
+		if isinstance(x, UtcAndTz):
+			return s.toUtcAndTz() == x
+		return NotImplemented
+
+	def __hash__(s):
+		return hash((s.msec, s.tz))
+
+class DecimalValue:
+	"""
+	Decimal value mantissa * 10**exponent kept in integers, C++ RpcValue::Decimal(mantissa, -exponent),
+	decimal.Decimal is converted to it when packed
+	"""
+	__slots__ = ('mantissa', 'exponent')
+
+	def __init__(s, mantissa: int, exponent: int = 0):
+		s.mantissa = mantissa
+		s.exponent = exponent
+
+	@classmethod
+	def fromDecimal(cls, d):
+		"""converts decimal.Decimal or int exactly"""
+		if isinstance(d, int):
+			return cls(int(d))
+		sign, digits, exponent = d.as_tuple()
+		if not isinstance(exponent, int):
+			raise ChainpackTypeException("Cannot pack Decimal: " + str(d))
+		mantissa = int(''.join(map(str, digits)))
+		return cls(-mantissa if sign else mantissa, exponent)
+
+	def toDecimal(s) -> decimal.Decimal:
+		return decimal.Decimal("%dE%d" % (s.mantissa, s.exponent))
+
+	def __float__(s):
+		if s.exponent >= 0:
+			return float(s.mantissa * 10 ** s.exponent)
+		return s.mantissa / 10 ** -s.exponent
+
+	def __str__(s):
+		return str(s.toDecimal())
+
+	def __repr__(s):
+		return "DecimalValue(%d,%d)" % (s.mantissa, s.exponent)
+
+	def __eq__(s, x):
+		if isinstance(x, DecimalValue):
+			return s.mantissa == x.mantissa and s.exponent == x.exponent
+		if isinstance(x, decimal.Decimal):
+			return s.toDecimal() == x
+		return NotImplemented
+
+	def __hash__(s):
+		return hash((s.mantissa, s.exponent))
+
 debug = logging.debug
 ARRAY_FLAG_MASK = 64
 
@@ -38,6 +172,19 @@ class ChainpackDeserializationException(ChainpackException):
 class MetaData(dict):
 	pass
 
+def _readonlyMetaData(s, *args, **kwargs):
+	raise ChainpackException("shared or frozen meta data cannot be modified, use RpcValue.setMetaValue()")
+
+class FrozenMetaData(MetaData):
+	"""
+	meta data of FrozenRpcValue and empty meta data shared by all the values without meta data,
+	setMetaValue() replaces it with own MetaData
+	"""
+	pop = popitem = setdefault = update = clear = _readonlyMetaData
+	__setitem__ = __delitem__ = __ior__ = _readonlyMetaData
+
+EMPTY_META_DATA = FrozenMetaData()
+
 
 class TypeInfo(enum.IntFlag):
 	INVALID = -1
@@ -71,6 +218,7 @@ class TypeInfo(enum.IntFlag):
 	Map_Array = Map | ARRAY_FLAG_MASK
 	IMap_Array = IMap | ARRAY_FLAG_MASK
 	MetaIMap_Array = MetaIMap | ARRAY_FLAG_MASK
+	Decimal_Array = Decimal | ARRAY_FLAG_MASK
 	#/// auxiliary types used for optimization
 	FALSE=253
 	TRUE=254
@@ -95,46 +243,72 @@ class Type(enum.IntFlag):
 	Decimal=147
 
 
+#// plain int copies of TypeInfo members, looking up enum members is several times slower
+#// than looking up module globals, so the codec inner loops use these
+TI_NULL = int(TypeInfo.Null)
+TI_UINT = int(TypeInfo.UInt)
+TI_INT = int(TypeInfo.Int)
+TI_DOUBLE = int(TypeInfo.Double)
+TI_BOOL = int(TypeInfo.Bool)
+TI_BLOB = int(TypeInfo.Blob)
+TI_STRING = int(TypeInfo.String)
+TI_LIST = int(TypeInfo.List)
+TI_MAP = int(TypeInfo.Map)
+TI_IMAP = int(TypeInfo.IMap)
+TI_META_IMAP = int(TypeInfo.MetaIMap)
+TI_DECIMAL = int(TypeInfo.Decimal)
+TI_DATETIME = int(TypeInfo.DateTime)
+TI_FALSE = int(TypeInfo.FALSE)
+TI_TRUE = int(TypeInfo.TRUE)
+TI_TERMINATION = int(TypeInfo.TERMINATION)
+
+TYPE_TO_TYPE_INFO = {
+	Type.Null: TypeInfo.Null,
+	Type.UInt: TypeInfo.UInt,
+	Type.Int: TypeInfo.Int,
+	Type.Double: TypeInfo.Double,
+	Type.Bool: TypeInfo.Bool,
+	Type.Blob: TypeInfo.Blob,
+	Type.String: TypeInfo.String,
+	Type.List: TypeInfo.List,
+	Type.Map: TypeInfo.Map,
+	Type.IMap: TypeInfo.IMap,
+	Type.DateTime: TypeInfo.DateTime,
+	Type.MetaIMap: TypeInfo.MetaIMap,
+	Type.Decimal: TypeInfo.Decimal,
+}
+
+#// indexed by type info byte
+TYPE_INFO_TO_TYPE = [None] * 256
+for _t, _ti in TYPE_TO_TYPE_INFO.items():
+	TYPE_INFO_TO_TYPE[_ti] = _t
+TYPE_INFO_TO_TYPE = tuple(TYPE_INFO_TO_TYPE)
+
 def typeToTypeInfo(type: Type):
+	ret = TYPE_TO_TYPE_INFO.get(type)
+	if ret is not None:
+		return ret
 	if type == Type.INVALID:  raise Exception("There is no type info for type Invalid");
 	if type == Type.Array:    raise Exception("There is no type info for type Array");
-	if type == Type.Null:     return TypeInfo.Null;
-	if type == Type.UInt:     return TypeInfo.UInt;
-	if type == Type.Int:      return TypeInfo.Int;
-	if type == Type.Double:   return TypeInfo.Double;
-	if type == Type.Bool:     return TypeInfo.Bool;
-	if type == Type.Blob:     return TypeInfo.Blob;
-	if type == Type.String:   return TypeInfo.String;
-	if type == Type.List:     return TypeInfo.List;
-	if type == Type.Map:      return TypeInfo.Map;
-	if type == Type.IMap:     return TypeInfo.IMap;
-	if type == Type.DateTime: return TypeInfo.DateTime;
-	if type == Type.MetaIMap: return TypeInfo.MetaIMap;
 	raise Exception("Unknown RpcValue::Type!");
 
 def typeInfoToType(type_info: TypeInfo) -> Type:
-	if type_info == TypeInfo.Null:     return Type.Null;
-	if type_info == TypeInfo.UInt:     return Type.UInt;
-	if type_info == TypeInfo.Int:      return Type.Int;
-	if type_info == TypeInfo.Double:   return Type.Double;
-	if type_info == TypeInfo.Bool:     return Type.Bool;
-	if type_info == TypeInfo.Blob:     return Type.Blob;
-	if type_info == TypeInfo.String:   return Type.String;
-	if type_info == TypeInfo.DateTime: return Type.DateTime;
-	if type_info == TypeInfo.List:     return Type.List;
-	if type_info == TypeInfo.Map:      return Type.Map;
-	if type_info == TypeInfo.IMap:     return Type.IMap;
-	if type_info == TypeInfo.MetaIMap: return Type.MetaIMap;
-	raise Exception("There is no Type for TypeInfo %s"%(type_info));
+	ret = TYPE_INFO_TO_TYPE[type_info] if 0 <= type_info < 256 else None
+	if ret is None:
+		raise Exception("There is no Type for TypeInfo %s"%(type_info));
+	return ret
 
 def chainpackTypeFromPythonType(v):
-	if isinstance(v, (datetime, UtcAndTz)):
+	if isinstance(v, (datetime, UtcAndTz, DateTimeMsec)):
 		return Type.DateTime,
+	if isinstance(v, (DecimalValue, decimal.Decimal)):
+		return Type.Decimal,
 	t = type(v)
 	if t == InvalidValue:return Type.INVALID,
 	if t == type(None):  return Type.Null,
 	if t == bool:        return Type.Bool,
 	if t == uint:        return Type.UInt,
+	if t == imap:        return Type.IMap,
 	if t == int:         return Type.Int, Type.UInt,
 	if t == float:       return Type.Double,
 	if t == str:         return Type.String,
@@ -149,30 +323,41 @@ class InvalidValue():
 invalid_value = InvalidValue()
 
 class RpcValue():
+	__slots__ = ('_value', '_type', '_metaData')
+
 	def __init__(s, value, t = None):
 		if isinstance(value, RpcValueArray):
 			raise Exception("must construct RpcValueArray")
-		if type(value) == RpcValue:
+		if type(value) is FrozenRpcValue:
+			#// mutable copy, frozen children are shared
+			v = value._value
+			s._value = list(v) if type(v) is FrozenList else dict(v) if type(v) is FrozenDict else v
+			s._type = value._type
+			s._metaData = MetaData(value._metaData) if len(value._metaData) else EMPTY_META_DATA
+		elif isinstance(value, RpcValue):
 			s._value = value._value
 			s._type = value._type
 			s._metaData = value._metaData
 		else:
-			s._metaData = {}
+			s._metaData = EMPTY_META_DATA
 			if isinstance(value, list):
 				s._value = []
 				for i in value:
-					s._value.append(RpcValue(i))
+					s._value.append(i if isinstance(i, (RpcValueArray, FrozenRpcValue)) else RpcValue(i))
 			elif isinstance(value, dict):
 				s._value = {}
+				if type(value) == imap:
+					t = Type.IMap
 				for k,v in value.items():
 					if t == Type.IMap:
 						assert isinstance(k, int)
-						s._value[k] = RpcValue(v)
 					else:
 						assert isinstance(k, str)
-						s._value[k] = RpcValue(v)
+					s._value[k] = v if isinstance(v, (RpcValueArray, FrozenRpcValue)) else RpcValue(v)
 			elif isinstance(value, enum.IntFlag):
 				s._value = int(value)
+			elif isinstance(value, decimal.Decimal):
+				s._value = DecimalValue.fromDecimal(value)
 			else:
 				s._value = value
 
@@ -182,6 +367,18 @@ class RpcValue():
 		if s._type not in chainpackTypeFromPythonType(s._value):
 			raise ChainpackTypeException("python type %s for value %s does not match chainpack type %s" % (type(s._value), s._value, s._type))
 
+	@classmethod
+	def trusted(cls, value, t: Type, metadata: MetaData = EMPTY_META_DATA):
+		"""
+		constructs value without type deduction and checks, used by decoder,
+		containers must already contain RpcValues
+		"""
+		s = cls.__new__(cls)
+		s._value = value
+		s._type = t
+		s._metaData = metadata
+		return s
+
 	def __eq__(s, x):
 		return isinstance(x, RpcValue) and s.type == x.type and s.value == x.value and s._metaData == x._metaData
 
@@ -221,6 +418,12 @@ class RpcValue():
 	def __len__(s):
 		return len(s._value)
 
+	def __getitem__(s, key):
+		return s._value[key]
+
+	def __iter__(s):
+		return iter(s._value)
+
 	@property
 	def value(s):
 		return s._value
@@ -253,25 +456,43 @@ class RpcValue():
 
 	def setMetaValue(s, tag, value):
 		value = RpcValue(value)
+		if s._metaData is EMPTY_META_DATA:
+			s._metaData = MetaData()
 		s._metaData[tag] = value
 
 
+class ConstRpcValue(RpcValue):
+	"""immutable RpcValue shared by decoder for all Null, Bool and tiny int values without meta data"""
+	__slots__ = ()
+
+	def setMetaValue(s, tag, value):
+		raise ChainpackException("shared constant RpcValue cannot be modified, copy it with RpcValue(value) first")
+
+NULL_VALUE = ConstRpcValue.trusted(None, Type.Null)
+TRUE_VALUE = ConstRpcValue.trusted(True, Type.Bool)
+FALSE_VALUE = ConstRpcValue.trusted(False, Type.Bool)
+TINY_UINT_VALUES = tuple(ConstRpcValue.trusted(n, Type.UInt) for n in range(64))
+TINY_INT_VALUES = tuple(ConstRpcValue.trusted(n, Type.Int) for n in range(64))
+#// indexed by type info byte, values packed into the type info byte alone
+CONST_VALUES = TINY_UINT_VALUES + TINY_INT_VALUES + (NULL_VALUE,) + (None,) * 124 + (FALSE_VALUE, TRUE_VALUE, None)
+
+
 def optimizeRpcValueIntoType(pack: RpcValue) -> int:
 		if (not pack.isValid()):
 			raise ChainpackTypeException("Cannot serialize invalid ChainPack.");
 		t: Type = pack._type
 		if(t == Type.Bool) :
-			return [TypeInfo.FALSE, TypeInfo.TRUE][pack.toBool()]
+			return TI_TRUE if pack._value else TI_FALSE
 		elif t == Type.UInt:
-			n = pack.toInt() # type: int
-			if n in range(64):
+			n = pack._value # type: int
+			if 0 <= n < 64:
 				return n
 		elif t == Type.Int:
-			n = pack.toInt()
-			if n in range(64):
+			n = pack._value
+			if 0 <= n < 64:
 				return n + 64
 		elif t == Type.Null:
-			return TypeInfo.Null
+			return TI_NULL
 		return None
 
 
@@ -279,8 +500,8 @@ class ChainPackProtocol(bytearray):
 	DOUBLE_FMT = '!d'
 
 	def __init__(s, value=None):
-		if type(value) == RpcValue:
-			s.write(RpcValue(value))
+		if isinstance(value, RpcValue):
+			s.write(value)
 		elif isinstance(value, (bytes, bytearray)):
 			super().__init__(value)
 
@@ -288,85 +509,49 @@ class ChainPackProtocol(bytearray):
 		return super().__repr__() + str([bin(x) for x in s])
 
 	def add(s, x: bytearray):
-		for i in x:
-			s.append(i)
+		s.extend(x)
 
 	def get(s):
 		if (not len(s)):
 			raise ChainpackDeserializationException("unexpected end of stream!");
-		return s.pop(0)
+		r = s[0]
+		del s[0]
+		return r
 
 	def peek(s):
 		return s[0]
 
 	def pop_front(s, size: int):
-		for i in range(size):
-			s.pop(0)
+		del s[:size]
+
+	def _read(s, fn):
+		"""run fn on a ChainPackReader over this buffer and drop the consumed bytes from the front, all at once"""
+		r = ChainPackReader(s)
+		try:
+			ret = fn(r)
+			consumed = r.pos()
+		finally:
+			r.release()
+		del s[:consumed]
+		return ret
 
 	def read(s):
-		metadata = s.readMetaData();
-		t: int = s.get();
-		if t < 128:
-			if(t & 64) :
-				#// tiny Int
-				n: int = t & 63;
-				ret = RpcValue(n, Type.Int);
-			else:
-				#// tiny UInt
-				n: int = t & 63;
-				ret = RpcValue(n, Type.UInt);
-		elif t in [TypeInfo.TRUE, TypeInfo.FALSE]:
-			ret = RpcValue(t == TypeInfo.TRUE)
-		else:
-			is_array: bool = t & ARRAY_FLAG_MASK;
-			type = t & ~ARRAY_FLAG_MASK;
-			ret = s.readData(type, is_array);
-		if len(metadata):
-			ret._metaData = metadata
-		return ret;
+		return s._read(ChainPackReader.read)
 
 	def write(s, value: RpcValue) -> int:
-		if(not value.isValid()):
-			raise ChainpackTypeException("Cannot serialize invalid ChainPack.");
-		x = ChainPackProtocol.pack(value)
-		s.add(x)
-		return len(x)
+		return ChainPackWriter(s).write(value)
 
 	@classmethod
 	def pack(cls, value):
-		#print("pack:", RpcValue(value))
-		assert(value._type != TypeInfo.INVALID)
 		out = ChainPackProtocol()
-		out.writeMetaData(value._metaData);
-		t = optimizeRpcValueIntoType(value)
-		if t != None:
-			out.append(t)
-		else:
-			if(value._type == Type.Array):
-				t = typeToTypeInfo(value.element_type) | ARRAY_FLAG_MASK
-			else:
-				t = typeToTypeInfo(value._type)
-			out.append(t)
-			out.writeData(value)
+		out.write(value)
 		return out
 
 	def readMetaData(s) -> MetaData:
-		ret = MetaData()
-		while True:
-			type_info: int = s.peek();
-			if type_info == TypeInfo.MetaIMap:
-				s.pop(0)
-				for k,v in s.readData_IMap().value.items():
-					ret[k] = v
-			else:
-				break;
-		return ret;
+		return s._read(ChainPackReader.readMetaData)
 
 	def writeMetaData(s, md: MetaData):
-		imap = RpcValue(md, Type.IMap)
-		if len(imap):
-			s.append(TypeInfo.MetaIMap)
-			s.writeData_IMap(imap.value);
+		return ChainPackWriter(s).writeMetaData(md)
 
 #	def readTypeInfo(s) -> (TypeInfo, RpcValue, int):
 #		t: int = s.get()
@@ -379,169 +564,52 @@ class ChainPackProtocol(bytearray):
 #		else: return t, meta
 
 	def readData(s, t: TypeInfo, is_array: bool) -> RpcValue:
-		if(is_array):
-			return s.readData_Array(t);
-		else:
-			if   t == TypeInfo.Null:     return RpcValue(None)
-			elif t == TypeInfo.UInt:     return RpcValue(s.readData_UInt(), Type.UInt)
-			elif t == TypeInfo.Int:      return RpcValue(s.readData_Int())
-			elif t == TypeInfo.Double:   return RpcValue(s.read_fmt(s.DOUBLE_FMT))
-			elif t == TypeInfo.TRUE:     return RpcValue(True)
-			elif t == TypeInfo.FALSE:    return RpcValue(False)
-			elif t == TypeInfo.DateTime: return RpcValue(s.read_DateTime())
-			elif t == TypeInfo.String:   return RpcValue(s.readData_String())
-			elif t == TypeInfo.Blob:     return RpcValue(s.read_Blob())
-			elif t == TypeInfo.List:     return RpcValue(s.readData_List())
-			elif t == TypeInfo.Map:      return RpcValue(s.readData_Map())
-			elif t == TypeInfo.IMap:     return RpcValue(s.readData_IMap(), TypeInfo.IMap)
-			elif t == TypeInfo.Bool:     return RpcValue(s.get() != b'\0')
-			else: raise	ChainpackTypeException("Internal error: attempt to read meta type directly. type: " + str(t) + " " + t.name)
+		return s._read(lambda r: r.readData(t, is_array))
 
 	def writeData(s, val: RpcValue):
-		v = val.value
-		t = val.type # type: Type
-		if   t == Type.Null:     return
-		elif t == Type.Bool:     s.append([b'0', b'1'][v])
-		elif t == Type.UInt:     s.writeData_UInt(v)
-		elif t == Type.Int:      s.writeData_Int(v)
-		elif t == Type.Double:   s.write_fmt(s.DOUBLE_FMT, v)
-		elif t == Type.DateTime: s.write_DateTime(v)
-		elif t == Type.String:   s.writeData_String(v)
-		elif t == Type.Blob:     s.write_Blob(v)
-		elif t == Type.List:     s.writeData_List(v)
-		elif t == Type.Array:    s.writeData_Array(val)
-		elif t == Type.Map:      s.writeData_Map(v)
-		elif t == Type.IMap:     s.writeData_IMap(v)
-		elif t == Type.INVALID:  raise ChainpackTypeException("Internal error: attempt to write invalid type data")
-		elif t == Type.MetaIMap: raise ChainpackTypeException("Internal error: attempt to write metatype directly")
+		return ChainPackWriter(s).writeData(val)
 
 	def read_fmt(s, fmt):
-		size = struct.calcsize(fmt)
-		r = struct.unpack(fmt, s[:8])[0]
-		s.pop_front(size)
-		return r
+		return s._read(lambda r: r.read_fmt(fmt))
 
 	def write_fmt(s, fmt, value):
-		print(type(value))
-		s.add(struct.pack(fmt, value))
+		return ChainPackWriter(s).write_fmt(fmt, value)
 
 	def writeData_List(s, v: list):
-		for i in v:
-			s.write(i)
-		s.append(TypeInfo.TERMINATION)
+		return ChainPackWriter(s).writeData_List(v)
 
 	def readData_List(s) -> list:
-		r = []
-		while True:
-			i = s.peek()
-			if i == TypeInfo.TERMINATION:
-				s.pop(0)
-				break
-			r.append(s.read())
-		return r
+		return s._read(ChainPackReader.readData_List)
 
 	def write_Blob(s, b):
-		assert type(b) in (bytearray, bytes)
-		s.writeData_UInt(len(b))
-		for i in b:
-			s.append(i)
+		return ChainPackWriter(s).write_Blob(b)
 
 	def read_Blob(s):
-		r = bytearray()
-		for i in range(s.readData_UInt()):
-			r.append(s.get())
-		return r
+		return s._read(ChainPackReader.read_Blob)
 
 	def writeData_String(s, v):
-		b = v.encode('utf-8')
-		s.write_Blob(b)
+		return ChainPackWriter(s).writeData_String(v)
 
 	def readData_String(s) -> str:
-		return s.read_Blob().decode('utf-8')
+		return s._read(ChainPackReader.readData_String)
 
 	def write_DateTime(s, v):
-		if isinstance(v, datetime):
-			dt = v
-			tz = 0
-		elif isinstance(v, UtcAndTz):
-			dt = v.dt
-			tz = v.tz
-		else:
-			assert False, v
-		out = round(dt.timestamp() * 1000) - SHV_EPOCH_MSEC
-		has_millis = (out % 1000 != 0)
-		if not has_millis:
-			out = out // 1000
-		if(tz != 0):
-			out <<= 7;
-			assert -64 <= tz <= 63
-			if tz < 0:
-				tz = (1 << 6) | (~(-1-tz) & 0b111111)
-			out |= tz;
-		out <<= 2;
-		if(tz != 0):
-			out |= 1;
-		if not has_millis:
-			out |= 2;
-		s.writeData_Int(out)
+		return ChainPackWriter(s).write_DateTime(v)
 
 	def read_DateTime(s):
-		d = s.readData_Int()
-		offset = 0;
-		has_tz_offset = d & 1;
-		has_not_msec = d & 2;
-		d >>= 2;
-		if(has_tz_offset):
-			offset = d & 0b01111111;
-			if offset & (1 << 6):
-				offset -= (1 << 7)
-			d >>= 7;
-		if(has_not_msec):
-			d *= 1000;
-		d2 = d + SHV_EPOCH_MSEC
-		d3 = d2 / 1000
-		dt = datetime.utcfromtimestamp(d3)
-		dt = dt.replace(tzinfo=timezone.utc)
-		return UtcAndTz(dt, offset)
+		return s._read(ChainPackReader.read_DateTime)
 
 	def readData_IMap(s) -> RpcValue:
-		ret = RpcValue({}, Type.IMap)
-		#map_size: int = s.read_UIntData()
-		#for i in range(map_size):
-		while True:
-			if s.peek() == TypeInfo.TERMINATION:
-				s.pop(0)
-				break
-			key = s.readData_UInt()
-			ret.value[key] = s.read()
-		return ret
+		return s._read(ChainPackReader.readData_IMap)
 
 	def writeData_IMap(s, map: dict) -> None:
-		assert type(map) == dict
-		for k, v in map.items():
-			if not isinstance(k, int) or k < 0:
-				raise ChainpackTypeException('k.type != Type.UInt')
-			s.writeData_UInt(k)
-			s.write(v)
-		s.append(TypeInfo.TERMINATION)
+		return ChainPackWriter(s).writeData_IMap(map)
 
 	def readData_Map(s) -> RpcValue:
-		ret = RpcValue({}, Type.Map)
-		while True:
-			if s.peek() == TypeInfo.TERMINATION:
-				s.pop(0)
-				break
-			key = s.readData_String()
-			ret.value[key] = s.read()
-		return ret
+		return s._read(ChainPackReader.readData_Map)
 
 	def writeData_Map(s, map: dict) -> None:
-		assert type(map) == dict
-		for k, v in map.items():
-			assert isinstance(k, str)
-			s.writeData_String(k)
-			s.write(v)
-		s.append(TypeInfo.TERMINATION)
+		return ChainPackWriter(s).writeData_Map(map)
 
 	@staticmethod
 	def bytes_needed(bit_len: int) -> int:
@@ -559,103 +627,1853 @@ class ChainPackProtocol(bytearray):
 			return (byte_cnt - 1) * 8 - 1;
 
 	def writeData_UInt(s, num):
-		assert num >= 0
-		UINT_BYTES_MAX = 18;
-		if num.bit_length() > UINT_BYTES_MAX * 8:
-			SHV_EXCEPTION("writeData_UInt: value too big to pack!");
-		s.writeData_int_helper(num, num.bit_length());
+		return ChainPackWriter(s).writeData_UInt(num)
 
 	def writeData_Int(s, snum):
-		num = -snum if snum < 0 else snum
-		neg = snum < 0
-		bitlen = num.bit_length() + 1
-		if (neg):
-			sign_pos = s.expand_bit_len(bitlen);
-			sign_bit_mask = 1 << sign_pos;
-			num |= sign_bit_mask;
-		s.writeData_int_helper(num, bitlen);
-
-	def writeData_int_helper(s,	num, bit_len: int):
-		byte_cnt = s.bytes_needed(bit_len);
-		b = bytearray()
-		for i in range(byte_cnt - 1, -1, -1):
-			byte = num & 255
-			b.insert(0, byte)
-			num = num >> 8;
-		head = b[0];
-		if (bit_len <= 28):
-			mask = (0xf0 << (4 - byte_cnt)) & 255;
-			head = (head & ~mask) & 255;
-			mask = (mask << 1) & 255;
-			head = head | mask;
+		return ChainPackWriter(s).writeData_Int(snum)
+
+	def writeData_int_helper(s, num, bit_len: int):
+		return ChainPackWriter(s).writeData_int_helper(num, bit_len)
+
+	def readData_Int(s):
+		return s._read(ChainPackReader.readData_Int)
+
+	def readData_UInt(s):
+		return s._read(ChainPackReader.readData_UInt)
+
+	def _readData_UInt(s):
+		return s._read(ChainPackReader._readData_UInt)
+
+	def readData_Array(s, item_type_info: TypeInfo):
+		return s._read(lambda r: r.readData_Array(item_type_info))
+
+	def writeData_Array(s, array):
+		return ChainPackWriter(s).writeData_Array(array)
+
+	def readData_Decimal(s):
+		return s._read(ChainPackReader.readData_Decimal)
+
+	def writeData_Decimal(s, d):
+		return ChainPackWriter(s).writeData_Decimal(d)
+
+
+DOUBLE_STRUCT = struct.Struct(ChainPackProtocol.DOUBLE_FMT)
+
+#// packed varint length indexed by bit length of the number
+BYTES_NEEDED = tuple(ChainPackProtocol.bytes_needed(bit_len) for bit_len in range(8 * 18 + 9))
+
+def _uintHeadInfo(head: int):
+	if   ((head & 128) == 0): return 0, head & 127, 7
+	elif ((head & 64) == 0):  return 1, head & 63, 6 + 8
+	elif ((head & 32) == 0):  return 2, head & 31, 5 + 2 * 8
+	elif ((head & 16) == 0):  return 3, head & 15, 4 + 3 * 8
+	else:
+		bytes_to_read_cnt = (head & 0xf) + 4
+		return bytes_to_read_cnt, 0, bytes_to_read_cnt * 8
+
+#// indexed by the first byte of packed UInt
+UINT_HEAD_INFO = tuple(_uintHeadInfo(head) for head in range(256))
+UINT_HEAD_LEN = tuple(i[0] for i in UINT_HEAD_INFO)
+
+def uintHeadInfo(head: int):
+	"""
+	for the first byte of packed UInt returns (count of bytes following the head,
+	value bits stored in the head, bit length of the whole packed number)
+	"""
+	return UINT_HEAD_INFO[head]
+
+
+class ScanInfo():
+	"""
+	type and position of a packed value found by scan(), buf[start:type_pos] is its meta data,
+	count is number of items of List, Map, IMap or Array
+	"""
+	def __init__(s, type: Type, start: int, type_pos: int, end: int, count: int = 0, element_type: Type = None):
+		s.type = type
+		s.start = start
+		s.type_pos = type_pos
+		s.end = end
+		s.count = count
+		s.element_type = element_type
+
+	def __repr__(s):
+		return "ScanInfo(%s, %d:%d:%d, count=%d)" % (s.type._name_, s.start, s.type_pos, s.end, s.count)
+
+	def hasMetaData(s) -> bool:
+		return s.type_pos > s.start
+
+
+class KeyInterner():
+	"""
+	bounded table of Map keys shared by decoders, raw key bytes -> str,
+	repeated keys are looked up by their raw bytes (slice of input data if it is bytes),
+	so they are not UTF-8 decoded and all decoded values share one str per key,
+	keys longer than max_key_len are not interned, the table stops growing at max_size entries
+	"""
+	def __init__(s, max_size: int = 4096, max_key_len: int = 64):
+		s.max_size = max_size
+		s.max_key_len = max_key_len
+		s._table = {}
+
+	def __len__(s):
+		return len(s._table)
+
+	def clear(s):
+		s._table.clear()
+
+	def get(s, raw) -> str:
+		ret = s._table.get(raw)
+		if ret is None:
+			ret = str(raw, 'utf-8')
+			if len(raw) <= s.max_key_len and len(s._table) < s.max_size:
+				s._table[bytes(raw)] = ret
+		return ret
+
+KEY_INTERNER = KeyInterner()
+
+class ChainPackReader():
+	"""
+	cursor based ChainPack decoder, reads from bytes, bytearray, memoryview or any other buffer
+	without modifying or copying it, current read position is available via pos(),
+	datetime_msec decodes DateTime as DateTimeMsec instead of UtcAndTz,
+	Map keys are shared via key_interner, None disables interning
+	"""
+	DOUBLE_FMT = ChainPackProtocol.DOUBLE_FMT
+
+	def __init__(s, data, pos: int = 0, typed_arrays: bool = False, datetime_msec: bool = False, key_interner: KeyInterner = KEY_INTERNER):
+		s._data = memoryview(data)
+		s._pos = pos
+		s.typed_arrays = typed_arrays
+		s.datetime_msec = datetime_msec
+		s.key_interner = key_interner
+		#// only views of bytes are hashable, so their slices can be looked up in key_interner without copying
+		s._hashable_data = isinstance(s._data.obj, bytes)
+
+	def pos(s) -> int:
+		return s._pos
+
+	def at(s, pos: int) -> 'ChainPackReader':
+		"""new reader of the same data with the same options positioned at pos"""
+		r = copy.copy(s)
+		r._pos = pos
+		return r
+
+	def release(s):
+		s._data.release()
+
+	def get(s) -> int:
+		p = s._pos
+		if p >= len(s._data):
+			raise ChainpackDeserializationException("unexpected end of stream!")
+		s._pos = p + 1
+		return s._data[p]
+
+	def peek(s) -> int:
+		p = s._pos
+		if p >= len(s._data):
+			raise ChainpackDeserializationException("unexpected end of stream!")
+		return s._data[p]
+
+	def read_raw(s, size: int) -> memoryview:
+		p = s._pos
+		e = p + size
+		if e > len(s._data):
+			raise ChainpackDeserializationException("unexpected end of stream!")
+		s._pos = e
+		return s._data[p:e]
+
+	def read(s) -> RpcValue:
+		t: int = s.get()
+		if t == TI_META_IMAP:
+			s._pos -= 1
+			metadata = s.readMetaData()
+			t = s.get()
 		else:
-			head = 0xf0 | (byte_cnt - 5);
-		b[0] = head & 255
-		s.add(b)
+			metadata = None
+		#// tiny UInt, tiny Int, Null, TRUE and FALSE
+		ret = CONST_VALUES[t]
+		if ret is None:
+			if t & ARRAY_FLAG_MASK:
+				ret = s.readData_Array(t & ~ARRAY_FLAG_MASK)
+			else:
+				fn = DATA_READERS[t]
+				if fn is None:
+					raise ChainpackTypeException("Internal error: attempt to read meta type directly. type: " + str(t))
+				ret = fn(s)
+		if metadata:
+			if isinstance(ret, ConstRpcValue):
+				ret = RpcValue.trusted(ret._value, ret._type)
+			ret._metaData = metadata
+		return ret
+
+	def readLazy(s) -> RpcValue:
+		"""like read(), but List, Map and IMap are returned as LazyRpcValue views decoded on access"""
+		return s._readLazy(None)
+
+	def _readLazy(s, end):
+		start = s._pos
+		metadata = s.readMetaData() if s.peek() == TI_META_IMAP else EMPTY_META_DATA
+		t = s.peek()
+		if t in (TI_LIST, TI_MAP, TI_IMAP):
+			s._pos += 1
+			ret = LazyRpcValue(s, t, s._pos, metadata)
+			s._pos = ret._scan() if end is None else end
+			return ret
+		s._pos = start
+		return s.read()
+
+	def skip(s):
+		"""moves read position behind the next value including its meta data, nothing is decoded"""
+		t: int = s.get()
+		while t == TI_META_IMAP:
+			s.skipData(TI_IMAP, False)
+			t = s.get()
+		if CONST_VALUES[t] is not None:
+			return
+		s.skipData(t & ~ARRAY_FLAG_MASK, t & ARRAY_FLAG_MASK)
+
+	def skipData(s, t: TypeInfo, is_array: bool):
+		if(is_array):
+			s.skipData_Array(t, s.readData_UInt())
+			return
+		fn = DATA_SKIPPERS[t]
+		if fn is None:
+			raise ChainpackTypeException("Internal error: attempt to skip meta type directly. type: " + str(t))
+		fn(s)
+
+	def skipData_Null(s):
+		pass
+
+	def skipData_Double(s):
+		s.read_raw(8)
+
+	def skipData_Bool(s):
+		s.read_raw(1)
+
+	def skipData_Blob(s):
+		s.read_raw(s.readData_UInt())
+
+	def skipData_List(s):
+		while s.peek() != TI_TERMINATION:
+			s.skip()
+		s._pos += 1
+
+	def skipData_Map(s):
+		while s.peek() != TI_TERMINATION:
+			s.read_raw(s.readData_UInt())
+			s.skip()
+		s._pos += 1
+
+	def skipData_IMap(s):
+		while s.peek() != TI_TERMINATION:
+			s.skipData_UInt()
+			s.skip()
+		s._pos += 1
+
+	def skipData_Decimal(s):
+		s.skipData_UInt()
+		s.skipData_UInt()
+
+	def skipData_Array(s, item_type_info: TypeInfo, size: int):
+		if item_type_info == TI_DOUBLE:
+			s.read_raw(size * 8)
+		elif item_type_info == TI_BOOL:
+			s.read_raw(size)
+		else:
+			for i in range(size):
+				s.skipData(item_type_info, False)
+
+	def scan(s) -> 'ScanInfo':
+		"""like skip(), but returns type, byte range and children count of the skipped value"""
+		start = s._pos
+		while s.peek() == TI_META_IMAP:
+			s._pos += 1
+			s.skipData(TI_IMAP, False)
+		type_pos = s._pos
+		t: int = s.get()
+		count = 0
+		element_type = None
+		if t < 128:
+			type = Type.Int if t & 64 else Type.UInt
+		elif t == TI_TRUE or t == TI_FALSE:
+			type = Type.Bool
+		elif t & ARRAY_FLAG_MASK:
+			t &= ~ARRAY_FLAG_MASK
+			type = Type.Array
+			element_type = typeInfoToType(t)
+			count = s.readData_UInt()
+			s.skipData_Array(t, count)
+		elif t in (TI_LIST, TI_MAP, TI_IMAP):
+			type = typeInfoToType(t)
+			while s.peek() != TI_TERMINATION:
+				if t == TI_MAP:
+					s.skipData_Blob()
+				elif t == TI_IMAP:
+					s.skipData_UInt()
+				s.skip()
+				count += 1
+			s._pos += 1
+		else:
+			type = typeInfoToType(t)
+			s.skipData(t, False)
+		return ScanInfo(type, start, type_pos, s._pos, count, element_type)
+
+	def readPython(s):
+		"""reads next value directly as native python value, meta data is skipped"""
+		t: int = s.get()
+		while t == TI_META_IMAP:
+			s.skipData_IMap()
+			t = s.get()
+		if t < 128:
+			return t & 63 if t & 64 else uint(t)
+		if t & ARRAY_FLAG_MASK:
+			#// TRUE and FALSE have array flag bit set as well
+			if t == TI_TRUE:
+				return True
+			if t == TI_FALSE:
+				return False
+			t &= ~ARRAY_FLAG_MASK
+			size = s.readData_UInt()
+			if t == TI_DOUBLE:
+				return s.readArray(t, size).tolist()
+			if t == TI_INT:
+				return s.readIntList(t, size)
+			if t == TI_UINT:
+				return [uint(i) for i in s.readIntList(t, size)]
+			if t == TI_BOOL:
+				return [i != 0 for i in s.read_raw(size)]
+			return [s.readDataPython(t) for i in range(size)]
+		return s.readDataPython(t)
+
+	def readDataPython(s, t: TypeInfo):
+		fn = PYTHON_READERS[t]
+		if fn is None:
+			raise ChainpackTypeException("Internal error: attempt to read meta type directly. type: " + str(t))
+		return fn(s)
+
+	def readPython_Null(s):
+		return None
+
+	def readPython_UInt(s):
+		return uint(s.readData_UInt())
+
+	def readPython_Double(s):
+		return s.read_fmt(s.DOUBLE_FMT)
+
+	def readPython_Bool(s):
+		return s.get() != 0
+
+	def readPython_Blob(s):
+		return bytes(s.read_raw(s.readData_UInt()))
+
+	def readPython_DateTime(s):
+		return s.readData_DateTimeMsec() if s.datetime_msec else s.read_DateTime()
+
+	def readPython_List(s):
+		ret = []
+		while s.peek() != TI_TERMINATION:
+			ret.append(s.readPython())
+		s._pos += 1
+		return ret
+
+	def readPython_Map(s):
+		ret = {}
+		while s.peek() != TI_TERMINATION:
+			key = s.readData_MapKey()
+			ret[key] = s.readPython()
+		s._pos += 1
+		return ret
+
+	def readPython_IMap(s):
+		ret = imap()
+		while s.peek() != TI_TERMINATION:
+			key = s.readData_UInt()
+			ret[key] = s.readPython()
+		s._pos += 1
+		return ret
+
+	def readMetaData(s) -> MetaData:
+		ret = MetaData()
+		while s.peek() == TI_META_IMAP:
+			s._pos += 1
+			for k,v in s.readData_IMap().value.items():
+				ret[k] = v
+		return ret
+
+	def readData(s, t: TypeInfo, is_array: bool) -> RpcValue:
+		if(is_array):
+			return s.readData_Array(t)
+		ret = CONST_VALUES[t]
+		if ret is not None:
+			return ret
+		fn = DATA_READERS[t]
+		if fn is None:
+			raise ChainpackTypeException("Internal error: attempt to read meta type directly. type: " + str(t))
+		return fn(s)
+
+	def readValue_UInt(s) -> RpcValue:
+		n = s.readData_UInt()
+		return TINY_UINT_VALUES[n] if n < 64 else RpcValue.trusted(n, Type.UInt)
+
+	def readValue_Int(s) -> RpcValue:
+		n = s.readData_Int()
+		return TINY_INT_VALUES[n] if 0 <= n < 64 else RpcValue.trusted(n, Type.Int)
+
+	def readValue_Double(s) -> RpcValue:
+		return RpcValue.trusted(s.read_fmt(s.DOUBLE_FMT), Type.Double)
+
+	def readValue_Bool(s) -> RpcValue:
+		return TRUE_VALUE if s.get() != 0 else FALSE_VALUE
+
+	def readValue_DateTime(s) -> RpcValue:
+		return RpcValue.trusted(s.readData_DateTimeMsec() if s.datetime_msec else s.read_DateTime(), Type.DateTime)
+
+	def readValue_String(s) -> RpcValue:
+		return RpcValue.trusted(s.readData_String(), Type.String)
+
+	def readValue_Blob(s) -> RpcValue:
+		return RpcValue.trusted(s.read_Blob(), Type.Blob)
+
+	def readValue_List(s) -> RpcValue:
+		return RpcValue.trusted(s.readData_List(), Type.List)
+
+	def readValue_Decimal(s) -> RpcValue:
+		return RpcValue.trusted(s.readData_Decimal(), Type.Decimal)
+
+	def read_fmt(s, fmt):
+		return struct.unpack(fmt, s.read_raw(struct.calcsize(fmt)))[0]
+
+	def readData_List(s) -> list:
+		r = []
+		while s.peek() != TI_TERMINATION:
+			r.append(s.read())
+		s._pos += 1
+		return r
+
+	def read_Blob(s) -> bytearray:
+		return bytearray(s.read_raw(s.readData_UInt()))
+
+	def readData_String(s) -> str:
+		return str(s.read_raw(s.readData_UInt()), 'utf-8')
+
+	def readData_MapKey(s) -> str:
+		raw = s.read_raw(s.readData_UInt())
+		interner = s.key_interner
+		if interner is None:
+			return str(raw, 'utf-8')
+		if not s._hashable_data:
+			raw = bytes(raw)
+		#// inlined hit path of KeyInterner.get()
+		ret = interner._table.get(raw)
+		return ret if ret is not None else interner.get(raw)
+
+	def read_DateTime(s):
+		msec, offset = s.read_DateTimeEpochMsec()
+		return UtcAndTz(epochMsecToDateTime(msec), offset)
+
+	def readData_DateTimeMsec(s) -> DateTimeMsec:
+		return DateTimeMsec(*s.read_DateTimeEpochMsec())
+
+	def read_DateTimeEpochMsec(s):
+		"""returns (msecs since 1970-01-01 UTC, tz offset in quarters of hour) of DateTime data"""
+		d = s.readData_Int()
+		offset = 0
+		has_tz_offset = d & 1
+		has_not_msec = d & 2
+		d >>= 2
+		if(has_tz_offset):
+			offset = d & 0b01111111
+			if offset & (1 << 6):
+				offset -= (1 << 7)
+			d >>= 7
+		if(has_not_msec):
+			d *= 1000
+		return d + SHV_EPOCH_MSEC, offset
+
+	def readData_IMap(s) -> RpcValue:
+		ret = RpcValue.trusted({}, Type.IMap)
+		while s.peek() != TI_TERMINATION:
+			key = s.readData_UInt()
+			ret.value[key] = s.read()
+		s._pos += 1
+		return ret
+
+	def readData_Map(s) -> RpcValue:
+		ret = RpcValue.trusted({}, Type.Map)
+		while s.peek() != TI_TERMINATION:
+			key = s.readData_MapKey()
+			ret.value[key] = s.read()
+		s._pos += 1
+		return ret
 
 	def readData_Int(s):
-		num, bitlen = s._readData_UInt();
-		sign_bit_mask = 1 << (bitlen - 1);
-		neg = num & sign_bit_mask;
-		snum = num;
-		if (neg):
-			snum &= ~sign_bit_mask;
-			snum = -snum;
-		return snum;
+		data = s._data
+		p = s._pos
+		if p < len(data) and data[p] < 128:
+			#// one byte varint, sign is bit 6
+			s._pos = p + 1
+			head = data[p]
+			return -(head & 63) if head & 64 else head
+		num, bitlen = s._readData_UInt()
+		sign_bit_mask = 1 << (bitlen - 1)
+		if num & sign_bit_mask:
+			return -(num & ~sign_bit_mask)
+		return num
 
 	def readData_UInt(s):
+		data = s._data
+		p = s._pos
+		if p < len(data) and data[p] < 128:
+			s._pos = p + 1
+			return data[p]
 		return s._readData_UInt()[0]
 
 	def _readData_UInt(s):
-		head = s.get()
-		num = 0
-		if  ((head & 128) == 0): bytes_to_read_cnt = 0; num = head & 127; bitlen = 7;
-		elif ((head & 64) == 0): bytes_to_read_cnt = 1; num = head & 63; bitlen = 6 + 8;
-		elif ((head & 32) == 0): bytes_to_read_cnt = 2; num = head & 31; bitlen = 5 + 2 * 8;
-		elif ((head & 16) == 0): bytes_to_read_cnt = 3; num = head & 15; bitlen = 4 + 3 * 8;
-		else:
-			bytes_to_read_cnt = (head & 0xf) + 4;
-			bitlen = bytes_to_read_cnt * 8;
-		for i in range(bytes_to_read_cnt):
-			num = (num << 8) + s.get()
+		bytes_to_read_cnt, num, bitlen = UINT_HEAD_INFO[s.get()]
+		if bytes_to_read_cnt:
+			num = (num << (8 * bytes_to_read_cnt)) | int.from_bytes(s.read_raw(bytes_to_read_cnt), 'big')
 		return num, bitlen
 
+	def skipData_UInt(s):
+		bytes_to_read_cnt = UINT_HEAD_LEN[s.get()]
+		if bytes_to_read_cnt:
+			s.read_raw(bytes_to_read_cnt)
+
 	def readData_Array(s, item_type_info: TypeInfo):
 		item_type: Type = typeInfoToType(item_type_info)
-		ret = RpcValueArray(item_type)
 		size: int = s.readData_UInt()
+		if s.typed_arrays and item_type in RpcValueArray.TYPECODES:
+			start = s._pos
+			try:
+				return RpcValueArray(item_type, s.readArray(item_type_info, size))
+			except OverflowError:
+				#// items do not fit 64 bits, they are read again one by one
+				s._pos = start
+		ret = RpcValueArray(item_type)
 		for i in range(size):
 			ret._value.append(s.readData(item_type_info, False))
 		return ret
 
-	def writeData_Array(s, array):
-		assert isinstance(array, RpcValueArray)
-		size = len(array._value)
-		s.writeData_UInt(size);
-		for i in array._value:
-			assert i._type == array.element_type
-			s.writeData(i);
+	def readArray(s, item_type_info: TypeInfo, size: int) -> array.array:
+		"""reads size items of Double, Int, UInt or Bool Array data in bulk into array.array"""
+		if item_type_info == TI_DOUBLE:
+			ret = array.array('d')
+			ret.frombytes(s.read_raw(size * ret.itemsize))
+			if sys.byteorder == 'little':
+				ret.byteswap()
+			return ret
+		if item_type_info == TI_BOOL:
+			return array.array('B', s.read_raw(size))
+		return array.array('q' if item_type_info == TI_INT else 'Q', s.readIntList(item_type_info, size))
+
+	def readIntList(s, item_type_info: TypeInfo, size: int) -> list:
+		"""reads size items of Int or UInt Array data into list of int, items are not limited to 64 bits"""
+		data = s._data
+		p = s._pos
+		n = len(data)
+		ret = []
+		append = ret.append
+		is_int = item_type_info == TI_INT
+		for i in range(size):
+			if p >= n:
+				raise ChainpackDeserializationException("unexpected end of stream!")
+			head = data[p]
+			if head < 128:
+				#// one byte varint
+				p += 1
+				append(-(head & 63) if is_int and head & 64 else head)
+			else:
+				s._pos = p
+				append(s.readData_Int() if is_int else s.readData_UInt())
+				p = s._pos
+		s._pos = p
+		return ret
 
-	def readData_Decimal(s):
-		mant = s.readData_Int();
-		prec = readData_Int();
-		return RpcValue((mant, prec), Type.Decimal);
+	def readData_Decimal(s) -> DecimalValue:
+		mantissa = s.readData_Int()
+		return DecimalValue(mantissa, -s.readData_Int())
+
+
+def _typeInfoTable(fns: dict) -> tuple:
+	"""dispatch table indexed by type info byte"""
+	ret = [None] * 256
+	for t, fn in fns.items():
+		ret[t] = fn
+	return tuple(ret)
+
+#// data readers of the types not packed in CONST_VALUES
+DATA_READERS = _typeInfoTable({
+	TI_UINT: ChainPackReader.readValue_UInt,
+	TI_INT: ChainPackReader.readValue_Int,
+	TI_DOUBLE: ChainPackReader.readValue_Double,
+	TI_BOOL: ChainPackReader.readValue_Bool,
+	TI_BLOB: ChainPackReader.readValue_Blob,
+	TI_STRING: ChainPackReader.readValue_String,
+	TI_DATETIME: ChainPackReader.readValue_DateTime,
+	TI_LIST: ChainPackReader.readValue_List,
+	TI_MAP: ChainPackReader.readData_Map,
+	TI_IMAP: ChainPackReader.readData_IMap,
+	TI_DECIMAL: ChainPackReader.readValue_Decimal,
+})
+
+PYTHON_READERS = _typeInfoTable({
+	TI_NULL: ChainPackReader.readPython_Null,
+	TI_UINT: ChainPackReader.readPython_UInt,
+	TI_INT: ChainPackReader.readData_Int,
+	TI_DOUBLE: ChainPackReader.readPython_Double,
+	TI_BOOL: ChainPackReader.readPython_Bool,
+	TI_BLOB: ChainPackReader.readPython_Blob,
+	TI_STRING: ChainPackReader.readData_String,
+	TI_DATETIME: ChainPackReader.readPython_DateTime,
+	TI_LIST: ChainPackReader.readPython_List,
+	TI_MAP: ChainPackReader.readPython_Map,
+	TI_IMAP: ChainPackReader.readPython_IMap,
+	TI_DECIMAL: ChainPackReader.readData_Decimal,
+})
+
+DATA_SKIPPERS = _typeInfoTable({
+	TI_NULL: ChainPackReader.skipData_Null,
+	TI_UINT: ChainPackReader.skipData_UInt,
+	TI_INT: ChainPackReader.skipData_UInt,
+	TI_DOUBLE: ChainPackReader.skipData_Double,
+	TI_BOOL: ChainPackReader.skipData_Bool,
+	TI_BLOB: ChainPackReader.skipData_Blob,
+	TI_STRING: ChainPackReader.skipData_Blob,
+	TI_DATETIME: ChainPackReader.skipData_UInt,
+	TI_LIST: ChainPackReader.skipData_List,
+	TI_MAP: ChainPackReader.skipData_Map,
+	TI_IMAP: ChainPackReader.skipData_IMap,
+	TI_DECIMAL: ChainPackReader.skipData_Decimal,
+})
+
+
+#// python type -> fn(writer, value) used by writePython() for types it does not know, see rpcschema.registerSchema()
+PYTHON_TYPE_ENCODERS = {}
+
+class ChainPackWriter():
+	"""
+	ChainPack encoder appending all the values into one growable output buffer,
+	the writer can be reused for next message after reset()
+	"""
+	DOUBLE_FMT = ChainPackProtocol.DOUBLE_FMT
+	UINT_BYTES_MAX = 18
+
+	def __init__(s, out: bytearray = None):
+		s._out = bytearray() if out is None else out
 
-	def writeData_Decimal(s, d):
-		assert d._type == Type.Decimal
-		assert type(d._value) == tuple
-		s.writeData_Int(d._value[0]);
-		s.writeData_Int(d._value[1]);
+	def __len__(s):
+		return len(s._out)
+
+	def data(s) -> bytearray:
+		"""encoded data, the buffer is reused, so it is valid until next reset() only"""
+		return s._out
+
+	def reset(s):
+		del s._out[:]
+
+	def write(s, value: RpcValue) -> int:
+		if type(value) is FrozenRpcValue:
+			packed = value.packed()
+			s._out += packed
+			return len(packed)
+		fn = VALUE_WRITERS.get(value._type)
+		if fn is None:
+			if(not value.isValid()):
+				raise ChainpackTypeException("Cannot serialize invalid ChainPack.")
+			raise ChainpackTypeException("Internal error: attempt to write metatype directly")
+		out = s._out
+		start = len(out)
+		if value._metaData:
+			s.writeMetaData(value._metaData)
+		fn(s, value)
+		return len(out) - start
+
+	def writeValue_Null(s, val: RpcValue):
+		s._out.append(TI_NULL)
+
+	def writeValue_Bool(s, val: RpcValue):
+		s._out.append(TI_TRUE if val._value else TI_FALSE)
+
+	def writeValue_UInt(s, val: RpcValue):
+		n = val._value
+		if 0 <= n < 64:
+			s._out.append(n)
+		else:
+			s._out.append(TI_UINT)
+			s.writeData_UInt(n)
+
+	def writeValue_Int(s, val: RpcValue):
+		n = val._value
+		if 0 <= n < 64:
+			s._out.append(64 + n)
+		else:
+			s._out.append(TI_INT)
+			s.writeData_Int(n)
+
+	def writeValue_Double(s, val: RpcValue):
+		out = s._out
+		out.append(TI_DOUBLE)
+		out += DOUBLE_STRUCT.pack(val._value)
+
+	def writeValue_DateTime(s, val: RpcValue):
+		s._out.append(TI_DATETIME)
+		s.write_DateTime(val._value)
+
+	def writeValue_String(s, val: RpcValue):
+		s._out.append(TI_STRING)
+		s.writeData_String(val._value)
+
+	def writeValue_Blob(s, val: RpcValue):
+		s._out.append(TI_BLOB)
+		s.write_Blob(val._value)
+
+	def writeValue_List(s, val: RpcValue):
+		s._out.append(TI_LIST)
+		s.writeData_List(val._value)
+
+	def writeValue_Map(s, val: RpcValue):
+		s._out.append(TI_MAP)
+		s.writeData_Map(val._value)
+
+	def writeValue_IMap(s, val: RpcValue):
+		s._out.append(TI_IMAP)
+		s.writeData_IMap(val._value)
+
+	def writeValue_Decimal(s, val: RpcValue):
+		s._out.append(TI_DECIMAL)
+		s.writeData_Decimal(val._value)
+
+	def writeValue_Array(s, val: RpcValue):
+		s._out.append(TYPE_TO_TYPE_INFO[val.element_type] | ARRAY_FLAG_MASK)
+		s.writeData_Array(val)
+
+	def writePython(s, v) -> int:
+		"""
+		writes native python value without wrapping it into RpcValue,
+		use uint for UInt, imap for IMap and UtcAndTz, DateTimeMsec or datetime for DateTime,
+		DecimalValue or decimal.Decimal for Decimal,
+		tuple is written as List, array.array and numpy.ndarray as Array
+		"""
+		out = s._out
+		start = len(out)
+		t = type(v)
+		if t is int:
+			if 0 <= v < 64:
+				out.append(64 + v)
+			else:
+				out.append(TI_INT)
+				s.writeData_Int(v)
+		elif t is str:
+			out.append(TI_STRING)
+			s.writeData_String(v)
+		elif t is float:
+			out.append(TI_DOUBLE)
+			out += DOUBLE_STRUCT.pack(v)
+		elif t is bool:
+			out.append(TI_TRUE if v else TI_FALSE)
+		elif v is None:
+			out.append(TI_NULL)
+		elif t is dict:
+			out.append(TI_MAP)
+			for k, i in v.items():
+				if type(k) is not str:
+					raise ChainpackTypeException("Map key must be str, got: %s, use imap for UInt keys" % repr(k))
+				s.writeData_String(k)
+				s.writePython(i)
+			out.append(TI_TERMINATION)
+		elif t is list or t is tuple:
+			out.append(TI_LIST)
+			for i in v:
+				s.writePython(i)
+			out.append(TI_TERMINATION)
+		elif t is uint:
+			if v < 64:
+				out.append(v)
+			else:
+				out.append(TI_UINT)
+				s.writeData_UInt(v)
+		elif t is imap:
+			out.append(TI_IMAP)
+			for k, i in v.items():
+				if not isinstance(k, int) or k < 0:
+					raise ChainpackTypeException("IMap key must be non negative int, got: %s" % repr(k))
+				s.writeData_UInt(k)
+				s.writePython(i)
+			out.append(TI_TERMINATION)
+		elif t is bytes or t is bytearray:
+			out.append(TI_BLOB)
+			s.write_Blob(v)
+		elif isinstance(v, (datetime, UtcAndTz, DateTimeMsec)):
+			out.append(TI_DATETIME)
+			s.write_DateTime(v)
+		elif t is DecimalValue:
+			out.append(TI_DECIMAL)
+			s.writeData_Decimal(v)
+		elif isinstance(v, decimal.Decimal):
+			out.append(TI_DECIMAL)
+			s.writeData_Decimal(DecimalValue.fromDecimal(v))
+		elif isinstance(v, RpcValue):
+			s.write(v)
+		elif isinstance(v, array.array) or (numpy is not None and isinstance(v, numpy.ndarray)):
+			item_type = s.typedArrayItemType(v)
+			out.append(typeToTypeInfo(item_type) | ARRAY_FLAG_MASK)
+			s.writeData_UInt(len(v))
+			s.writeArray(item_type, v)
+		elif isinstance(v, bool):
+			s.writePython(bool(v))
+		elif isinstance(v, int):
+			s.writePython(int(v))
+		elif isinstance(v, float):
+			s.writePython(float(v))
+		elif isinstance(v, str):
+			s.writePython(str(v))
+		elif isinstance(v, dict):
+			s.writePython(dict(v))
+		elif t in PYTHON_TYPE_ENCODERS:
+			PYTHON_TYPE_ENCODERS[t](s, v)
+		else:
+			raise ChainpackTypeException("failed deducing chainpack type for python type %s" % t)
+		return len(out) - start
+
+	@staticmethod
+	def typedArrayItemType(v) -> Type:
+		if isinstance(v, array.array):
+			code = v.typecode
+			kind = 'f' if code in 'fd' else 'u' if code.isupper() else 'i'
+		else:
+			kind = v.dtype.kind
+		if kind == 'f': return Type.Double
+		if kind == 'i': return Type.Int
+		if kind == 'u': return Type.UInt
+		if kind == 'b': return Type.Bool
+		raise ChainpackTypeException("Cannot write typed array of kind: " + kind)
+
+	def writeMetaData(s, md: MetaData):
+		if len(md):
+			s._out.append(TI_META_IMAP)
+			s.writeData_IMap({k: v if isinstance(v, RpcValue) else RpcValue(v) for k, v in md.items()})
+
+	def writeContainerBegin(s, container_type: Type, metadata: MetaData = None):
+		if container_type not in (Type.List, Type.Map, Type.IMap, Type.MetaIMap):
+			raise ChainpackTypeException("Cannot begin write container of type: " + str(container_type))
+		if metadata:
+			s.writeMetaData(metadata)
+		s._out.append(typeToTypeInfo(container_type))
+
+	def writeContainerEnd(s):
+		s._out.append(TI_TERMINATION)
+
+	def writeListElement(s, val):
+		"""val is RpcValue or native python value, see writePython()"""
+		s.writePython(val)
+
+	def writeMapElement(s, key, val):
+		"""str key is written as Map key, int key as IMap key"""
+		if isinstance(key, str):
+			s.writeData_String(key)
+		else:
+			s.writeData_UInt(key)
+		s.writePython(val)
+
+	def writeArrayBegin(s, array_type: Type, array_size: int):
+		s._out.append(typeToTypeInfo(array_type) | ARRAY_FLAG_MASK)
+		s.writeData_UInt(array_size)
+
+	def writeArrayElement(s, val: RpcValue):
+		s.writeData(val)
+
+	def writeData(s, val: RpcValue):
+		fn = DATA_WRITERS.get(val._type)
+		if fn is None:
+			if val._type == Type.INVALID:
+				raise ChainpackTypeException("Internal error: attempt to write invalid type data")
+			raise ChainpackTypeException("Internal error: attempt to write metatype directly")
+		fn(s, val)
+
+	def write_fmt(s, fmt, value):
+		s._out += struct.pack(fmt, value)
+
+	def writeData_List(s, v: list):
+		for i in v:
+			s.write(i)
+		s._out.append(TI_TERMINATION)
+
+	def write_Blob(s, b):
+		assert type(b) in (bytearray, bytes)
+		s.writeData_UInt(len(b))
+		s._out += b
+
+	def writeData_String(s, v):
+		b = v.encode('utf-8')
+		s.writeData_UInt(len(b))
+		s._out += b
+
+	def write_DateTime(s, v):
+		s.write_DateTimeEpochMsec(*dateTimeEpochMsec(v))
+
+	def write_DateTimeEpochMsec(s, msec: int, tz: int = 0):
+		"""writes DateTime data of msecs since 1970-01-01 UTC and tz offset in quarters of hour"""
+		s.writeData_Int(s.dateTimeData(msec, tz))
+
+	@staticmethod
+	def dateTimeData(msec: int, tz: int = 0) -> int:
+		"""DateTime data packed as Int"""
+		out = msec - SHV_EPOCH_MSEC
+		has_millis = (out % 1000 != 0)
+		if not has_millis:
+			out = out // 1000
+		if(tz != 0):
+			out <<= 7
+			assert -64 <= tz <= 63
+			if tz < 0:
+				tz = (1 << 6) | (~(-1-tz) & 0b111111)
+			out |= tz
+		out <<= 2
+		if(tz != 0):
+			out |= 1
+		if not has_millis:
+			out |= 2
+		return out
+
+	def writeData_IMap(s, map: dict) -> None:
+		assert isinstance(map, dict)
+		for k, v in map.items():
+			if not isinstance(k, int) or k < 0:
+				raise ChainpackTypeException('k.type != Type.UInt')
+			s.writeData_UInt(k)
+			s.write(v)
+		s._out.append(TI_TERMINATION)
+
+	def writeData_Map(s, map: dict) -> None:
+		assert isinstance(map, dict)
+		for k, v in map.items():
+			assert isinstance(k, str)
+			s.writeData_String(k)
+			s.write(v)
+		s._out.append(TI_TERMINATION)
+
+	def writeData_UInt(s, num):
+		if 0 <= num < 128:
+			#// one byte varint
+			s._out.append(num)
+			return
+		assert num >= 0
+		bit_len = num.bit_length()
+		if bit_len > s.UINT_BYTES_MAX * 8:
+			raise ChainpackException("writeData_UInt: value too big to pack!")
+		s.writeData_int_helper(num, bit_len)
+
+	def writeData_Int(s, snum):
+		if -64 < snum < 64:
+			#// one byte varint, sign is bit 6
+			s._out.append(snum if snum >= 0 else 64 - snum)
+			return
+		num = -snum if snum < 0 else snum
+		bitlen = num.bit_length() + 1
+		if snum < 0:
+			num |= 1 << ChainPackProtocol.expand_bit_len(bitlen)
+		s.writeData_int_helper(num, bitlen)
+
+	def writeData_int_helper(s, num, bit_len: int):
+		byte_cnt = BYTES_NEEDED[bit_len] if bit_len < len(BYTES_NEEDED) else ChainPackProtocol.bytes_needed(bit_len)
+		out = s._out
+		head_pos = len(out)
+		out += num.to_bytes(byte_cnt, 'big')
+		if (bit_len <= 28):
+			mask = (0xf0 << (4 - byte_cnt)) & 255
+			out[head_pos] = (out[head_pos] & ~mask & 255) | ((mask << 1) & 255)
+		else:
+			out[head_pos] = 0xf0 | (byte_cnt - 5)
+
+	def writeData_Array(s, val):
+		assert isinstance(val, RpcValueArray)
+		v = val._value
+		t = val.element_type
+		s.writeData_UInt(len(v))
+		if val.isTyped():
+			s.writeArray(t, v)
+			return
+		for i in v:
+			assert i._type == t
+		if t in RpcValueArray.TYPECODES:
+			s.writeArray(t, [i._value for i in v])
+		else:
+			for i in v:
+				s.writeData(i)
+
+	def writeArray(s, item_type: Type, v):
+		"""writes items of Double, Int, UInt or Bool Array data in bulk, v is sequence of numbers"""
+		out = s._out
+		if item_type == Type.Double:
+			if numpy is not None and isinstance(v, numpy.ndarray):
+				out += v.astype('>f8').tobytes()
+			else:
+				out += struct.pack('!%dd' % len(v), *v)
+		elif item_type == Type.Bool:
+			out += bytes([1 if b else 0 for b in v])
+		elif item_type == Type.UInt:
+			for n in v:
+				if 0 <= n < 128:
+					out.append(n)
+				else:
+					s.writeData_UInt(int(n))
+		elif item_type == Type.Int:
+			for n in v:
+				if -64 < n < 64:
+					out.append(n if n >= 0 else (-n | 64))
+				else:
+					s.writeData_Int(int(n))
+		else:
+			raise ChainpackTypeException("Cannot write typed array of type: " + str(item_type))
+
+	def writeData_Decimal(s, d: DecimalValue):
+		s.writeData_Int(d.mantissa)
+		s.writeData_Int(-d.exponent)
+
+
+VALUE_WRITERS = {
+	Type.Null: ChainPackWriter.writeValue_Null,
+	Type.Bool: ChainPackWriter.writeValue_Bool,
+	Type.UInt: ChainPackWriter.writeValue_UInt,
+	Type.Int: ChainPackWriter.writeValue_Int,
+	Type.Double: ChainPackWriter.writeValue_Double,
+	Type.DateTime: ChainPackWriter.writeValue_DateTime,
+	Type.String: ChainPackWriter.writeValue_String,
+	Type.Blob: ChainPackWriter.writeValue_Blob,
+	Type.List: ChainPackWriter.writeValue_List,
+	Type.Array: ChainPackWriter.writeValue_Array,
+	Type.Map: ChainPackWriter.writeValue_Map,
+	Type.IMap: ChainPackWriter.writeValue_IMap,
+	Type.Decimal: ChainPackWriter.writeValue_Decimal,
+}
+
+DATA_WRITERS = {
+	Type.Null: lambda w, val: None,
+	Type.Bool: lambda w, val: w._out.append(1 if val._value else 0),
+	Type.UInt: lambda w, val: w.writeData_UInt(val._value),
+	Type.Int: lambda w, val: w.writeData_Int(val._value),
+	Type.Double: lambda w, val: w._out.extend(DOUBLE_STRUCT.pack(val._value)),
+	Type.DateTime: lambda w, val: w.write_DateTime(val._value),
+	Type.String: lambda w, val: w.writeData_String(val._value),
+	Type.Blob: lambda w, val: w.write_Blob(val._value),
+	Type.List: lambda w, val: w.writeData_List(val._value),
+	Type.Array: ChainPackWriter.writeData_Array,
+	Type.Map: lambda w, val: w.writeData_Map(val._value),
+	Type.IMap: lambda w, val: w.writeData_IMap(val._value),
+	Type.Decimal: lambda w, val: w.writeData_Decimal(val._value),
+}
+
+
+class ChainPackStreamWriter(ChainPackWriter):
+	"""
+	ChainPackWriter flushing encoded data to sink whenever they grow over chunk_size,
+	sink is a file like object with write(), a socket with sendall() or a callable,
+	huge containers can be written item by item with bounded memory
+	"""
+	def __init__(s, sink, chunk_size: int = 1 << 16):
+		super().__init__()
+		if hasattr(sink, 'sendall'):
+			s._sink = sink.sendall
+		elif hasattr(sink, 'write'):
+			s._sink = sink.write
+		else:
+			s._sink = sink
+		s.chunk_size = chunk_size
+
+	def flush(s):
+		if len(s._out):
+			s._sink(bytes(s._out))
+			s.reset()
+
+	def flushIfFull(s):
+		if len(s._out) >= s.chunk_size:
+			s.flush()
+
+	def writeListElement(s, val):
+		super().writeListElement(val)
+		s.flushIfFull()
+
+	def writeMapElement(s, key, val):
+		super().writeMapElement(key, val)
+		s.flushIfFull()
+
+	def writeArrayElement(s, val: RpcValue):
+		super().writeArrayElement(val)
+		s.flushIfFull()
+
+	def writeContainer(s, container_type: Type, items, metadata: MetaData = None):
+		"""writes List from iterable of values or Map/IMap from iterable of (key, value) pairs"""
+		s.writeContainerBegin(container_type, metadata)
+		if container_type == Type.List:
+			for i in items:
+				s.writeListElement(i)
+		else:
+			for k, v in items:
+				s.writeMapElement(k, v)
+		s.writeContainerEnd()
+		s.flush()
+
+
+def iterencode(container_type: Type, items, metadata: MetaData = None, chunk_size: int = 1 << 16):
+	"""
+	generator of packed List (items is iterable of values) or Map/IMap (items is iterable of (key, value) pairs)
+	yielding chunks of about chunk_size bytes, joined chunks are the same as ChainPackProtocol.write() output
+	"""
+	w = ChainPackWriter()
+	w.writeContainerBegin(container_type, metadata)
+	is_list = container_type == Type.List
+	for i in items:
+		if is_list:
+			w.writeListElement(i)
+		else:
+			w.writeMapElement(*i)
+		if len(w) >= chunk_size:
+			yield bytes(w.data())
+			w.reset()
+	w.writeContainerEnd()
+	yield bytes(w.data())
+
+
+def uintDataSize(num: int) -> int:
+	"""number of bytes of UInt data of num"""
+	if num < 128:
+		return 1
+	bit_len = num.bit_length()
+	return BYTES_NEEDED[bit_len] if bit_len < len(BYTES_NEEDED) else ChainPackProtocol.bytes_needed(bit_len)
+
+def intDataSize(snum: int) -> int:
+	"""number of bytes of Int data of snum"""
+	if -64 < snum < 64:
+		return 1
+	bit_len = (-snum if snum < 0 else snum).bit_length() + 1
+	return BYTES_NEEDED[bit_len] if bit_len < len(BYTES_NEEDED) else ChainPackProtocol.bytes_needed(bit_len)
+
+if hasattr(str, 'isascii'):
+	def stringDataSize(v: str) -> int:
+		#// length of ASCII string is known without encoding it
+		n = len(v) if v.isascii() else len(v.encode('utf-8'))
+		return uintDataSize(n) + n
+else:
+	#// python < 3.7
+	def stringDataSize(v: str) -> int:
+		n = len(v.encode('utf-8'))
+		return uintDataSize(n) + n
+
+def blobDataSize(b) -> int:
+	return uintDataSize(len(b)) + len(b)
+
+def decimalDataSize(d: DecimalValue) -> int:
+	return intDataSize(d.mantissa) + intDataSize(-d.exponent)
+
+def dateTimeDataSize(v) -> int:
+	return intDataSize(ChainPackWriter.dateTimeData(*dateTimeEpochMsec(v)))
+
+def metaDataSize(md: MetaData) -> int:
+	if not len(md):
+		return 0
+	return 1 + imapDataSize({k: v if isinstance(v, RpcValue) else RpcValue(v) for k, v in md.items()})
+
+def listDataSize(v: list) -> int:
+	n = 1
+	for i in v:
+		n += valueSize(i)
+	return n
+
+def mapDataSize(map: dict) -> int:
+	n = 1
+	for k, v in map.items():
+		n += stringDataSize(k) + valueSize(v)
+	return n
+
+def imapDataSize(map: dict) -> int:
+	n = 1
+	for k, v in map.items():
+		n += uintDataSize(k) + valueSize(v)
+	return n
+
+def arrayDataSize(val) -> int:
+	v = val._value
+	t = val.element_type
+	n = uintDataSize(len(v))
+	if not val.isTyped() and t in RpcValueArray.TYPECODES:
+		v = [i._value for i in v]
+	elif not val.isTyped():
+		for i in v:
+			n += DATA_SIZES[t](i)
+		return n
+	return n + typedArrayDataSize(t, v)
+
+def typedArrayDataSize(item_type: Type, v) -> int:
+	"""size of Double, Int, UInt or Bool Array items as written by ChainPackWriter.writeArray()"""
+	if item_type == Type.Double:
+		return 8 * len(v)
+	if item_type == Type.Bool:
+		return len(v)
+	if item_type == Type.UInt:
+		return sum(1 if 0 <= n < 128 else uintDataSize(int(n)) for n in v)
+	if item_type == Type.Int:
+		return sum(1 if -64 < n < 64 else intDataSize(int(n)) for n in v)
+	raise ChainpackTypeException("Cannot write typed array of type: " + str(item_type))
+
+def valueSize(value: RpcValue) -> int:
+	"""the same as len() of ChainPackWriter.write() output"""
+	if type(value) is FrozenRpcValue and value._packed is not None:
+		return len(value._packed)
+	fn = VALUE_SIZES.get(value._type)
+	if fn is None:
+		if(not value.isValid()):
+			raise ChainpackTypeException("Cannot serialize invalid ChainPack.")
+		raise ChainpackTypeException("Internal error: attempt to write metatype directly")
+	if value._metaData:
+		return metaDataSize(value._metaData) + fn(value)
+	return fn(value)
+
+#// sizes of values including type byte
+VALUE_SIZES = {
+	Type.Null: lambda val: 1,
+	Type.Bool: lambda val: 1,
+	Type.UInt: lambda val: 1 if 0 <= val._value < 64 else 1 + uintDataSize(val._value),
+	Type.Int: lambda val: 1 if 0 <= val._value < 64 else 1 + intDataSize(val._value),
+	Type.Double: lambda val: 9,
+	Type.DateTime: lambda val: 1 + dateTimeDataSize(val._value),
+	Type.String: lambda val: 1 + stringDataSize(val._value),
+	Type.Blob: lambda val: 1 + blobDataSize(val._value),
+	Type.List: lambda val: 1 + listDataSize(val._value),
+	Type.Array: lambda val: 1 + arrayDataSize(val),
+	Type.Map: lambda val: 1 + mapDataSize(val._value),
+	Type.IMap: lambda val: 1 + imapDataSize(val._value),
+	Type.Decimal: lambda val: 1 + decimalDataSize(val._value),
+}
+
+#// sizes of Array items data
+DATA_SIZES = {
+	Type.Null: lambda val: 0,
+	Type.Bool: lambda val: 1,
+	Type.UInt: lambda val: uintDataSize(val._value),
+	Type.Int: lambda val: intDataSize(val._value),
+	Type.Double: lambda val: 8,
+	Type.DateTime: lambda val: dateTimeDataSize(val._value),
+	Type.String: lambda val: stringDataSize(val._value),
+	Type.Blob: lambda val: blobDataSize(val._value),
+	Type.List: lambda val: listDataSize(val._value),
+	Type.Array: lambda val: arrayDataSize(val),
+	Type.Map: lambda val: mapDataSize(val._value),
+	Type.IMap: lambda val: imapDataSize(val._value),
+	Type.Decimal: lambda val: decimalDataSize(val._value),
+}
+
+def pythonSize(v) -> int:
+	"""the same as len() of ChainPackWriter.writePython() output"""
+	t = type(v)
+	if t is int:
+		return 1 if 0 <= v < 64 else 1 + intDataSize(v)
+	if t is str:
+		return 1 + stringDataSize(v)
+	if t is float:
+		return 9
+	if t is bool or v is None:
+		return 1
+	if t is dict:
+		n = 2
+		for k, i in v.items():
+			if type(k) is not str:
+				raise ChainpackTypeException("Map key must be str, got: %s, use imap for UInt keys" % repr(k))
+			n += stringDataSize(k) + pythonSize(i)
+		return n
+	if t is list or t is tuple:
+		n = 2
+		for i in v:
+			n += pythonSize(i)
+		return n
+	if t is uint:
+		return 1 if v < 64 else 1 + uintDataSize(v)
+	if t is imap:
+		n = 2
+		for k, i in v.items():
+			if not isinstance(k, int) or k < 0:
+				raise ChainpackTypeException("IMap key must be non negative int, got: %s" % repr(k))
+			n += uintDataSize(k) + pythonSize(i)
+		return n
+	if t is bytes or t is bytearray:
+		return 1 + blobDataSize(v)
+	if isinstance(v, (datetime, UtcAndTz, DateTimeMsec)):
+		return 1 + dateTimeDataSize(v)
+	if t is DecimalValue:
+		return 1 + decimalDataSize(v)
+	if isinstance(v, decimal.Decimal):
+		return 1 + decimalDataSize(DecimalValue.fromDecimal(v))
+	if isinstance(v, RpcValue):
+		return valueSize(v)
+	if isinstance(v, array.array) or (numpy is not None and isinstance(v, numpy.ndarray)):
+		item_type = ChainPackWriter.typedArrayItemType(v)
+		return 1 + uintDataSize(len(v)) + typedArrayDataSize(item_type, v)
+	#// subclasses and registered encoders, the value is encoded to get its size
+	return ChainPackWriter().writePython(v)
+
+def packed_size(value) -> int:
+	"""
+	exact length of ChainPack data of RpcValue or native python value computed without encoding it,
+	so frame length can be written before the message and checked against size limits
+	"""
+	return pythonSize(value)
+
+
+def skip(buf, pos: int = 0) -> int:
+	"""returns position behind the value packed in buf at pos without decoding it"""
+	r = ChainPackReader(buf, pos)
+	try:
+		r.skip()
+		return r.pos()
+	finally:
+		r.release()
+
+def scan(buf, pos: int = 0) -> ScanInfo:
+	"""returns type, byte range and children count of the value packed in buf at pos without decoding it"""
+	r = ChainPackReader(buf, pos)
+	try:
+		return r.scan()
+	finally:
+		r.release()
+
+class _PushFrame():
+	"""container being decoded by ChainPackPushParser"""
+	__slots__ = ('type_info', 'value', 'key', 'metadata', 'item_type_info', 'remaining')
+
+	def __init__(s, type_info: TypeInfo, value, metadata, item_type_info = None, remaining = 0):
+		s.type_info = type_info
+		s.value = value
+		s.key = None
+		s.metadata = metadata
+		s.item_type_info = item_type_info
+		s.remaining = remaining
+
+
+class ChainPackPushParser():
+	"""
+	resumable ChainPack decoder fed by chunks of data, partially decoded containers are kept
+	on explicit stack between feed() calls, so consumed bytes are never parsed again,
+	feed() returns all the top level values completed by the fed data
+	"""
+	def __init__(s, typed_arrays: bool = False, datetime_msec: bool = False):
+		s._buf = bytearray()
+		s._stack = []
+		s._metadata = None
+		s.typed_arrays = typed_arrays
+		s.datetime_msec = datetime_msec
+
+	def isIdle(s) -> bool:
+		"""True if there is no partially received value"""
+		return not s._buf and not s._stack and s._metadata is None
+
+	def feed(s, data) -> list:
+		s._buf += data
+		ret = []
+		r = ChainPackReader(s._buf, 0, s.typed_arrays, s.datetime_msec)
+		try:
+			while r._pos < len(s._buf):
+				start = r._pos
+				try:
+					s._parseToken(r, ret)
+				except ChainpackDeserializationException:
+					#// token is not complete yet, wait for more data
+					r._pos = start
+					break
+		finally:
+			consumed = r._pos
+			r.release()
+		del s._buf[:consumed]
+		return ret
+
+	def _parseToken(s, r: ChainPackReader, out: list):
+		"""parses one token, parser state is changed only after the whole token is read"""
+		top = s._stack[-1] if s._stack else None
+		if top is not None:
+			t = top.type_info
+			if t == TI_MAP or t == TI_IMAP or t == TI_META_IMAP:
+				if top.key is None:
+					if r.peek() == TI_TERMINATION:
+						r._pos += 1
+						s._finish(out)
+					else:
+						top.key = r.readData_MapKey() if t == TI_MAP else r.readData_UInt()
+					return
+			elif t == TI_LIST:
+				if r.peek() == TI_TERMINATION:
+					r._pos += 1
+					s._finish(out)
+					return
+			else:
+				top.value.append(r.readData(top.item_type_info, False))
+				top.remaining -= 1
+				if top.remaining == 0:
+					s._finish(out)
+				return
+		t = r.get()
+		if t < 128:
+			s._emit(TINY_INT_VALUES[t & 63] if t & 64 else TINY_UINT_VALUES[t], out)
+		elif t == TI_TRUE:
+			s._emit(TRUE_VALUE, out)
+		elif t == TI_FALSE:
+			s._emit(FALSE_VALUE, out)
+		elif t in (TI_LIST, TI_MAP, TI_IMAP, TI_META_IMAP):
+			s._push(_PushFrame(t, [] if t == TI_LIST else {}, s._metadata))
+		elif t & ARRAY_FLAG_MASK:
+			item_type_info = t & ~ARRAY_FLAG_MASK
+			if item_type_info == TI_DOUBLE or item_type_info == TI_BOOL:
+				#// fixed size items, complete array is checked in O(1)
+				s._emit(r.readData(item_type_info, True), out)
+				return
+			size = r.readData_UInt()
+			frame = _PushFrame(t, [], s._metadata, item_type_info, size)
+			s._push(frame)
+			if size == 0:
+				s._finish(out)
+		else:
+			s._emit(r.readData(t, False), out)
+
+	def _push(s, frame: _PushFrame):
+		s._metadata = None
+		s._stack.append(frame)
+
+	def _finish(s, out: list):
+		frame = s._stack.pop()
+		t = frame.type_info
+		metadata = frame.metadata
+		if t == TI_META_IMAP:
+			if metadata is None:
+				metadata = MetaData()
+			metadata.update(frame.value)
+			s._metadata = metadata
+			return
+		if t == TI_LIST:
+			v = RpcValue.trusted(frame.value, Type.List)
+		elif t == TI_MAP:
+			v = RpcValue.trusted(frame.value, Type.Map)
+		elif t == TI_IMAP:
+			v = RpcValue.trusted(frame.value, Type.IMap)
+		else:
+			item_type = typeInfoToType(frame.item_type_info)
+			v = None
+			if s.typed_arrays and item_type in RpcValueArray.TYPECODES:
+				try:
+					v = RpcValueArray(item_type, array.array(RpcValueArray.TYPECODES[item_type][0], [i._value for i in frame.value]))
+				except OverflowError:
+					pass
+			if v is None:
+				v = RpcValueArray(item_type)
+				v._value = frame.value
+		s._metadata = metadata
+		s._emit(v, out)
+
+	def _emit(s, v: RpcValue, out: list):
+		if s._metadata:
+			if isinstance(v, ConstRpcValue):
+				v = RpcValue.trusted(v._value, v._type)
+			v._metaData = s._metadata
+		s._metadata = None
+		if not s._stack:
+			out.append(v)
+			return
+		top = s._stack[-1]
+		if top.key is None:
+			top.value.append(v)
+		else:
+			top.value[top.key] = v
+			top.key = None
+
+
+def dumps(obj) -> bytes:
+	"""packs native python value, see ChainPackWriter.writePython()"""
+	w = ChainPackWriter()
+	w.writePython(obj)
+	return bytes(w.data())
+
+def loads(buf, pos: int = 0, datetime_msec: bool = False):
+	"""unpacks value from buf at pos directly into native python value, see ChainPackReader.readPython()"""
+	r = ChainPackReader(buf, pos, datetime_msec=datetime_msec)
+	try:
+		return r.readPython()
+	finally:
+		r.release()
+
+def read(buf, pos: int = 0, lazy: bool = False, typed_arrays: bool = False, datetime_msec: bool = False):
+	"""
+	decodes one value from buf starting at pos, returns (value, new_pos), buf is left untouched
+	the same as C++ CponProtocol::read(in, pos, new_pos)
+	lazy read returns containers as LazyRpcValue views, buf must not be modified while they are in use
+	typed_arrays decodes Double, Int, UInt and Bool Arrays into array.array
+	datetime_msec decodes DateTime into DateTimeMsec
+	"""
+	r = ChainPackReader(buf, pos, typed_arrays, datetime_msec)
+	if lazy:
+		return r.readLazy(), r.pos()
+	try:
+		return r.read(), r.pos()
+	finally:
+		r.release()
 
 
 class RpcValueArray(RpcValue):
+	"""
+	Array of values of the same type, value is list of RpcValue or, for Double, Int, UInt and Bool,
+	it can be also typed buffer, array.array or numpy.ndarray of plain numbers
+	"""
+	TYPECODES = {
+		Type.Double: ('d', 'f'),
+		Type.Int: ('q', 'l', 'i', 'h', 'b'),
+		Type.UInt: ('Q', 'L', 'I', 'H', 'B'),
+		Type.Bool: ('B', 'b'),
+	}
+	NUMPY_KINDS = {Type.Double: 'f', Type.Int: 'iu', Type.UInt: 'u', Type.Bool: 'b'}
+	NUMPY_DTYPES = {Type.Double: 'float64', Type.Int: 'int64', Type.UInt: 'uint64', Type.Bool: 'bool'}
+	__slots__ = ('element_type',)
+
 	def __init__(s, element_type, value = None):
 		s.element_type = element_type
-		if value == None:
-			value = []
-		super().__init__(value, Type.Array)
+		if isinstance(value, array.array):
+			if value.typecode not in s.TYPECODES.get(element_type, ()):
+				raise ChainpackTypeException("array typecode %s does not match element type %s" % (value.typecode, element_type))
+		elif numpy is not None and isinstance(value, numpy.ndarray):
+			if value.ndim != 1 or value.dtype.kind not in s.NUMPY_KINDS.get(element_type, ''):
+				raise ChainpackTypeException("numpy array %s does not match element type %s" % (value.dtype, element_type))
+		else:
+			if value is None:
+				value = []
+			super().__init__(value, Type.Array)
+			return
+		s._value = value
+		s._type = Type.Array
+		s._metaData = EMPTY_META_DATA
+
+	def isTyped(s) -> bool:
+		return not isinstance(s._value, list)
+
+	def toPython(s):
+		if s.isTyped():
+			if s.element_type == Type.Bool:
+				return [bool(i) for i in s._value]
+			return s._value.tolist()
+		return super().toPython()
+
+	def toEpochMsecs(s) -> list:
+		"""returns items of DateTime Array as msecs since 1970-01-01 UTC"""
+		if s.element_type != Type.DateTime:
+			raise ChainpackTypeException("Array of type %s is not DateTime Array" % s.element_type)
+		ret = []
+		for i in s._value:
+			v = i._value
+			if isinstance(v, DateTimeMsec):
+				ret.append(v.msec)
+			else:
+				ret.append(datetimeToEpochMsec(v.dt if isinstance(v, UtcAndTz) else v))
+		return ret
+
+	def toMantissasAndExponents(s):
+		"""returns items of Decimal Array as (list of mantissas, list of exponents)"""
+		if s.element_type != Type.Decimal:
+			raise ChainpackTypeException("Array of type %s is not Decimal Array" % s.element_type)
+		values = [i._value for i in s._value]
+		return [d.mantissa for d in values], [d.exponent for d in values]
+
+	def toNumpy(s):
+		"""
+		returns items as numpy array, typed array.array is exported without copying,
+		DateTime Array is returned as datetime64[ms] array,
+		Decimal Array as float64 array computed from mantissas and exponents in bulk
+		"""
+		if numpy is None:
+			raise ChainpackException("numpy is not installed")
+		if s.element_type == Type.DateTime:
+			return epochMsecsToDateTimes(numpy.array(s.toEpochMsecs(), dtype='int64'))
+		if s.element_type == Type.Decimal:
+			mantissas, exponents = s.toMantissasAndExponents()
+			return numpy.array(mantissas, dtype='float64') * numpy.power(10.0, numpy.array(exponents, dtype='float64'))
+		dtype = s.NUMPY_DTYPES.get(s.element_type)
+		if dtype is None:
+			raise ChainpackTypeException("Cannot export Array of type %s to numpy" % s.element_type)
+		if isinstance(s._value, numpy.ndarray):
+			return s._value
+		if isinstance(s._value, array.array) and numpy.dtype(dtype).itemsize == s._value.itemsize:
+			return numpy.frombuffer(s._value, dtype=dtype)
+		return numpy.array(s.toPython(), dtype=dtype)
+
+	def __eq__(s, x):
+		return isinstance(x, RpcValueArray) and s.element_type == x.element_type and s._metaData == x._metaData and s.toPython() == x.toPython()
 
 	def assertEquals(s, x):
 		assert s.element_type == x.element_type
-		super().assertEquals(x)
+		assert s._metaData == x._metaData
+		assert s.toPython() == x.toPython()
+
+
+
+class LazyRpcValue(RpcValue):
+	"""
+	RpcValue view of encoded List, Map or IMap, offsets of the children are recorded in one scan
+	and every child is decoded first time it is reached by value, [], toPython() or iteration
+	"""
+	__slots__ = ('_reader', '_start', '_ranges', '_keys', '_children', '_decoded')
+
+	def __init__(s, reader: 'ChainPackReader', type_info: TypeInfo, pos: int, metadata: MetaData):
+		s._reader = reader
+		s._type = typeInfoToType(type_info)
+		s._metaData = metadata
+		s._start = pos
+		s._ranges = None
+		s._keys = None
+		s._children = None
+		s._decoded = None
+
+	def _scan(s) -> int:
+		"""records (start, end) of every child and returns position behind the container"""
+		r = s._reader.at(s._start)
+		ranges = []
+		keys = {}
+		while r.peek() != TI_TERMINATION:
+			if s._type == Type.Map:
+				keys[r.readData_MapKey()] = len(ranges)
+			elif s._type == Type.IMap:
+				keys[r.readData_UInt()] = len(ranges)
+			start = r.pos()
+			r.skip()
+			ranges.append((start, r.pos()))
+		s._ranges = ranges
+		s._keys = keys
+		s._children = [None] * len(ranges)
+		return r.pos() + 1
+
+	def _child(s, i: int) -> RpcValue:
+		c = s._children[i]
+		if c is None:
+			start, end = s._ranges[i]
+			c = s._reader.at(start)._readLazy(end)
+			s._children[i] = c
+		return c
+
+	@property
+	def _value(s):
+		if s._decoded is None:
+			if s._ranges is None:
+				s._scan()
+			if s._type == Type.List:
+				s._decoded = [s._child(i) for i in range(len(s._ranges))]
+			else:
+				s._decoded = {k: s._child(i) for k, i in s._keys.items()}
+		return s._decoded
+
+	def __len__(s):
+		if s._decoded is not None:
+			return len(s._decoded)
+		if s._ranges is None:
+			s._scan()
+		return len(s._ranges)
+
+	def __getitem__(s, key):
+		if s._decoded is not None or isinstance(key, slice):
+			return s._value[key]
+		if s._ranges is None:
+			s._scan()
+		if s._type == Type.List:
+			if not -len(s._ranges) <= key < len(s._ranges):
+				raise IndexError("list index out of range")
+			return s._child(key % len(s._ranges))
+		return s._child(s._keys[key])
+
+	def __iter__(s):
+		if s._decoded is not None:
+			return iter(s._decoded)
+		if s._ranges is None:
+			s._scan()
+		if s._type == Type.List:
+			return (s._child(i) for i in range(len(s._ranges)))
+		return iter(list(s._keys))
+
+
+def _readonly(s, *args, **kwargs):
+	raise ChainpackException("frozen value cannot be modified")
+
+class FrozenList(list):
+	"""List value of FrozenRpcValue"""
+	__slots__ = ()
+	append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+	__setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+
+class FrozenDict(dict):
+	"""Map and IMap value of FrozenRpcValue"""
+	__slots__ = ()
+	pop = popitem = setdefault = update = clear = _readonly
+	__setitem__ = __delitem__ = __ior__ = _readonly
+
+class FrozenRpcValue(RpcValue):
+	"""
+	immutable and hashable RpcValue, children are frozen too, Array items are copied,
+	packed data are cached by the first write, ChainPackWriter copies the cached data
+	instead of encoding the value again, also when the value is nested in other values
+	config = FrozenRpcValue({"devices": [...]})
+	for peer in peers:
+		peer.sendResponse(rq_id, config)
+	"""
+	__slots__ = ('_packed', '_hash')
 
+	def __init__(s, value, t = None):
+		if isinstance(value, RpcValueArray):
+			raise ChainpackTypeException("Array can be frozen only as item of other value")
+		if not isinstance(value, RpcValue):
+			value = RpcValue(value, t)
+		s._type = value._type
+		s._value = s._freezeData(value)
+		s._metaData = s._freezeMetaData(value._metaData)
+		s._packed = None
+		s._hash = None
+
+	@classmethod
+	def freeze(cls, value: RpcValue) -> RpcValue:
+		"""returns value itself if it is frozen already, RpcValueArray is copied"""
+		if type(value) is cls:
+			return value
+		if isinstance(value, RpcValueArray):
+			return cls._copyArray(value)
+		return cls(value)
+
+	@classmethod
+	def _freezeData(cls, value: RpcValue):
+		v = value._value
+		if value._type == Type.List:
+			return FrozenList(cls.freeze(i) for i in v)
+		if value._type in (Type.Map, Type.IMap):
+			return FrozenDict((k, cls.freeze(i)) for k, i in v.items())
+		if type(v) is bytearray:
+			return bytes(v)
+		return v
+
+	@classmethod
+	def _freezeMetaData(cls, md: MetaData) -> MetaData:
+		if not len(md):
+			return EMPTY_META_DATA
+		return FrozenMetaData({k: cls.freeze(v if isinstance(v, RpcValue) else RpcValue(v)) for k, v in md.items()})
+
+	@classmethod
+	def _copyArray(cls, value: 'RpcValueArray') -> 'RpcValueArray':
+		v = value._value
+		if isinstance(v, list):
+			v = FrozenList(cls.freeze(i) for i in v)
+		elif isinstance(v, array.array):
+			v = array.array(v.typecode, v)
+		else:
+			v = v.copy()
+			v.setflags(write=False)
+		ret = RpcValueArray.trusted(v, Type.Array, cls._freezeMetaData(value._metaData))
+		ret.element_type = value.element_type
+		return ret
+
+	def setMetaValue(s, tag, value):
+		raise ChainpackException("frozen RpcValue cannot be modified, copy it with RpcValue(value) first")
+
+	def packed(s) -> bytes:
+		"""packed data, they are encoded by the first call only"""
+		if s._packed is None:
+			w = _FrozenPackWriter()
+			w.writeFrozen(s)
+			s._packed = bytes(w.data())
+		return s._packed
+
+	def __eq__(s, x):
+		if type(x) is FrozenRpcValue and s._packed is not None and s._packed == x._packed:
+			return True
+		return super().__eq__(x)
+
+	def __hash__(s):
+		if s._hash is None:
+			s._hash = hash(_hashKey(s))
+		return s._hash
+
+def _hashKey(v: RpcValue):
+	"""hashable key of RpcValue, equal values have equal keys"""
+	t = v._type
+	if t == Type.List:
+		key = tuple(_hashKey(i) for i in v._value)
+	elif t in (Type.Map, Type.IMap):
+		key = frozenset((k, _hashKey(i)) for k, i in v._value.items())
+	elif t == Type.Array:
+		if v.element_type in RpcValueArray.TYPECODES:
+			key = (v.element_type, tuple(v.toPython()))
+		else:
+			key = (v.element_type, tuple(_hashKey(i) for i in v._value))
+	elif isinstance(v._value, UtcAndTz):
+		key = (v._value.dt, v._value.tz)
+	else:
+		key = v._value
+	if len(v._metaData):
+		return (t, key, frozenset((k, _hashKey(i)) for k, i in v._metaData.items()))
+	return (t, key)
+
+class _FrozenPackWriter(ChainPackWriter):
+	"""
+	packs FrozenRpcValue data, nested frozen values are copied only if they are packed already,
+	otherwise they are encoded without caching their own packed data
+	"""
+	def write(s, value: RpcValue) -> int:
+		if type(value) is FrozenRpcValue:
+			return s.writeFrozen(value)
+		return ChainPackWriter.write(s, value)
+
+	def writeFrozen(s, value: FrozenRpcValue) -> int:
+		if value._packed is not None:
+			s._out += value._packed
+			return len(value._packed)
+		out = s._out
+		start = len(out)
+		if value._metaData:
+			s.writeMetaData(value._metaData)
+		VALUE_WRITERS[value._type](s, value)
+		return len(out) - start
+
+
+class PackedValueCache():
+	"""
+	size bounded LRU of frozen copies of values looked up by identity, so packed data
+	of values re-sent without modification are reused, cached values must not be modified,
+	modified value has to be put() into cache again,
+	least recently used entries are dropped when there are more than max_size of them
+	or when their packed data take more than max_bytes
+	"""
+	def __init__(s, max_size: int = 1024, max_bytes: int = 64 << 20):
+		s.max_size = max_size
+		s.max_bytes = max_bytes
+		s._entries = collections.OrderedDict()
+		s._bytes = 0
+
+	def __len__(s):
+		return len(s._entries)
+
+	def __contains__(s, value):
+		return id(value) in s._entries
+
+	def clear(s):
+		s._entries.clear()
+		s._bytes = 0
+
+	def get(s, value) -> FrozenRpcValue:
+		"""returns frozen copy of value, it is created and packed when value is not in cache yet"""
+		e = s._entries.get(id(value))
+		#// entry keeps the value alive, so its id cannot be reused by other object
+		if e is not None and e[0] is value:
+			s._entries.move_to_end(id(value))
+			return e[1]
+		return s.put(value)
+
+	def put(s, value) -> FrozenRpcValue:
+		s.discard(value)
+		frozen = value if type(value) is FrozenRpcValue else FrozenRpcValue(value)
+		size = len(frozen.packed())
+		s._entries[id(value)] = (value, frozen, size)
+		s._bytes += size
+		while len(s._entries) > s.max_size or (s._bytes > s.max_bytes and len(s._entries) > 1):
+			k, (v, f, n) = s._entries.popitem(last=False)
+			s._bytes -= n
+		return frozen
+
+	def discard(s, value):
+		e = s._entries.pop(id(value), None)
+		if e is not None:
+			s._bytes -= e[2]
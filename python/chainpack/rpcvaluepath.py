@@ -0,0 +1,96 @@
+from rpcvalue import *
+
+
+class MetaTag(int):
+	"""path element addressing meta data tag of the current value instead of its content"""
+	def __repr__(s):
+		return "MetaTag(%d)" % s
+
+
+class RpcValuePath():
+	"""
+	compiled path to a sub-value of packed ChainPack data, every element is either
+	MetaTag, int (IMap key or List index) or str (Map key),
+	keys are packed once in constructor, so they are compared with the data without decoding it
+	RpcValuePath(MetaTag(meta.RpcMessage.Tag.ShvPath))
+	RpcValuePath(meta.RpcMessage.Key.Params, "device", "status")
+	"""
+	def __init__(s, *keys):
+		s.keys = keys
+		s._steps = []
+		for k in keys:
+			w = ChainPackWriter()
+			if isinstance(k, str):
+				w.writeData_String(k)
+			elif isinstance(k, int) and k >= 0:
+				w.writeData_UInt(k)
+			else:
+				raise ChainpackTypeException("invalid path element: %s" % repr(k))
+			s._steps.append((k, bytes(w.data())))
+
+	def __repr__(s):
+		return "RpcValuePath" + repr(s.keys)
+
+	def find(s, buf, pos: int = 0):
+		"""returns (start, end) of addressed value packed in buf at pos or None if there is no such value"""
+		r = ChainPackReader(buf, pos)
+		try:
+			for key, packed_key in s._steps:
+				if not s._descend(r, key, packed_key):
+					return None
+			start = r.pos()
+			r.skip()
+			return start, r.pos()
+		finally:
+			r.release()
+
+	def get(s, buf, pos: int = 0) -> RpcValue:
+		"""returns addressed value decoded or None if there is no such value"""
+		found = s.find(buf, pos)
+		if found is None:
+			return None
+		return read(buf, found[0])[0]
+
+	@staticmethod
+	def _findKey(r: ChainPackReader, packed_key: bytes, key_type_info: TypeInfo) -> bool:
+		"""moves reader to value of packed_key in Map or IMap data"""
+		size = len(packed_key)
+		while r.peek() != TI_TERMINATION:
+			p = r.pos()
+			if r._data[p:p + size] == packed_key:
+				r._pos = p + size
+				return True
+			r.skipData(key_type_info, False)
+			r.skip()
+		return False
+
+	def _descend(s, r: ChainPackReader, key, packed_key: bytes) -> bool:
+		if isinstance(key, MetaTag):
+			while r.peek() == TI_META_IMAP:
+				r._pos += 1
+				if s._findKey(r, packed_key, TI_UINT):
+					return True
+				r._pos += 1
+			return False
+		while r.peek() == TI_META_IMAP:
+			r._pos += 1
+			r.skipData(TI_IMAP, False)
+		t = r.get()
+		if t == TI_MAP and isinstance(key, str):
+			return s._findKey(r, packed_key, TI_STRING)
+		if t == TI_IMAP and isinstance(key, int):
+			return s._findKey(r, packed_key, TI_UINT)
+		if t == TI_LIST and isinstance(key, int):
+			for i in range(key):
+				if r.peek() == TI_TERMINATION:
+					return False
+				r.skip()
+			return r.peek() != TI_TERMINATION
+		return False
+
+
+def query(buf, path, pos: int = 0) -> RpcValue:
+	"""returns value addressed by path (RpcValuePath or tuple of keys) from buf packed at pos or None"""
+	if not isinstance(path, RpcValuePath):
+		path = RpcValuePath(*path)
+	return path.get(buf, pos)
@@ -28,22 +28,67 @@ class Client(RpcDriver):
 	def recv(s):
 		s.done = False
 		while True:
-			s.bytesRead(s.socket.recv(240000))
+			s.readInto()
 			if s.done:
 				return s.result
 
+	def readInto(s) -> int:
+		"""reads available data directly into driver receive buffer, returns 0 if connection is closed by peer"""
+		buf = s.getReadBuffer()
+		try:
+			n = s.socket.recv_into(buf)
+		finally:
+			buf.release()
+		s.readBufferUpdated(n)
+		return n
+
 	def writeBytes(s, b):
-		print ("writeBytes:", b)
-		s.socket.send(b)
+		log("writeBytes:", len(b), "bytes")
+		s.socket.sendall(b)
+
+	def writeChunks(s, chunks: list) -> int:
+		#// one syscall for all the queued frames, partial write is completed by next writeQueue() loop
+		return s.socket.sendmsg(chunks)
 
 	def onMessageReceived(s, msg: RpcMessage):
 		s.result = msg
 		print("message received:", s.result._value.toPython())
 		s.done = True
 
-	def callMethodSync(s, method: str, msg: RpcValue):
-		s.sendRequest(method, msg)
-		return s.recv()
+	def waitForCalls(s, calls):
+		"""reads responses until all the calls are finished, responses of other calls are dispatched as well"""
+		while not all(c.done for c in calls):
+			timeout = s.nextTimeout()
+			if timeout == 0:
+				#// settimeout(0) would make the socket non blocking
+				s.checkTimeouts()
+				continue
+			s.socket.settimeout(timeout)
+			try:
+				n = s.readInto()
+			except socket.timeout:
+				n = None
+			finally:
+				s.socket.settimeout(None)
+			if n == 0:
+				s.abortPendingCalls(ConnectionError("Connection closed by peer"))
+			s.checkTimeouts()
+
+	def callMethodSync(s, method: str, msg: RpcValue = None, timeout: int = None) -> RpcValue:
+		"""returns result of the call or raises RpcError, timeout is in msec, defaultRpcTimeout is used when it is None"""
+		call = s.callMethod(method, msg, timeout=timeout)
+		s.waitForCalls([call])
+		return call.result()
+
+	def callMethodsSync(s, calls, timeout: int = None) -> list:
+		"""
+		calls is iterable of (method, params), all the requests are sent before waiting for the first response,
+		so high latency link is kept busy, returns list of finished RpcPendingCall
+		"""
+		with s.writeBatch():
+			pending = [s.callMethod(method, params, timeout=timeout) for method, params in calls]
+		s.waitForCalls(pending)
+		return pending
 
 
 if __name__ == "__main__":
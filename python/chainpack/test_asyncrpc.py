@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pytest
+from asyncrpc import *
+
+
+async def _handler(conn, method, params):
+	if method == "echo":
+		return params
+	if method == "sleep":
+		await asyncio.sleep(params.value / 1000)
+		return params
+	if method == "fail":
+		raise RpcError(RpcResponse.ErrorType.InvalidParams, "bad params")
+	if method == "ping":
+		return True
+	if method == "flood":
+		for i in range(params.value):
+			conn.notify("chunk", RpcValue(bytes(256 << 10)))
+		return True
+	if method == "notifyMe":
+		conn.notify("chng", params)
+		return True
+	raise RpcError(RpcResponse.ErrorType.MethodNotFound, method)
+
+def testCall():
+	print("------------- AsyncRpcConnection")
+	async def run():
+		server = await serve(_handler)
+		port = server.sockets[0].getsockname()[1]
+		conn = await connect("127.0.0.1", port)
+		assert (await conn.call("echo", RpcValue({"a": 1}))).toPython() == {"a": 1}
+		#// responses are matched by request id, not by order
+		results = await asyncio.gather(conn.call("sleep", RpcValue(50)), conn.call("sleep", RpcValue(1)))
+		assert [r.value for r in results] == [50, 1]
+		with pytest.raises(RpcError) as e:
+			await conn.call("fail")
+		assert e.value.code == RpcResponse.ErrorType.InvalidParams and e.value.message == "bad params"
+		with pytest.raises(asyncio.TimeoutError):
+			await conn.call("sleep", RpcValue(500), timeout=50)
+		assert not conn.m_pendingCalls
+		received = []
+		conn.addNotifyCallback(lambda c, method, params: received.append((method, params.value)))
+		assert (await conn.call("notifyMe", RpcValue("x"))).value is True
+		assert received == [("chng", "x")]
+		conn.close()
+		await conn.closed()
+		with pytest.raises(ConnectionError):
+			await conn.call("echo")
+		server.close()
+		await server.wait_closed()
+	asyncio.run(run())
+
+def testManyConnections():
+	async def run():
+		server = await serve(_handler)
+		port = server.sockets[0].getsockname()[1]
+		conns = await asyncio.gather(*[connect("127.0.0.1", port) for i in range(200)])
+		results = await asyncio.gather(*[c.call("echo", RpcValue(i)) for i, c in enumerate(conns)])
+		assert [r.value for r in results] == list(range(200))
+		for c in conns:
+			c.close()
+		server.close()
+		await server.wait_closed()
+	asyncio.run(run())
+
+def testSendLanes():
+	async def run():
+		server_conns = []
+		server = await serve(_handler, on_connect=server_conns.append)
+		port = server.sockets[0].getsockname()[1]
+		conn = await connect("127.0.0.1", port)
+		chunks = []
+		conn.addNotifyCallback(lambda c, method, params: chunks.append(method))
+		pong = []
+		flood = asyncio.ensure_future(conn.call("flood", RpcValue(20)))
+		await asyncio.sleep(0)
+		conn.callMethod("ping", callback=lambda call: pong.append(len(chunks)))
+		assert (await flood).value is True
+		while not pong or len(chunks) < 20:
+			await asyncio.sleep(0.01)
+		#// ping response is not queued behind bulk notifications
+		assert pong[0] < 20
+		#// bulk frames wait in driver lane, not in transport buffer, so control frame overtakes all of them
+		srv = server_conns[0]
+		received = []
+		conn.addNotifyCallback(lambda c, method, params: received.append(method))
+		for i in range(80):
+			srv.notify("bulk", RpcValue(bytes(256 << 10)))
+		await asyncio.sleep(0)
+		#// one frame passed to transport can exceed MAX_WRITE_BYTES alone
+		assert srv.m_transport.get_write_buffer_size() <= srv.MAX_WRITE_BYTES + (257 << 10)
+		pending = srv.queuedFrames(RpcDriver.Lane.Bulk)
+		assert pending > 0
+		srv.notify("ctl", lane=RpcDriver.Lane.Control)
+		while len(received) < 81:
+			await asyncio.sleep(0.01)
+		assert received.index("ctl") == 80 - pending
+		conn.close()
+		server.close()
+		await server.wait_closed()
+	asyncio.run(run())
+
+#if pytest doesnt work
+if __name__ == "__main__":
+	testCall()
+	testManyConnections()
+	testSendLanes()
@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from benchmark import *
+
+def testCorpus():
+	print("------------- benchmark corpus")
+	a = corpus(seed=5, scale=0.01)
+	b = corpus(seed=5, scale=0.01)
+	assert list(a) == list(b)
+	for name in a:
+		assert bytes(ChainPackProtocol(a[name])) == bytes(ChainPackProtocol(b[name])), name
+		assert read(ChainPackProtocol(a[name]))[0] == a[name], name
+	assert RpcRequest(a['rpc_request']).isRequest()
+	assert RpcResponse(a['rpc_response']).isResponse()
+
+def testRunAndCompare(tmp_path):
+	lines = []
+	results = run(scale=0.01, min_time=0.001, repeat=1, filter="rpc_request", out=lines.append)
+	assert set(results) == {"encode/rpc_request", "decode/rpc_request", "toPython/rpc_request", "frame/rpc_request", "unframe/rpc_request"}
+	assert len(lines) == len(results)
+	path = str(tmp_path / "baseline.json")
+	save(results, path)
+	baseline = load(path)
+	assert compare(results, baseline, out=lines.append) == []
+	baseline["encode/rpc_request"]["sec"] /= 2
+	assert compare(results, baseline, out=lines.append) == ["encode/rpc_request"]
+
+#if pytest doesnt work
+if __name__ == "__main__":
+	testCorpus()
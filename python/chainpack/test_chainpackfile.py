@@ -0,0 +1,51 @@
+import os
+
+from chainpackfile import *
+
+
+def testChainPackFile(tmp_path):
+	print("------------- ChainPackFile")
+	path = str(tmp_path / "records.chpk")
+	values = [RpcValue(i) for i in range(100)] + [RpcValue({"a": RpcValue([1, 2, "x" * 300])}), RpcValue(None)]
+	with open(path, 'wb') as f:
+		for v in values:
+			f.write(ChainPackProtocol(v))
+	with ChainPackFile(path) as f:
+		assert len(f) == len(values)
+		assert list(f) == values
+		assert f[-2] == values[-2]
+		assert f.raw(100) == ChainPackProtocol(values[100])
+	assert os.path.exists(path + ChainPackFile.INDEX_SUFFIX)
+	with ChainPackFile(path) as f:
+		#// index is loaded, not rebuilt
+		assert f._loadIndex() is not None
+		assert f[55] == RpcValue(55)
+	with open(path, 'ab') as f:
+		f.write(ChainPackProtocol(RpcValue("tail")))
+	with ChainPackFile(path) as f:
+		#// stale index is rebuilt
+		assert len(f) == len(values) + 1
+		assert f[-1] == RpcValue("tail")
+	empty = str(tmp_path / "empty.chpk")
+	open(empty, 'wb').close()
+	with ChainPackFile(empty) as f:
+		assert len(f) == 0 and list(f) == []
+	#// incomplete record being appended is not included
+	with open(path, 'ab') as f:
+		f.write(ChainPackProtocol(RpcValue("partial record"))[:5])
+	for i in range(2):
+		#// the second pass loads saved index
+		with ChainPackFile(path) as f:
+			assert len(f) == len(values) + 1
+			assert f[-1] == RpcValue("tail") and list(f)[-1] == RpcValue("tail")
+			assert f.raw(-1) == ChainPackProtocol(RpcValue("tail"))
+	#// index which cannot be written is kept in memory
+	with ChainPackFile(path, index_path=str(tmp_path / "missing" / "records.idx")) as f:
+		assert len(f) == len(values) + 1
+
+
+#if pytest doesnt work
+if __name__ == "__main__":
+	import tempfile, pathlib
+	with tempfile.TemporaryDirectory() as d:
+		testChainPackFile(pathlib.Path(d))
@@ -0,0 +1,45 @@
+import os
+import pytest
+
+from historylog import *
+
+
+def testHistoryLog(tmp_path):
+	print("------------- HistoryLog")
+	d = str(tmp_path / "history")
+	t0 = 1600000000000
+	with HistoryLog(d, segment_size=2000, index_interval=200) as log:
+		for i in range(500):
+			log.append(t0 + i * 1000, "node/%d" % (i % 5), i)
+		with pytest.raises(ChainpackException):
+			log.append(t0, "late", 0)
+		assert log.segmentCount() > 3
+		recs = list(log.query(t0 + 100 * 1000, t0 + 110 * 1000))
+		assert [r.value[2].value for r in recs] == list(range(100, 110))
+		assert recs[0].value[0].value == UtcAndTz(datetime.fromtimestamp((t0 + 100000) / 1000, timezone.utc))
+		assert len(list(log.query())) == 500
+		assert list(log.query(t0 + 1000 * 1000)) == []
+	#// reopen, append after incomplete record left by crash
+	last_seg = sorted(n for n in os.listdir(d) if n.endswith(HistoryLogSegment.DATA_SUFFIX))[-1]
+	with open(os.path.join(d, last_seg), 'ab') as f:
+		f.write(b'\x88\x8d')
+	os.remove(os.path.join(d, last_seg[:-len(HistoryLogSegment.DATA_SUFFIX)] + HistoryLogSegment.INDEX_SUFFIX))
+	with HistoryLog(d, segment_size=2000, index_interval=200) as log:
+		assert log.lastMsec() == t0 + 499 * 1000
+		log.append(UtcAndTz(datetime.fromtimestamp((t0 + 600000) / 1000, timezone.utc), 4), "tz", None)
+		recs = list(log.query(t0 + 450 * 1000))
+		assert len(recs) == 51
+		assert recs[-1].value[0].value.tz == 4
+		assert [r.value[2].value for r in log.query(t0 + 5 * 1000, t0 + 8 * 1000)] == [5, 6, 7]
+		assert [r.value[2].value for r in log.query(DateTimeMsec(t0 + 5 * 1000), DateTimeMsec(t0 + 8 * 1000, 4))] == [5, 6, 7]
+		log.append(DateTimeMsec(t0 + 700000, -6), "msec", 1)
+		assert log.lastMsec() == t0 + 700000
+		rec = list(log.query(t0 + 700000))[0]
+		assert rec.value[0].value.tz == -6 and rec.value[1].value == "msec"
+
+
+#if pytest doesnt work
+if __name__ == "__main__":
+	import tempfile, pathlib
+	with tempfile.TemporaryDirectory() as d:
+		testHistoryLog(pathlib.Path(d))
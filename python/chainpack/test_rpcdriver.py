@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from rpcdriver import *
+
+class LoopbackDriver(RpcDriver):
+	def __init__(s):
+		super().__init__()
+		s.written = bytearray()
+		s.received = []
+
+	def writeBytes(s, b):
+		s.written += b
+
+	def onMessageReceived(s, msg: RpcMessage):
+		s.received.append(msg)
+
+def testFrameParser():
+	print("------------- RpcFrameParser")
+	d = LoopbackDriver()
+	d.sendRequest("foo", RpcValue({"a": RpcValue(b"x" * 1000)}))
+	d.sendResponse(5, RpcValue([1, 2, 3]))
+	data = bytes(d.written)
+	for chunk_size in (1, 3, 100, len(data)):
+		d2 = LoopbackDriver()
+		for i in range(0, len(data), chunk_size):
+			d2.bytesRead(data[i:i + chunk_size])
+		assert len(d2.received) == 2
+		assert d2.received[0]._value.value[meta.RpcMessage.Key.Params].value["a"].value == b"x" * 1000
+		assert d2.received[1].result().toPython() == [1, 2, 3]
+
+def testReadBuffer():
+	print("------------- RpcDriver read buffer")
+	d = LoopbackDriver()
+	for i in range(50):
+		d.sendResponse(i, RpcValue(bytes([i]) * 1000))
+	d.sendResponse(50, RpcValue(b"z" * (RpcFrameParser.BUFFER_SIZE * 3)))
+	data = memoryview(bytes(d.written))
+	for chunk_size in (7, 4096, len(data)):
+		d2 = LoopbackDriver()
+		buffer = d2.m_frameParser.m_buffer
+		pos = 0
+		while pos < len(data):
+			buf = d2.getReadBuffer()
+			n = min(chunk_size, len(buf), len(data) - pos)
+			buf[:n] = data[pos:pos + n]
+			buf.release()
+			d2.readBufferUpdated(n)
+			pos += n
+			if len(d2.received) < 50:
+				#// small frames are parsed in place, buffer is reused
+				assert d2.m_frameParser.m_buffer is buffer
+		assert [m.id() for m in d2.received] == list(range(51))
+		#// decoded values do not reference the buffer
+		d2.m_frameParser.m_buffer[:] = bytes(len(d2.m_frameParser.m_buffer))
+		assert all(m.result().value == bytes([i]) * 1000 for i, m in enumerate(d2.received[:50]))
+		assert d2.received[50].result().value == b"z" * (RpcFrameParser.BUFFER_SIZE * 3)
+		#// buffer grown for large frame is not kept
+		assert len(d2.m_frameParser.m_buffer) == RpcFrameParser.BUFFER_SIZE
+
+	#// announced frame length does not allocate buffer before data arrive
+	p = RpcFrameParser(RpcDriver.PROTOCOL_VERSION)
+	w = ChainPackWriter()
+	w.writeData_UInt(1 << 31)
+	w.writeData_UInt(RpcDriver.PROTOCOL_VERSION)
+	w.write(RpcValue(b"x" * 1000))
+	assert p.feed(bytes(w.data())) == []
+	buf = p.getBuffer()
+	assert len(buf) <= RpcFrameParser.BUFFER_SIZE
+	buf.release()
+	for i in range(20):
+		p.feed(bytes(10000))
+	assert len(p.m_buffer) <= 4 * 210000
+
+	p = RpcFrameParser(RpcDriver.PROTOCOL_VERSION, max_message_size=100)
+	d = LoopbackDriver()
+	d.sendResponse(1, RpcValue(b"x" * 200))
+	try:
+		p.feed(bytes(d.written[:10]))
+		assert False
+	except ChainpackDeserializationException as e:
+		assert "exceeds limit" in str(e)
+
+def testFrameParserErrors():
+	p = RpcFrameParser(RpcDriver.PROTOCOL_VERSION)
+	try:
+		p.feed(b"\x02\x02\x40")
+		assert False
+	except Exception as e:
+		assert "protocol version" in str(e)
+	p = RpcFrameParser(RpcDriver.PROTOCOL_VERSION)
+	try:
+		p.feed(b"\x03\x01\x40\x40")
+		assert False
+	except ChainpackDeserializationException:
+		pass
+
+def testPackFrame():
+	d = LoopbackDriver()
+	msg = RpcValue({"a": RpcValue(b"x" * 1000)})
+	frame = bytes(d.packFrame(msg))
+	assert frame.endswith(bytes(ChainPackProtocol(msg)))
+	r = ChainPackReader(frame)
+	assert r.readData_UInt() == len(frame) - r.pos()
+	assert r.readData_UInt() == RpcDriver.PROTOCOL_VERSION
+	d.MAX_MESSAGE_SIZE = 100
+	try:
+		d.sendMessage(msg)
+		assert False
+	except ChainpackException as e:
+		assert "exceeds limit" in str(e)
+	assert len(d.written) == 0
+
+def testPendingCalls():
+	print("------------- RpcDriver pending calls")
+	client = LoopbackDriver()
+	finished = []
+	calls = [client.callMethod("m%d" % i, RpcValue(i), finished.append) for i in range(3)]
+	assert [c.requestId for c in calls] == [1, 2, 3]
+	assert client.pendingCallCount() == 3
+	server = LoopbackDriver()
+	server.bytesRead(bytes(client.written))
+	requests = [RpcRequest(m._value) for m in server.received]
+	assert [rq.id() for rq in requests] == [1, 2, 3]
+	assert [rq.method() for rq in requests] == ["m0", "m1", "m2"]
+	#// responses in reverse order
+	server.sendError(requests[2].id(), RpcResponse.ErrorType.InvalidParams, "bad")
+	server.sendResponse(requests[1].id(), RpcValue("one"))
+	server.sendResponse(99, RpcValue("unknown id"))
+	client.bytesRead(bytes(server.written))
+	assert finished == [calls[2], calls[1]]
+	assert calls[1].result().value == "one"
+	try:
+		calls[2].result()
+		assert False
+	except RpcError as e:
+		assert e.code == RpcResponse.ErrorType.InvalidParams and e.message == "bad"
+	assert len(client.received) == 1 and client.received[0].id() == 99
+	assert client.pendingCallCount() == 1
+	assert 0 < client.nextTimeout() <= defaultRpcTimeout / 1000
+	client.checkTimeouts(calls[0].deadline)
+	assert finished[-1] is calls[0] and calls[0].error.code == RpcResponse.ErrorType.SyncMethodCallTimeout
+	assert client.pendingCallCount() == 0 and client.nextTimeout() is None
+	call = client.callMethod("x", timeout=10)
+	client.abortPendingCalls(ConnectionError())
+	assert isinstance(call.error, ConnectionError)
+
+class ThrottledDriver(LoopbackDriver):
+	"""accepts at most budget bytes, then writeChunks() returns 0 until budget is raised"""
+	def __init__(s, budget):
+		super().__init__()
+		s.budget = budget
+		s.calls = 0
+		s.events = []
+
+	def writeChunks(s, chunks):
+		s.calls += 1
+		data = b''.join(bytes(c) for c in chunks)[:s.budget]
+		s.budget -= len(data)
+		s.written += data
+		return len(data)
+
+	def onWritePaused(s):
+		s.events.append("paused")
+
+	def onWriteResumed(s):
+		s.events.append("resumed")
+
+def testWriteQueue():
+	print("------------- RpcDriver write queue")
+	expected = LoopbackDriver()
+	for i in range(100):
+		expected.sendResponse(i, RpcValue(i))
+	d = ThrottledDriver(1 << 20)
+	with d.writeBatch():
+		for i in range(100):
+			d.sendResponse(i, RpcValue(i))
+		assert len(d.written) == 0 and d.queuedBytes() == len(expected.written)
+	#// frames queued in batch are coalesced into one write
+	assert d.calls == 1 and d.written == expected.written and d.queuedBytes() == 0
+	d2 = LoopbackDriver()
+	d2.bytesRead(bytes(d.written))
+	assert [m.id() for m in d2.received] == list(range(100))
+
+	d = ThrottledDriver(0)
+	d.WRITE_HIGH_WATERMARK = 2000
+	d.WRITE_LOW_WATERMARK = 500
+	for i in range(10):
+		d.sendResponse(i, RpcValue(b"x" * 300))
+	assert d.isWritePaused() and d.events == ["paused"]
+	#// partial writes split frames at arbitrary positions
+	while d.queuedBytes() > 1000:
+		d.budget = 7
+		d.writeQueue()
+	assert d.isWritePaused() and d.events == ["paused"]
+	d.budget = 1 << 20
+	d.writeQueue()
+	assert not d.isWritePaused() and d.events == ["paused", "resumed"]
+	d2 = LoopbackDriver()
+	d2.bytesRead(bytes(d.written))
+	assert [m.id() for m in d2.received] == list(range(10))
+	assert all(m.result().value == b"x" * 300 for m in d2.received)
+
+def testSendLanes():
+	print("------------- RpcDriver send lanes")
+	d = ThrottledDriver(0)
+	d.sendResponse(1, RpcValue(b"b" * 100000))
+	d.sendResponse(2, RpcValue(b"b" * 100000))
+	d.sendResponse(3, RpcValue(5))
+	d.sendRequest("ping", request_id=4)
+	assert [d.queuedFrames(lane) for lane in RpcDriver.Lane] == [1, 1, 2]
+	#// first bulk frame is written partially, so it has to be finished before anything else
+	d.budget = 10
+	d.writeQueue()
+	assert d.queuedFrames(RpcDriver.Lane.Control) == 0
+	d.budget = 1000
+	d.writeQueue()
+	d.sendResponse(5, RpcValue(6), lane=RpcDriver.Lane.Control)
+	d.budget = 1 << 20
+	d.writeQueue()
+	assert d.queuedBytes() == 0
+	d2 = LoopbackDriver()
+	d2.bytesRead(bytes(d.written))
+	assert [m.id() for m in d2.received] == [4, 3, 1, 5, 2]
+	count, avg, worst = d.queueLatency(RpcDriver.Lane.Bulk)
+	assert count == 2 and 0 <= avg <= worst
+	d.resetQueueLatency()
+	assert d.queueLatency(RpcDriver.Lane.Bulk) == (0, 0.0, 0.0)
+
+def testSendMessages():
+	print("------------- RpcDriver sendMessages")
+	messages = []
+	for i in range(300):
+		ntf = RpcRequest()
+		ntf.setMethod("chng")
+		ntf.setParams({"value": i, "path": "node/%d" % i})
+		messages.append(ntf._value)
+	expected = LoopbackDriver()
+	for msg in messages:
+		expected.sendMessage(msg)
+	d = ThrottledDriver(1 << 20)
+	assert d.sendMessages(messages) == 300
+	assert d.calls == 1 and d.written == expected.written
+	assert d.queueLatency(RpcDriver.Lane.Normal)[0] == 1
+	assert d.sendMessages(iter([])) == 0 and d.calls == 1
+	d.budget = 0
+	d.sendMessages(messages * 10)
+	assert d.queuedFrames(RpcDriver.Lane.Bulk) == 1
+	assert frameVersionHeader(RpcDriver.PROTOCOL_VERSION) is frameVersionHeader(RpcDriver.PROTOCOL_VERSION)
+
+#if pytest doesnt work
+if __name__ == "__main__":
+	testFrameParser()
+	testReadBuffer()
+	testFrameParserErrors()
+	testPackFrame()
+	testPendingCalls()
+	testWriteQueue()
+	testSendLanes()
+	testSendMessages()
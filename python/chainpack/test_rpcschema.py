@@ -0,0 +1,54 @@
+import collections
+import dataclasses
+import pytest
+
+from rpcschema import *
+
+
+NotifyParams = collections.namedtuple('NotifyParams', 'value ts status')
+
+@dataclasses.dataclass
+class Sample:
+	id: int
+	ok: bool
+	params: NotifyParams
+	extra: object = None
+
+
+def testSchema():
+	print("------------- Schema")
+	params = Schema([("value", Type.Double), ("ts", Type.DateTime), ("status", Type.String)], target=NotifyParams)
+	ts = DateTimeMsec(1600000000123, 4)
+	p = NotifyParams(1.5, ts, "ok")
+	packed = params.dumps(p)
+	assert packed == dumps({"value": 1.5, "ts": ts, "status": "ok"})
+	assert params.loads(packed, datetime_msec=True) == p
+	assert params.loads(packed).ts == ts.toUtcAndTz()
+	#// values not matching field types are written by generic path
+	p2 = NotifyParams(2, ts, None)
+	assert params.dumps(p2) == dumps({"value": 2, "ts": ts, "status": None})
+	assert params.loads(params.dumps(p2), datetime_msec=True) == p2
+	#// other key order is decoded by generic path
+	assert params.loads(dumps({"status": "ok", "value": 1.5, "ts": ts}), datetime_msec=True) == p
+	with pytest.raises(ChainpackTypeException):
+		params.loads(dumps({"value": 1.5}))
+
+	sample = Schema([(1, Type.UInt, "id"), (2, Type.Bool, "ok"), (3, params, "params"), (4, None, "extra")], Type.IMap, Sample)
+	s = Sample(1000, True, p, [1, "x"])
+	packed = sample.dumps(s)
+	assert packed == dumps(imap({1: uint(1000), 2: True, 3: {"value": 1.5, "ts": ts, "status": "ok"}, 4: [1, "x"]}))
+	assert sample.loads(packed, datetime_msec=True) == s
+	assert sample.dumps(Sample(-1, True, p)) == dumps(imap({1: -1, 2: True, 3: params.toPython(p), 4: None}))
+
+	plain = Schema([("a", Type.Int), ("b", Type.Blob)])
+	assert plain.dumps({"a": -100, "b": b"\x00\x01"}) == dumps({"a": -100, "b": b"\x00\x01"})
+	assert plain.loads(plain.dumps({"a": 63, "b": b""})) == {"a": 63, "b": b""}
+	assert plain.dumps({"a": 1}) == dumps({"a": 1})
+
+	registerSchema(params)
+	assert dumps([p, p]) == dumps([params.toPython(p)] * 2)
+
+
+#if pytest doesnt work
+if __name__ == "__main__":
+	testSchema()
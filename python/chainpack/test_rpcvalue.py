@@ -5,6 +5,7 @@ try:
 	import better_exceptions
 except:
 	pass
+import pytest
 import hypothesis
 from hypothesis import given
 from hypothesis.strategies import *
@@ -170,6 +171,439 @@ def testArray():
 	assert(cp1.toPython() == cp2.toPython());
 
 
+def testReadPos():
+	print("------------- read(buf, pos)")
+	out = ChainPackProtocol()
+	vals = [RpcValue("foo"), RpcValue(1 << 40, Type.UInt), RpcValue({"a": [1, 2], "b": -300}), RpcValue(b"\0blob")]
+	for v in vals:
+		out.write(v)
+	buf = bytes(out)
+	pos = 0
+	for v in vals:
+		v2, pos = read(buf, pos)
+		v.assertEquals(v2)
+	assert pos == len(buf)
+	assert bytes(out) == buf
+	r = ChainPackReader(memoryview(buf), 0)
+	r.read()
+	assert r.pos() == len(ChainPackProtocol(vals[0]))
+	try:
+		read(buf[:-1], pos - len(ChainPackProtocol(vals[-1])))
+		assert False
+	except ChainpackDeserializationException:
+		pass
+
+
+def testWriterReset():
+	print("------------- ChainPackWriter")
+	w = ChainPackWriter()
+	for v in [RpcValue({"a": RpcValue([1, RpcValue(b"xyz"), -5000]), "b": 3.5}), RpcValue("foo")]:
+		w.reset()
+		l = w.write(v)
+		assert l == len(w)
+		assert w.data() == ChainPackProtocol.pack(v)
+		v.assertEquals(read(w.data())[0])
+
+
+def testLazyRead():
+	print("------------- lazy read")
+	cp1 = RpcValue({
+		"a": RpcValue([1, 2, RpcValue({"x": "y"})]),
+		"b": RpcValue({1: "foo", 2: RpcValue([-1, 2.5])}, Type.IMap),
+		"c": b"blob"})
+	cp1.setMetaValue(meta.Tag.USER, "bar")
+	buf = bytes(ChainPackProtocol(cp1))
+	cp2, pos = read(buf, 0, lazy=True)
+	assert pos == len(buf)
+	assert isinstance(cp2, LazyRpcValue)
+	assert cp2.type == Type.Map
+	assert len(cp2) == 3
+	assert cp2["b"][1].value == "foo"
+	assert cp2._children[0] is None
+	assert cp2["b"]._children[1] is None
+	assert [i.toPython() for i in cp2["a"]] == [1, 2, {"x": "y"}]
+	assert list(cp2) == ["a", "b", "c"]
+	assert cp2.toPython() == cp1.toPython()
+	cp1.assertEquals(cp2)
+	assert bytes(ChainPackProtocol(cp2)) == buf
+
+
+def testSkipScan():
+	print("------------- skip/scan")
+	arr = RpcValueArray(Type.Double, [1.5, 2.5, 3.5])
+	vals = [RpcValue(7), RpcValue(1 << 50), RpcValue({"a": 1, "b": RpcValue([1, 2, 3])}),
+			RpcValue({1: True, 2: None, 3: "x"}, Type.IMap), arr, RpcValue(b"\xff\xff")]
+	vals[2].setMetaValue(meta.Tag.USER, "foo")
+	out = ChainPackProtocol()
+	ends = []
+	for v in vals:
+		out.write(v)
+		ends.append(len(out))
+	buf = bytes(out)
+	pos = 0
+	for v, end in zip(vals, ends):
+		info = scan(buf, pos)
+		print(info)
+		assert info.start == pos
+		assert info.end == end == skip(buf, pos)
+		assert info.type == v.type
+		pos = end
+	infos = []
+	pos = 0
+	while pos < len(buf):
+		infos.append(scan(buf, pos))
+		pos = infos[-1].end
+	assert [i.count for i in infos] == [0, 0, 2, 3, 3, 0]
+	assert infos[2].hasMetaData() and not infos[3].hasMetaData()
+	assert read(buf, infos[2].start)[0] == vals[2]
+	assert infos[4].element_type == Type.Double
+
+
+def testTypedArray():
+	print("------------- typed Array")
+	import array
+	for t, items in [
+			(Type.Double, [1.5, -2.25, 1e300, 0.0]),
+			(Type.Int, [0, 63, -63, 64, -64, 1 << 40, -(1 << 62)]),
+			(Type.UInt, [0, 127, 128, 1 << 63]),
+			(Type.Bool, [True, False, True])]:
+		typecode = RpcValueArray.TYPECODES[t][0]
+		cp1 = RpcValueArray(t, array.array(typecode, items))
+		generic = RpcValueArray(t, [RpcValue(i, t) for i in items])
+		out = ChainPackProtocol(cp1)
+		assert out == ChainPackProtocol(generic)
+		cp2, pos = read(out, 0, typed_arrays=True)
+		assert pos == len(out)
+		assert cp2.isTyped()
+		assert cp2.toPython() == items
+		cp1.assertEquals(cp2)
+		generic.assertEquals(read(out)[0])
+		assert not read(out)[0].isTyped()
+	#// items not fitting 64 bits fall back to generic Array
+	for t, items in [(Type.UInt, [1, (1 << 64) + 5, 2]), (Type.Int, [1, -(1 << 70), 2])]:
+		generic = RpcValueArray(t, [RpcValue(i, t) for i in items])
+		out = ChainPackProtocol(generic)
+		cp2, pos = read(out, 0, typed_arrays=True)
+		assert pos == len(out) and not cp2.isTyped()
+		generic.assertEquals(cp2)
+	try:
+		RpcValueArray(Type.Double, array.array('q', [1]))
+		assert False
+	except ChainpackTypeException:
+		pass
+
+def testNumpyArray():
+	numpy = pytest.importorskip("numpy")
+	print("------------- numpy Array")
+	a = numpy.linspace(0, 1, 1000)
+	cp1 = RpcValueArray(Type.Double, a)
+	cp2 = read(ChainPackProtocol(cp1), typed_arrays=True)[0]
+	n = cp2.toNumpy()
+	assert numpy.shares_memory(n, numpy.frombuffer(cp2.value, dtype='float64'))
+	assert (n == a).all()
+
+
+def testDumpsLoads():
+	print("------------- dumps/loads")
+	import array
+	obj = {
+		"int": [0, 63, 64, -1, -(1 << 40), 1 << 70],
+		"uint": [uint(0), uint(63), uint(64), uint(1 << 40)],
+		"imap": imap({1: "foo", 200: None, 3: imap()}),
+		"float": 3.25,
+		"bool": [True, False],
+		"blob": b"\0\1",
+		"dt": UtcAndTz(datetime(2017, 5, 3, 15, 52, 3, 923000, timezone.utc), -4),
+		"nested": {"a": [{"b": [[]]}]},
+	}
+	buf = dumps(obj)
+	assert buf == ChainPackProtocol(RpcValue(obj))
+	obj2 = loads(buf)
+	assert obj2 == obj
+	assert type(obj2["imap"]) is imap
+	assert type(obj2["uint"][2]) is uint
+	assert dumps(obj2) == buf
+	assert loads(dumps(array.array('d', [1.5, 2.5]))) == [1.5, 2.5]
+	assert loads(dumps(array.array('B', [1, 200]))) == [1, 200]
+	#// Array items are not limited to 64 bits
+	for t, items in [(Type.Int, [1, -(1 << 70), 1 << 63]), (Type.UInt, [1, (1 << 64) + 5])]:
+		assert loads(ChainPackProtocol(RpcValueArray(t, [RpcValue(i, t) for i in items]))) == items
+	try:
+		dumps({1: 2})
+		assert False
+	except ChainpackTypeException:
+		pass
+
+
+def testCompactValues():
+	print("------------- compact RpcValue")
+	cp1 = RpcValue([1, 1, None, True, RpcValue(5, Type.UInt), 1000])
+	cp1.value[0].setMetaValue(meta.Tag.USER, "foo")
+	cp2 = read(ChainPackProtocol(cp1))[0]
+	cp1.assertEquals(cp2)
+	assert cp2.value[1] is TINY_INT_VALUES[1]
+	assert cp2.value[2] is NULL_VALUE and cp2.value[3] is TRUE_VALUE
+	assert cp2.value[4] is TINY_UINT_VALUES[5]
+	assert cp2.value[0] is not TINY_INT_VALUES[1]
+	assert cp2.value[0]._metaData[meta.Tag.USER].value == "foo"
+	assert not hasattr(cp2, '__dict__') and not hasattr(cp2.value[5], '__dict__')
+	assert cp2._metaData is EMPTY_META_DATA and len(EMPTY_META_DATA) == 0
+	for modify in (lambda md: md.update({1: RpcValue(2)}), lambda md: md.setdefault(1, RpcValue(2)),
+			lambda md: md.__setitem__(1, RpcValue(2)), lambda md: md.__ior__({1: RpcValue(2)}), lambda md: md.pop(1, None),
+			lambda md: md.__delitem__(1), lambda md: md.popitem(), lambda md: md.clear()):
+		with pytest.raises(ChainpackException):
+			modify(EMPTY_META_DATA)
+	assert len(EMPTY_META_DATA) == 0 and not RpcValue(5)._metaData
+	try:
+		cp2.value[1].setMetaValue(meta.Tag.USER, 1)
+		assert False
+	except ChainpackException:
+		pass
+	v = RpcValue(cp2.value[1])
+	v.setMetaValue(meta.Tag.USER, 1)
+	assert len(TINY_INT_VALUES[1]._metaData) == 0
+	assert RpcValue.trusted("x", Type.String) == RpcValue("x")
+
+
+def testPushParser():
+	print("------------- ChainPackPushParser")
+	vals = [RpcValue({"a": RpcValue([1, RpcValue(b"x" * 300), -5000]), "b": 3.5}),
+			RpcValue({1: RpcValueArray(Type.Int, [1, 2, 300]), 2: RpcValueArray(Type.Double, [1.5])}, Type.IMap),
+			RpcValue(7), RpcValue(None), RpcValue([RpcValue([]), RpcValue({})])]
+	vals[0].setMetaValue(meta.Tag.USER, RpcValue([1, 2]))
+	vals[0].value["a"].setMetaValue(meta.Tag.USER, "foo")
+	vals[2].setMetaValue(meta.Tag.USER, 1)
+	out = ChainPackProtocol()
+	for v in vals:
+		out.write(v)
+	for chunk_size in (1, 2, 7, len(out)):
+		p = ChainPackPushParser()
+		got = []
+		for i in range(0, len(out), chunk_size):
+			got += p.feed(out[i:i + chunk_size])
+		assert p.isIdle()
+		assert got == vals
+	p = ChainPackPushParser()
+	assert p.feed(out[:-1]) == vals[:-1]
+	assert not p.isIdle()
+	assert p.feed(out[-1:]) == vals[-1:]
+
+
+def testStreamWriter():
+	print("------------- ChainPackStreamWriter")
+	import io
+	items = [RpcValue({"i": i, "s": "x" * (i % 7)}) for i in range(1000)]
+	cp1 = RpcValue(items)
+	cp1.setMetaValue(meta.Tag.USER, "foo")
+	expected = bytes(ChainPackProtocol(cp1))
+	f = io.BytesIO()
+	chunks = []
+	w = ChainPackStreamWriter(lambda b: (chunks.append(len(b)), f.write(b)), chunk_size=1000)
+	w.writeContainer(Type.List, iter(items), cp1._metaData)
+	assert f.getvalue() == expected
+	assert len(chunks) > 10 and max(chunks) < 1100
+	assert b"".join(iterencode(Type.List, (i for i in items), cp1._metaData, chunk_size=100)) == expected
+	imap = RpcValue({i: RpcValue([i, "x"]) for i in range(100)}, Type.IMap)
+	assert b"".join(iterencode(Type.IMap, imap.value.items())) == ChainPackProtocol(imap)
+	f = io.BytesIO()
+	w = ChainPackStreamWriter(f)
+	w.writeContainerBegin(Type.Map)
+	w.writeMapElement("arr", RpcValueArray(Type.Int, [1, 2]))
+	w.writeMapElement("native", {"a": [1, None]})
+	w.writeContainerEnd()
+	w.flush()
+	assert read(f.getvalue())[0] == RpcValue({"arr": RpcValueArray(Type.Int, [1, 2]), "native": {"a": [1, None]}})
+
+
+def testDateTimeMsec():
+	print("------------- DateTimeMsec")
+	utc = timezone.utc
+	for msec, tz in ((1517529600000, 0), (1517529600001, -8), (253402300799999, 63), (-1, -64), (0, 4)):
+		v = DateTimeMsec(msec, tz)
+		packed = dumps(v)
+		assert packed == dumps(v.toUtcAndTz())
+		assert loads(packed, datetime_msec=True) == v
+		assert loads(packed) == v.toUtcAndTz()
+		assert read(packed, datetime_msec=True)[0] == RpcValue(v)
+		assert read(packed)[0].value == v
+	dt = datetime(2021, 3, 4, 5, 6, 7, 891000, tzinfo=utc)
+	assert DateTimeMsec.fromDateTime(dt).toDateTime() == dt
+	assert datetimeToEpochMsec(datetime(2286, 11, 20, 17, 46, 39, 999000, tzinfo=utc)) == 9999999999999
+	msecs = [1517529600000 + i * 1001 for i in range(10)]
+	arr = RpcValueArray(Type.DateTime, [DateTimeMsec(m) for m in msecs])
+	decoded = read(ChainPackProtocol(arr), datetime_msec=True)[0]
+	assert decoded.toEpochMsecs() == msecs
+	assert read(ChainPackProtocol(arr))[0].toEpochMsecs() == msecs
+	assert epochMsecsToDateTimes(msecs) == [epochMsecToDateTime(m) for m in msecs]
+	if numpy is not None:
+		assert decoded.toNumpy().astype('int64').tolist() == msecs
+
+
+def testKeyInterner():
+	print("------------- KeyInterner")
+	data = dumps([{"temperature": 1}, {"temperature": 2}])
+	for buf in (data, bytearray(data)):
+		a, b = loads(buf)
+		ka, kb = list(a)[0], list(b)[0]
+		assert ka == kb == "temperature" and ka is kb
+		a, b = read(buf)[0].value
+		assert list(a.value)[0] is ka
+	r = ChainPackReader(data, key_interner=None)
+	a, b = r.readPython()
+	assert list(a)[0] is not list(b)[0]
+	interner = KeyInterner(max_size=2, max_key_len=4)
+	r = ChainPackReader(dumps({"a": 1, "long_key": 2, "b": 3, "c": 4}), key_interner=interner)
+	assert r.readPython() == {"a": 1, "long_key": 2, "b": 3, "c": 4}
+	assert len(interner) == 2
+	interner.clear()
+	assert len(interner) == 0
+
+
+def testDispatchTables():
+	print("------------- dispatch tables")
+	for t, ti in TYPE_TO_TYPE_INFO.items():
+		assert typeToTypeInfo(t) is ti
+		assert typeInfoToType(ti) is t
+	for t in (Type.INVALID, Type.Array):
+		with pytest.raises(Exception):
+			typeToTypeInfo(t)
+	with pytest.raises(Exception):
+		typeInfoToType(TypeInfo.TERMINATION)
+	for n in list(range(-300, 300)) + [(1 << b) + d for b in range(6, 70) for d in (-1, 0, 1)]:
+		for t in (Type.Int, Type.UInt):
+			if t == Type.UInt and n < 0:
+				continue
+			v = RpcValue(n, t)
+			packed = ChainPackProtocol(v)
+			tiny = optimizeRpcValueIntoType(v)
+			assert tiny is None or bytes(packed) == bytes([tiny])
+			assert read(packed)[0] == v
+			assert skip(packed) == len(packed)
+			w = ChainPackWriter()
+			if t == Type.Int:
+				w.writeData_Int(n)
+				assert ChainPackReader(w.data()).readData_Int() == n
+			else:
+				w.writeData_UInt(n)
+				assert ChainPackReader(w.data()).readData_UInt() == n
+				assert len(w.data()) == uintHeadInfo(w.data()[0])[0] + 1
+
+def testPackedSize():
+	print("------------- packed size")
+	md = MetaData()
+	md[1] = RpcValue(2, Type.UInt)
+	md[meta.Tag.MetaTypeId] = 1000
+	values = [
+		RpcValue(None), RpcValue(True), RpcValue(1.5), RpcValue("ěščř" * 100), RpcValue(b"x" * 200),
+		RpcValue(-(1 << 100)), RpcValue(1 << 140, Type.UInt), RpcValue(1 << 600),
+		RpcValue(UtcAndTz(datetime(2018, 2, 2, tzinfo=timezone.utc), 8)), RpcValue(datetime(2041, 3, 4, 5, 6, 7, 8000, tzinfo=timezone.utc)),
+		RpcValue([1, "a", {"b": [None, RpcValue({3: 4.5}, Type.IMap)]}]),
+		RpcValueArray(Type.Int, [RpcValue(n) for n in (-1000, -1, 0, 1000)]),
+		RpcValueArray(Type.Double, array.array('d', [1.0, 2.0])),
+		RpcValueArray(Type.String, [RpcValue("a"), RpcValue("bc")]),
+	]
+	v = RpcValue({"a": 1})
+	v._metaData = md
+	values.append(v)
+	for v in values:
+		assert packed_size(v) == len(ChainPackProtocol(v)), v
+	natives = [None, 0, 63, 64, -1, 1 << 70, uint(1000), "abc", "ěšč", 1.5, b"xy", (1, [2]), {"a": imap({1: 2})},
+		DateTimeMsec(1234567890123, -4), array.array('I', [1, 1000]), RpcValue([1])]
+	if numpy is not None:
+		natives.append(numpy.arange(-100, 100))
+	for v in natives:
+		assert packed_size(v) == len(dumps(v)), v
+	with pytest.raises(ChainpackTypeException):
+		packed_size(object())
+
+def testFrozenRpcValue():
+	print("------------- frozen value")
+	v = RpcValue({"a": [1, "b", RpcValue(b"c")], "d": RpcValue({1: 2.5}, Type.IMap), "e": RpcValueArray(Type.Int, [RpcValue(3)])})
+	v.setMetaValue(meta.Tag.MetaTypeId, 1)
+	f = FrozenRpcValue(v)
+	assert f == v and v == f
+	assert hash(f) == hash(FrozenRpcValue(v))
+	assert len({f, FrozenRpcValue(v), FrozenRpcValue(RpcValue([1]))}) == 2
+	packed = bytes(ChainPackProtocol(v))
+	assert f.packed() == packed
+	assert f.packed() is f.packed()
+	#// only the packed value keeps its data, not every nested subtree
+	assert f.value["a"]._packed is None and f.value["a"].value[0]._packed is None
+	msg = RpcValue([f, RpcValue({"x": f})])
+	assert msg.value[0] is f
+	assert bytes(ChainPackProtocol(msg)) == bytes(ChainPackProtocol(RpcValue([v, RpcValue({"x": v})])))
+	assert packed_size(msg) == len(ChainPackProtocol(msg))
+	assert read(ChainPackProtocol(msg))[0].value[0] == f
+	with pytest.raises(ChainpackException):
+		f.value["a"].value.append(RpcValue(1))
+	with pytest.raises(ChainpackException):
+		f.value["z"] = RpcValue(1)
+	with pytest.raises(ChainpackException):
+		f.setMetaValue(1, 2)
+	with pytest.raises(ChainpackException):
+		f._metaData.update({10: RpcValue(2)})
+	#// frozen copy does not share mutable data with the original
+	v.value["a"].value.append(RpcValue(2))
+	v.value["e"].value.append(RpcValue(4))
+	assert f.packed() == packed and f != v
+	c = RpcValue(f)
+	c.value["z"] = RpcValue(1)
+	c.setMetaValue(10, 2)
+	assert "z" not in f.value and 10 not in f._metaData
+
+def testPackedValueCache():
+	print("------------- packed value cache")
+	values = [RpcValue({"n": i, "s": "x" * 100}) for i in range(4)]
+	cache = PackedValueCache(max_size=3)
+	f = cache.get(values[0])
+	assert cache.get(values[0]) is f
+	assert f.packed() == bytes(ChainPackProtocol(values[0]))
+	for v in values[1:]:
+		cache.get(v)
+	assert len(cache) == 3 and values[0] not in cache
+	cache.get(values[1])
+	cache.get(values[0])
+	assert values[1] in cache and values[2] not in cache
+	values[1].value["n"] = RpcValue(10)
+	assert cache.put(values[1]).value["n"].value == 10
+	cache = PackedValueCache(max_bytes=250)
+	for v in values:
+		cache.get(v)
+	assert len(cache) == 2
+
+def testDecimal():
+	print("------------- Decimal")
+	import decimal
+	for s in ("0", "-123.4500", "1E+5", "0.000001", "12345678901234567890123456789.123456789"):
+		d = decimal.Decimal(s)
+		v = RpcValue(d)
+		assert v.type == Type.Decimal
+		assert v.value == DecimalValue.fromDecimal(d)
+		packed = ChainPackProtocol(v)
+		assert packed[0] == TypeInfo.Decimal
+		r = read(packed)[0]
+		assert r == v
+		assert r.value.toDecimal() == d and str(r.value.toDecimal()) == str(d)
+		assert loads(dumps(d)) == r.value
+		assert skip(packed) == len(packed) and packed_size(v) == len(packed)
+	#// C++ RpcValue::Decimal(mantisa, precision)
+	assert bytes(ChainPackProtocol(RpcValue(DecimalValue(123, -2)))) == bytes([TypeInfo.Decimal, 0x80, 123, 2])
+	assert float(DecimalValue(-5, -1)) == -0.5 and float(DecimalValue(5, 2)) == 500.0
+	a = RpcValueArray(Type.Decimal, [RpcValue(DecimalValue(n, -3)) for n in (-1000, 0, 7, 1 << 40)])
+	packed = ChainPackProtocol(a)
+	assert packed[0] == TypeInfo.Decimal_Array
+	r = read(packed)[0]
+	assert r == a
+	assert r.toMantissasAndExponents() == ([-1000, 0, 7, 1 << 40], [-3] * 4)
+	assert loads(packed) == [DecimalValue(n, -3) for n in (-1000, 0, 7, 1 << 40)]
+	assert skip(packed) == len(packed) and packed_size(a) == len(packed)
+	if numpy is not None:
+		assert list(r.toNumpy()) == [-1.0, 0.0, 0.007, float(1 << 40) / 1000]
+	assert ChainPackPushParser().feed(bytes(packed)) == [a]
+	with pytest.raises(ChainpackTypeException):
+		RpcValue(decimal.Decimal("NaN"))
+
+
 def round_trip(x):
 	print("encoding:",x)
 	encoded = ChainPackProtocol(x)
@@ -196,6 +630,12 @@ with hypothesis.settings(verbosity=hypothesis.Verbosity.verbose):
 		s = RpcValue(s)
 		assert round_trip(s) == s
 
+	@given(test_data)
+	def test_packed_size(s):
+		assert packed_size(s) == len(dumps(s))
+		s = RpcValue(s)
+		assert packed_size(s) == len(ChainPackProtocol(s))
+
 	@given(dictionaries(integers(min_value=1), test_data), test_data)
 	def test_decode_inverts_encode2(md, s):
 		print("------------- Hypothesis with meta")
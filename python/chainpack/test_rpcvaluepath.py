@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from rpcvaluepath import *
+from rpcmessage import *
+
+def packedNotify():
+	rq = RpcRequest()
+	rq.setMetaValue(meta.RpcMessage.Tag.ShvPath, "aus/mel/pres/A")
+	rq.setMethod("chng")
+	rq.setParams({"other": RpcValue([1, 2, 3]),
+				  "device": {"id": 5, "status": "ok"}})
+	return bytes(ChainPackProtocol(rq._value))
+
+def testQuery():
+	print("------------- RpcValuePath")
+	buf = packedNotify()
+	assert query(buf, (MetaTag(meta.RpcMessage.Tag.ShvPath),)).value == "aus/mel/pres/A"
+	assert query(buf, (MetaTag(meta.RpcMessage.Tag.Method),)).value == "chng"
+	assert query(buf, (MetaTag(meta.RpcMessage.Tag.RequestId),)) is None
+	path = RpcValuePath(meta.RpcMessage.Key.Params, "device", "status")
+	assert path.get(buf).value == "ok"
+	assert query(buf, (meta.RpcMessage.Key.Params, "other", 2)).value == 3
+	assert query(buf, (meta.RpcMessage.Key.Params, "other", 3)) is None
+	assert query(buf, (meta.RpcMessage.Key.Params, "device", "foo")) is None
+	assert query(buf, (meta.RpcMessage.Key.Result,)) is None
+	start, end = path.find(buf)
+	assert read(buf[start:end])[0].value == "ok"
+	framed = b"\x01\x02" + buf
+	assert path.get(framed, 2).value == "ok"
+
+#if pytest doesnt work
+if __name__ == "__main__":
+	testQuery()